@@ -0,0 +1,128 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+class Cache_segmentation:
+    """
+    Cache en mémoire des résultats de segmentation, indexé par (empreinte du contenu de
+    l'image, méthode, paramètres). Une tuile identique octet pour octet à une tuile déjà
+    segmentée (la pleine mer, ...) n'est pas segmentée à nouveau. La taille totale des
+    résultats est bornée par taille_max (en octets) : au-delà, les moins récemment
+    utilisés sont évincés. Si fichier est donné (.npz), le cache y est relu à la
+    création et sauvegardé par sauvegarder(), du moins au plus récemment utilisé.
+    Les résultats rendus sont en lecture seule, car partagés entre les appels.
+    """
+    def __init__(self, taille_max: int = 256 * 1024 ** 2, fichier: str = None):
+        self.taille_max = taille_max
+        self.fichier = fichier
+        self.hits = 0
+        self.miss = 0
+        self.nb_evictions = 0
+        self._resultats = OrderedDict()  # clé -> résultat, du moins au plus récemment utilisé
+        self._taille = 0
+        self._verrou = threading.Lock()
+        if fichier is not None and os.path.exists(fichier):
+            self._charger()
+
+    @staticmethod
+    def empreinte(img_array: np.ndarray) -> str:
+        """Empreinte (BLAKE2b, 128 bits) des pixels, de la forme et du type de l'image."""
+        img_array = np.ascontiguousarray(img_array)
+        h = hashlib.blake2b(digest_size=16)
+        h.update(f"{img_array.shape}{img_array.dtype.str}".encode())
+        h.update(img_array.data)
+        return h.hexdigest()
+
+    @classmethod
+    def cle(cls, img_array: np.ndarray, methode: str, /, **parametres) -> str:
+        """Clé du résultat de `methode` avec ces paramètres sur cette image."""
+        return f"{cls.empreinte(img_array)}|{methode}|{sorted(parametres.items())!r}"
+
+    def lire(self, cle: str):
+        """Renvoie le résultat rangé sous cette clé, ou None s'il n'est pas en cache."""
+        with self._verrou:
+            resultat = self._resultats.get(cle)
+            if resultat is None:
+                self.miss += 1
+                return None
+            self.hits += 1
+            self._resultats.move_to_end(cle)
+            return resultat
+
+    def ecrire(self, cle: str, resultat: np.ndarray) -> np.ndarray:
+        """
+        Range une copie en lecture seule du résultat (tableau numpy), que l'appelant peut donc
+        continuer à modifier, et applique le budget de taille ; renvoie cette copie.
+        """
+        resultat = np.array(resultat)
+        resultat.setflags(write=False)
+        with self._verrou:
+            ancien = self._resultats.pop(cle, None)
+            if ancien is not None:
+                self._taille -= ancien.nbytes
+            self._resultats[cle] = resultat
+            self._taille += resultat.nbytes
+            self._evincer()
+        return resultat
+
+    def segmenter(self, img_array: np.ndarray, methode: str, calculer, /, **parametres) -> np.ndarray:
+        """
+        Résultat de calculer(img_array), repris du cache si la même image a déjà été
+        segmentée par cette méthode avec ces paramètres. calculer doit renvoyer un
+        tableau numpy et ne dépendre que de l'image et des paramètres donnés.
+        """
+        cle = self.cle(img_array, methode, **parametres)
+        resultat = self.lire(cle)
+        if resultat is None:
+            resultat = self.ecrire(cle, calculer(img_array))
+        return resultat
+
+    def _evincer(self):
+        """Évince les résultats les moins récemment utilisés jusqu'à respecter taille_max."""
+        while self._taille > self.taille_max and len(self._resultats) > 1:
+            _, resultat = self._resultats.popitem(last=False)
+            self._taille -= resultat.nbytes
+            self.nb_evictions += 1
+
+    def _charger(self):
+        with np.load(self.fichier, allow_pickle=False) as donnees:
+            for i, cle in enumerate(donnees["cles"].tolist()):
+                self.ecrire(cle, donnees[f"resultat_{i}"])
+
+    def sauvegarder(self, fichier: str = None):
+        """Écrit le cache dans fichier (par défaut self.fichier), de façon atomique (os.replace)."""
+        fichier = fichier or self.fichier
+        with self._verrou:
+            cles = list(self._resultats)
+            resultats = {f"resultat_{i}": r for i, r in enumerate(self._resultats.values())}
+        dossier = os.path.dirname(os.path.abspath(fichier))
+        fd, tmp = tempfile.mkstemp(dir=dossier, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, cles=np.array(cles, dtype=str), **resultats)
+            os.replace(tmp, fichier)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def taille(self):
+        """Taille totale (octets) des résultats gardés."""
+        return self._taille
+
+    def statistiques(self):
+        """Compteurs d'utilisation du cache."""
+        total = self.hits + self.miss
+        return {
+            "hits": self.hits,
+            "miss": self.miss,
+            "taux_hits": self.hits / total if total else 0.0,
+            "evictions": self.nb_evictions,
+            "entrees": len(self._resultats),
+            "taille": self._taille,
+        }
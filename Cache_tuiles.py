@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+class Cache_tuiles:
+    """
+    Cache disque persistant des tuiles téléchargées, partagé entre les missions.
+    Les tuiles sont rangées sous dossier/source/zoom/x/y.png. La taille totale est
+    bornée par taille_max (en octets) : au-delà, les tuiles les moins récemment
+    utilisées sont supprimées. Les écritures passent par un fichier temporaire
+    renommé (os.replace), donc plusieurs processus peuvent partager le dossier.
+    Le budget est tenu par processus : chacun ne compte que les tuiles présentes à
+    sa création et celles qu'il lit ou écrit ensuite, donc plusieurs processus qui
+    remplissent le même dossier en même temps peuvent ensemble dépasser taille_max.
+    """
+    def __init__(self, dossier: str = "cache_tuiles", taille_max: int = 512 * 1024 ** 2):
+        self.dossier = dossier
+        self.taille_max = taille_max
+        self.hits = 0
+        self.miss = 0
+        self.octets_economises = 0   # octets servis depuis le disque au lieu du réseau
+        self.octets_telecharges = 0  # octets ajoutés au cache après un miss
+        self.nb_evictions = 0
+        self._index = OrderedDict()  # chemin -> taille, du moins au plus récemment utilisé
+        self._taille = 0
+        self._verrou = threading.Lock()
+        self._charger_index()
+
+    def chemin(self, source, zoom, x, y):
+        """Chemin du fichier de la tuile (source, zoom, x, y)."""
+        return os.path.join(self.dossier, source, str(zoom), str(x), f"{y}.png")
+
+    def _charger_index(self):
+        """Relit le contenu du dossier, trié par date de dernière utilisation."""
+        fichiers = []
+        for racine, _, noms in os.walk(self.dossier):
+            for nom in noms:
+                if not nom.endswith(".png"):
+                    continue
+                chemin = os.path.join(racine, nom)
+                try:
+                    st = os.stat(chemin)
+                except FileNotFoundError:
+                    continue
+                fichiers.append((st.st_mtime, chemin, st.st_size))
+        for _, chemin, taille in sorted(fichiers):
+            self._index[chemin] = taille
+            self._taille += taille
+
+    def lire(self, source, zoom, x, y):
+        """Renvoie le contenu PNG de la tuile, ou None si elle n'est pas en cache."""
+        chemin = self.chemin(source, zoom, x, y)
+        try:
+            with open(chemin, "rb") as f:
+                donnees = f.read()
+            os.utime(chemin)  # date de dernière utilisation, visible des autres processus
+        except FileNotFoundError:
+            with self._verrou:
+                self.miss += 1
+                taille = self._index.pop(chemin, None)
+                if taille is not None:
+                    self._taille -= taille
+            return None
+        with self._verrou:
+            self.hits += 1
+            self.octets_economises += len(donnees)
+            if chemin not in self._index:  # écrite par un autre processus
+                self._taille += len(donnees)
+            self._index[chemin] = len(donnees)
+            self._index.move_to_end(chemin)
+        return donnees
+
+    def ecrire(self, source, zoom, x, y, donnees: bytes):
+        """Ajoute la tuile au cache de façon atomique, puis applique le budget de taille."""
+        chemin = self.chemin(source, zoom, x, y)
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(donnees)
+            os.replace(tmp, chemin)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._verrou:
+            self.octets_telecharges += len(donnees)
+            self._taille += len(donnees) - self._index.pop(chemin, 0)
+            self._index[chemin] = len(donnees)
+            self._evincer()
+
+    def _evincer(self):
+        """Supprime les tuiles les moins récemment utilisées jusqu'à respecter taille_max."""
+        while self._taille > self.taille_max and len(self._index) > 1:
+            chemin, taille = self._index.popitem(last=False)
+            self._taille -= taille
+            self.nb_evictions += 1
+            try:
+                os.remove(chemin)
+            except FileNotFoundError:  # déjà supprimée par un autre processus
+                pass
+
+    def taille(self):
+        """Taille totale (octets) des tuiles connues du cache."""
+        return self._taille
+
+    def statistiques(self):
+        """Compteurs d'utilisation du cache."""
+        total = self.hits + self.miss
+        return {
+            "hits": self.hits,
+            "miss": self.miss,
+            "taux_hits": self.hits / total if total else 0.0,
+            "octets_economises": self.octets_economises,
+            "octets_telecharges": self.octets_telecharges,
+            "evictions": self.nb_evictions,
+            "taille": self._taille,
+        }
@@ -0,0 +1,260 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from Traitement_image import (BIT_TRAIT_DE_COTE, COULEURS_ZONES, TABLES_MASQUES, Arbre_quadtree,
+                              Moyenne_couleur, Traitement_image, codes_rgb)
+
+
+class Tableau_partage:
+    """
+    Tableau numpy rangé dans un segment multiprocessing.shared_memory. Le processus qui
+    le crée (nom=None) le libère à la fermeture ; les processus du pool s'y attachent
+    par son descripteur (nom, forme, dtype) et lisent ou écrivent directement dedans.
+    """
+    def __init__(self, forme, dtype, nom: str = None):
+        self.forme = tuple(forme)
+        self.dtype = np.dtype(dtype)
+        self.proprietaire = nom is None
+        taille = max(math.prod(self.forme) * self.dtype.itemsize, 1)
+        self.segment = shared_memory.SharedMemory(name=nom, create=self.proprietaire, size=taille)
+        self.tableau = np.ndarray(self.forme, dtype=self.dtype, buffer=self.segment.buf)
+
+    @classmethod
+    def copie(cls, array: np.ndarray) -> "Tableau_partage":
+        """Nouveau segment contenant une copie de array."""
+        partage = cls(array.shape, array.dtype)
+        partage.tableau[...] = array
+        return partage
+
+    @classmethod
+    def ouvrir(cls, descripteur) -> "Tableau_partage":
+        nom, forme, dtype = descripteur
+        return cls(forme, dtype, nom=nom)
+
+    def descripteur(self):
+        return self.segment.name, self.forme, self.dtype.str
+
+    def fermer(self):
+        """Détache le segment (et le détruit si on l'a créé) ; plus aucune vue ne doit exister."""
+        self.tableau = None
+        self.segment.close()
+        if self.proprietaire:
+            self.segment.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+@contextmanager
+def _partage(tableau):
+    """Le Tableau_partage donné tel quel, ou une copie du np.ndarray dans un segment libéré à la sortie."""
+    if isinstance(tableau, Tableau_partage):
+        yield tableau
+    else:
+        with Tableau_partage.copie(tableau) as partage:
+            yield partage
+
+
+@contextmanager
+def _sortie(sortie, forme, dtype):
+    """Le Tableau_partage de sortie donné (vérifié), ou un nouveau segment libéré à la sortie."""
+    if sortie is None:
+        with Tableau_partage(forme, dtype) as partage:
+            yield partage
+    else:
+        if sortie.forme != tuple(forme) or sortie.dtype != np.dtype(dtype):
+            raise ValueError(f"sortie de forme {sortie.forme} ({sortie.dtype}) au lieu de {tuple(forme)} ({np.dtype(dtype)})")
+        yield sortie
+
+
+def _executer(fonction, descripteurs, *args):
+    """Exécuté dans un processus du pool : s'attache aux tableaux partagés et appelle fonction."""
+    partages = [Tableau_partage.ouvrir(d) for d in descripteurs]
+    try:
+        return fonction(*(p.tableau for p in partages), *args)
+    finally:
+        for p in partages:
+            p.fermer()
+
+
+def _moyenne_couleur(seuil_variance):
+    """Moyenne_couleur sans image, juste pour construire des arbres avec ce seuil."""
+    helper = Moyenne_couleur.__new__(Moyenne_couleur)
+    helper.seuil_variance = seuil_variance
+    return helper
+
+
+def _classer_bande(img, table, sortie, y0, y1, bits, couleurs):
+    """Lignes y0:y1 : chaque pixel lu dans la table (indexée par ses bits de poids fort)."""
+    bande = img[y0:y1]
+    if bits == 8:
+        indices = codes_rgb(bande)
+    else:
+        d = 8 - bits
+        indices = (((bande[..., 0] >> d).astype(np.uint32) << 2 * bits)
+                   | ((bande[..., 1] >> d).astype(np.uint32) << bits) | (bande[..., 2] >> d))
+    classes = table[indices]
+    sortie[y0:y1] = classes if couleurs is None else couleurs[classes]
+
+
+def _contour_bande(classes, y0, y1):
+    """Bit du trait de côte des lignes y0:y1, lues avec une ligne de marge de chaque côté."""
+    ey0, ey1 = max(y0 - 1, 0), min(y1 + 1, len(classes))
+    trait = Traitement_image.contour(TABLES_MASQUES["mer"][classes[ey0:ey1]])[y0 - ey0:y1 - ey0]
+    bande = classes[y0:y1]
+    classes[y0:y1] = np.where(trait, bande | BIT_TRAIT_DE_COTE, bande & ~np.uint8(BIT_TRAIT_DE_COTE))
+
+
+def _sous_arbre(img, sortie, y0, x0, h, l, seuil_variance):
+    """
+    Arbre de la région, peint directement dans l'image de sortie. Renvoie ses niveaux et
+    les sommes des valeurs et des carrés de la région, pour les niveaux du dessus.
+    """
+    tile = img[y0:y0 + h, x0:x0 + l]
+    arbre = _moyenne_couleur(seuil_variance).construire_arbre(tile)
+    sortie[y0:y0 + h, x0:x0 + l] = COULEURS_ZONES[arbre.peindre()]
+    valeurs = tile.reshape(-1, 3).astype(np.int64)
+    sommes = np.concatenate([valeurs.sum(axis=0), np.einsum("ij,ij->j", valeurs, valeurs)])
+    return arbre.niveaux, sommes
+
+
+class Calcul_parallele:
+    """
+    Segmentation sur plusieurs processus (`processus`, par défaut tous les cœurs) : chaque
+    processus du pool traite une bande de lignes ou une région du quadtree en lisant l'image
+    en place dans la mémoire partagée et écrit son résultat dans un tableau de sortie lui
+    aussi partagé. Les entrées et sorties peuvent être données en Tableau_partage : les
+    processus travaillent alors directement dedans, sans aucune copie. Un np.ndarray, lui,
+    est copié dans la mémoire partagée à l'entrée et le résultat est recopié hors de
+    celle-ci à la sortie : deux copies de la taille de l'image en plus du calcul. C'est
+    le cas de Traitement_image, Kmean et Moyenne_couleur, à qui on passe un Calcul_parallele
+    en paramètre `parallele`. Le pool est créé au premier calcul et gardé jusqu'à fermer().
+    """
+    def __init__(self, processus: int = None):
+        self.processus = processus or os.cpu_count() or 1
+        self._executeur = None
+
+    def executeur(self) -> ProcessPoolExecutor:
+        if self._executeur is None:
+            if os.name == "posix":
+                # les processus du pool partagent alors le resource_tracker du processus
+                # principal : un segment n'y est inscrit qu'une fois et détruit par son créateur
+                resource_tracker.ensure_running()
+            self._executeur = ProcessPoolExecutor(max_workers=self.processus)
+        return self._executeur
+
+    def fermer(self):
+        if self._executeur is not None:
+            self._executeur.shutdown()
+            self._executeur = None
+
+    def bandes(self, hauteur: int):
+        """Bornes (y0, y1) des bandes de lignes, deux par processus pour équilibrer la charge."""
+        bornes = np.linspace(0, hauteur, min(hauteur, 2 * self.processus) + 1).astype(int).tolist()
+        return list(zip(bornes[:-1], bornes[1:]))
+
+    def _lancer(self, fonction, descripteurs, taches):
+        """Lance fonction sur chaque tâche (tuple d'arguments) et renvoie les résultats dans l'ordre."""
+        futures = [self.executeur().submit(_executer, fonction, descripteurs, *tache) for tache in taches]
+        return [future.result() for future in futures]
+
+    def classer(self, img_array, table, bits: int = 8, couleurs: np.ndarray = None,
+                sortie: Tableau_partage = None):
+        """
+        Classe chaque pixel de img_array (hauteur, largeur, 3) par une table de correspondance
+        à plat de 2**(3*bits) entrées, indexée comme codes_rgb sur les `bits` bits de poids
+        fort de chaque canal (table_classes, table_palette(...).reshape(-1), ...). Renvoie
+        les valeurs de la table, ou couleurs[valeurs] si couleurs est donné.
+        img_array, table : np.ndarray (copiés dans la mémoire partagée) ou Tableau_partage.
+        sortie : Tableau_partage où les processus écrivent le résultat ; sortie.tableau est
+        alors renvoyé, sans copie. Sinon le résultat est copié dans un nouveau np.ndarray.
+        """
+        forme = tuple(img_array.forme[:2] if isinstance(img_array, Tableau_partage) else img_array.shape[:2])
+        forme += () if couleurs is None else couleurs.shape[1:]
+        dtype = table.dtype if couleurs is None else couleurs.dtype
+        with _partage(img_array) as img, _partage(table) as t, _sortie(sortie, forme, dtype) as resultat:
+            self._lancer(_classer_bande, (img.descripteur(), t.descripteur(), resultat.descripteur()),
+                         [(y0, y1, bits, couleurs) for y0, y1 in self.bandes(forme[0])])
+            return resultat.tableau if sortie is not None else resultat.tableau.copy()
+
+    def contour_mer(self, classes):
+        """
+        Met à jour le bit du trait de côte de tout le raster de classes, par bandes : en place
+        si classes est un Tableau_partage, sinon (np.ndarray) par une copie dans la mémoire
+        partagée recopiée ensuite dans classes.
+        """
+        with _partage(classes) as partage:
+            self._lancer(_contour_bande, (partage.descripteur(),), self.bandes(partage.forme[0]))
+            if partage is not classes:
+                classes[...] = partage.tableau
+
+    def construire_arbre(self, img_array, seuil_variance: float = 50, sortie: Tableau_partage = None):
+        """
+        Même arbre que Moyenne_couleur.construire_arbre, et son image reconstruite.
+        img_array : np.ndarray (copié dans la mémoire partagée) ou Tableau_partage ; sortie :
+        Tableau_partage (hauteur, largeur, 3) en uint8 où l'image reconstruite est peinte et
+        renvoyée (sortie.tableau) sans copie, au lieu d'un nouveau np.ndarray. L'image
+        est découpée comme les `profondeur` premiers niveaux de l'arbre (au moins 4 régions
+        par processus) ; chaque processus construit et peint l'arbre de ses régions. Les
+        niveaux du dessus sont ensuite décidés ici à partir des sommes des régions, en
+        additionnant les sommes des quatre enfants : le découpage n'est donc gardé que
+        là où l'arbre séquentiel découpe aussi.
+        """
+        hauteur, largeur, _ = img_array.forme if isinstance(img_array, Tableau_partage) else img_array.shape
+        helper = _moyenne_couleur(seuil_variance)
+        # à moins de profondeur, aucun nœud ne fait un pixel de haut ou de large
+        profondeur = min(math.ceil(math.log(4 * self.processus, 4)), int(math.log2(min(hauteur, largeur))))
+        if profondeur < 1:
+            source = img_array.tableau if isinstance(img_array, Tableau_partage) else img_array
+            arbre = helper.construire_arbre(source)
+            if sortie is None:
+                return arbre, COULEURS_ZONES[arbre.peindre()]
+            with _sortie(sortie, (hauteur, largeur, 3), np.uint8) as resultat:
+                resultat.tableau[...] = COULEURS_ZONES[arbre.peindre()]
+                return arbre, resultat.tableau
+        bornes = [tuple(np.array([v], dtype=np.int32) for v in (0, 0, hauteur, largeur))]
+        for _ in range(profondeur):
+            bornes.append(Arbre_quadtree.enfants(*bornes[-1]))
+        with _partage(img_array) as img, _sortie(sortie, (hauteur, largeur, 3), np.uint8) as resultat:
+            resultats = self._lancer(_sous_arbre, (img.descripteur(), resultat.descripteur()),
+                                     [(*r, seuil_variance) for r in zip(*(b.tolist() for b in bornes[-1]))])
+            reconstruite = resultat.tableau if sortie is not None else resultat.tableau.copy()
+
+        # niveaux du dessus : un nœud n'existe que si aucun de ses ancêtres n'est une feuille
+        sommes = [np.array([s for _, s in resultats])]
+        for _ in range(profondeur):
+            sommes.insert(0, sommes[0].reshape(-1, 4, 6).sum(axis=1))
+        arbre = Arbre_quadtree(hauteur, largeur)
+        present = np.ones(1, dtype=bool)
+        for (y0, x0, h, l), s in zip(bornes[:-1], sommes[:-1]):
+            if not present.any():  # tout est sous une feuille : aucune région n'est gardée
+                present = np.zeros(len(bornes[-1][0]), dtype=bool)
+                break
+            n = h.astype(np.int64)[present] * l[present]
+            feuille = helper.variances_faibles(n, s[present])
+            couleur = np.full(len(n), -1, dtype=np.int8)
+            couleur[feuille] = helper.quelle_couleur_lot(s[present][feuille, :3] / n[feuille, None])
+            arbre.ajouter_niveau(y0[present], x0[present], h[present], l[present], feuille, couleur)
+            for y, x, hf, lf, c in zip(*(v[present][feuille].tolist() for v in (y0, x0, h, l)), couleur[feuille].tolist()):
+                reconstruite[y:y + hf, x:x + lf] = COULEURS_ZONES[c]
+            interne = present.copy()
+            interne[present] = ~feuille
+            present = np.repeat(interne, 4)
+
+        # niveaux des régions gardées, dans l'ordre des régions (l'ordre du parcours en largeur)
+        y0, x0 = bornes[-1][0], bornes[-1][1]
+        gardees = [(niveaux, y0[i], x0[i]) for i, (niveaux, _) in enumerate(resultats) if present[i]]
+        for k in range(max((len(niveaux) for niveaux, _, _ in gardees), default=0)):
+            niveaux = [(n[k], y, x) for n, y, x in gardees if k < len(n)]
+            arbre.ajouter_niveau(np.concatenate([n["y0"] + y for n, y, _ in niveaux]),
+                                 np.concatenate([n["x0"] + x for n, _, x in niveaux]),
+                                 *(np.concatenate([n[c] for n, _, _ in niveaux]) for c in ("h", "l", "feuille", "couleur")))
+        return arbre, reconstruite
@@ -0,0 +1,48 @@
+import numpy as np
+
+
+def latlon_vers_tuiles(lat, lon, zoom, taille_tuile=256, pixels=False):
+    """
+    Version vectorisée de Drone.latlon_to_tile : lat, lon (et zoom) sont des
+    scalaires ou des tableaux NumPy de formes compatibles (broadcasting).
+    Renvoie les tableaux d'indices de tuile x, y et, si pixels=True, les
+    décalages px, py (en pixels, non entiers) du point dans sa tuile.
+    """
+    lat_rad = np.radians(np.asarray(lat, dtype=float))
+    n = 2.0 ** np.asarray(zoom)
+    fx = (np.asarray(lon, dtype=float) + 180.0) / 360.0 * n
+    fy = (1.0 - np.log(np.tan(lat_rad) + 1 / np.cos(lat_rad)) / np.pi) / 2.0 * n
+    x = np.trunc(fx).astype(np.int64)
+    y = np.trunc(fy).astype(np.int64)
+    if pixels:
+        return x, y, (fx - x) * taille_tuile, (fy - y) * taille_tuile
+    return x, y
+
+
+def tuiles_vers_latlon(x, y, zoom, px=0.0, py=0.0, taille_tuile=256):
+    """
+    Version vectorisée de Drone.tile_to_latlon : renvoie les tableaux lat, lon du
+    point situé au décalage (px, py) pixels dans la tuile (x, y). Avec des px, py
+    de formes compatibles, on géoréférence tous les pixels d'une mosaïque d'un coup.
+    """
+    n = 2.0 ** np.asarray(zoom)
+    fx = np.asarray(x, dtype=float) + np.asarray(px, dtype=float) / taille_tuile
+    fy = np.asarray(y, dtype=float) + np.asarray(py, dtype=float) / taille_tuile
+    lon = fx / n * 360.0 - 180.0
+    lat = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * fy / n))))
+    return lat, lon
+
+
+def tuiles_de_bbox(min_lat, min_lon, max_lat, max_lon, zoom):
+    """
+    Tableau (N, 3) des (x, y, zoom) couvrant la zone, dans le même ordre que
+    la double boucle de tiles_from_bbox (x puis y).
+    """
+    (x_min, x_max), (y_max, y_min) = latlon_vers_tuiles([min_lat, max_lat], [min_lon, max_lon], zoom)
+    xs = np.arange(min(x_min, x_max), max(x_min, x_max) + 1)
+    ys = np.arange(min(y_min, y_max), max(y_min, y_max) + 1)
+    tuiles = np.empty((len(xs), len(ys), 3), dtype=np.int64)
+    tuiles[:, :, 0] = xs[:, None]
+    tuiles[:, :, 1] = ys[None, :]
+    tuiles[:, :, 2] = zoom
+    return tuiles.reshape(-1, 3)
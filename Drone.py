@@ -1,14 +1,92 @@
-import os
-import math
-import requests
+import threading
 from io import BytesIO
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from PIL import Image, ImageEnhance, ImageDraw
+from Coordonnees_tuiles import latlon_vers_tuiles, tuiles_vers_latlon, tuiles_de_bbox
+from Session_http import session_partagee
+from Stockage_tuiles import Stockage_dossier
+
+URL_TUILES = "https://basemaps.cartocdn.com/rastertiles/voyager_nolabels/{zoom}/{x}/{y}.png"
+
+
+class Mosaique:
+    """
+    Mosaïque de tuiles gardée en mémoire et complétée tuile par tuile.
+    Le canevas double de taille du côté où la zone déborde, pour que chaque
+    ajout ne coûte que le collage de la nouvelle tuile (en moyenne).
+    """
+    def __init__(self, taille_tuile=256, mode="RGB"):
+        self.taille_tuile = taille_tuile
+        self.mode = mode
+        self.canvas = None
+        self.origine = None      # indices (x, y) de la tuile en haut à gauche du canevas
+        self.capacite = (0, 0)   # taille du canevas en tuiles (largeur, hauteur)
+        self.min_x = self.max_x = self.min_y = self.max_y = None
+
+    def _agrandir(self, x, y):
+        """Réalloue le canevas pour qu'il contienne la tuile (x, y)."""
+        ox, oy = self.origine
+        cw, ch = self.capacite
+        nx0, ny0, nx1, ny1 = ox, oy, ox + cw, oy + ch
+        if x < nx0:
+            nx0 = min(x, ox - cw)
+        if x >= nx1:
+            nx1 = max(x + 1, ox + 2 * cw)
+        if y < ny0:
+            ny0 = min(y, oy - ch)
+        if y >= ny1:
+            ny1 = max(y + 1, oy + 2 * ch)
+        t = self.taille_tuile
+        canvas = Image.new(self.mode, ((nx1 - nx0) * t, (ny1 - ny0) * t))
+        canvas.paste(self.canvas, ((ox - nx0) * t, (oy - ny0) * t))
+        self.canvas = canvas
+        self.origine = (nx0, ny0)
+        self.capacite = (nx1 - nx0, ny1 - ny0)
+
+    def ajouter(self, x, y, tuile):
+        """Colle la tuile d'indices (x, y) dans la mosaïque."""
+        if self.canvas is None:
+            self.canvas = Image.new(self.mode, (self.taille_tuile, self.taille_tuile))
+            self.origine = (x, y)
+            self.capacite = (1, 1)
+            self.min_x = self.max_x = x
+            self.min_y = self.max_y = y
+        ox, oy = self.origine
+        if not (ox <= x < ox + self.capacite[0] and oy <= y < oy + self.capacite[1]):
+            self._agrandir(x, y)
+            ox, oy = self.origine
+        self.min_x, self.max_x = min(self.min_x, x), max(self.max_x, x)
+        self.min_y, self.max_y = min(self.min_y, y), max(self.max_y, y)
+        self.canvas.paste(tuile, ((x - ox) * self.taille_tuile, (y - oy) * self.taille_tuile))
+
+    def tuile(self, x, y):
+        """Renvoie la tuile (x, y) déjà collée dans la mosaïque."""
+        t = self.taille_tuile
+        ox, oy = self.origine
+        return self.canvas.crop(((x - ox) * t, (y - oy) * t, (x - ox + 1) * t, (y - oy + 1) * t))
+
+    def image(self):
+        """Renvoie la mosaïque recadrée sur les tuiles ajoutées (None si vide)."""
+        if self.canvas is None:
+            return None
+        t = self.taille_tuile
+        ox, oy = self.origine
+        return self.canvas.crop(((self.min_x - ox) * t, (self.min_y - oy) * t,
+                                 (self.max_x - ox + 1) * t, (self.max_y - oy + 1) * t))
 
 class Drone:
     """Noam """
-    def __init__(self):
+    def __init__(self, cache=None, session=None, prechargement=False, rayon_prechargement=1,
+                 taille_memoire=64, stockage=None):
         """
         Initialise les attributs du drone.
+        cache : Cache_tuiles optionnel consulté avant chaque téléchargement.
+        session : session HTTP à utiliser (par défaut la session partagée).
+        prechargement : télécharge en tâche de fond les tuiles voisines (anneau de
+        rayon_prechargement) après chaque capture ou déplacement.
+        taille_memoire : nombre maximal de tuiles gardées en mémoire pour le préchargement.
+        stockage : Stockage_tuiles où sont sauvegardées les tuiles (par défaut un PNG par tuile dans tiles/).
         """
         self.zoom = None
         self.lat = None
@@ -17,6 +95,21 @@ class Drone:
         self.y = None
         self.captured_image = None
         self.visited_tiles = []
+        self.mosaique = Mosaique()
+        self.stockage = stockage if stockage is not None else Stockage_dossier("tiles")
+        self.cache = cache
+        self.url_tuiles = URL_TUILES
+        self.source = "voyager_nolabels"  # clé de la source des tuiles dans le cache
+        self.session = session if session is not None else session_partagee()
+        self.timeout = (5, 10)  # (connexion, lecture) en secondes, pour chaque tentative
+        self.prechargement = prechargement
+        self.rayon_prechargement = rayon_prechargement
+        self.taille_memoire = taille_memoire
+        self.prechargement_hits = 0
+        self.prechargement_miss = 0
+        self._memoire = OrderedDict()  # (x, y, zoom) -> Future de la tuile, ordre LRU
+        self._verrou_memoire = threading.Lock()
+        self._executeur = None
 
     def get_coordinates(self):
         """Permet d'obtenir les coordonées """
@@ -27,32 +120,38 @@ class Drone:
         Convertit une paire (lat, lon) en indices de tuile (x, y)
         pour le niveau de zoom donné (slippy map).
         """
-        lat_rad = math.radians(lat)
-        n = 2 ** zoom
-        x = int((lon + 180.0) / 360.0 * n)
-        y = int((1.0 - math.log(math.tan(lat_rad) + 1/math.cos(lat_rad)) / math.pi) / 2.0 * n)
-        return x, y
+        x, y = latlon_vers_tuiles(lat, lon, zoom)
+        return int(x), int(y)
 
     def tile_to_latlon(self, x, y, zoom):
         """
         Convertit les indices de tuile (x, y) en coordonnées géographiques (lat, lon)
         pour le niveau de zoom donné.
         """
-        n = 2 ** zoom
-        lon = x / n * 360.0 - 180.0
-        lat_rad = math.atan(math.sinh(math.pi * (1 - 2 * y / n)))
-        lat = math.degrees(lat_rad)
-        return lat, lon
+        lat, lon = tuiles_vers_latlon(x, y, zoom)
+        return float(lat), float(lon)
+
+    def tiles_from_bbox(self, min_lat, min_lon, max_lat, max_lon, zoom):
+        """Liste des tuiles (x, y, zoom) couvrant la zone."""
+        return [tuple(t) for t in tuiles_de_bbox(min_lat, min_lon, max_lat, max_lon, zoom).tolist()]
 
     def download_tile(self, x, y, zoom):
         """
         Télécharge la tuile cartographique (256×256) à l’indice (x,y,zoom).
+        La tuile est d'abord cherchée dans le cache disque s'il y en a un.
         """
-        url = f"https://basemaps.cartocdn.com/rastertiles/voyager_nolabels/{zoom}/{x}/{y}.png"
-        headers = {"User-Agent": "DroneMappingSim/1.0 (contact: you@domain.com)"}
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
-        return Image.open(BytesIO(resp.content)).convert("RGB")
+        donnees = None
+        if self.cache is not None:
+            donnees = self.cache.lire(self.source, zoom, x, y)
+        if donnees is None:
+            url = self.url_tuiles.format(zoom=zoom, x=x, y=y)
+            headers = {"User-Agent": "DroneMappingSim/1.0 (contact: you@domain.com)"}
+            resp = self.session.get(url, headers=headers, timeout=self.timeout)
+            resp.raise_for_status()
+            donnees = resp.content
+            if self.cache is not None:
+                self.cache.ecrire(self.source, zoom, x, y, donnees)
+        return Image.open(BytesIO(donnees)).convert("RGB")
 
     def enhance_contrast(self, img, facteur=1.8):
         """
@@ -61,6 +160,82 @@ class Drone:
         enhancer = ImageEnhance.Contrast(img)
         return enhancer.enhance(facteur)
 
+    def _obtenir_tuile(self, x, y, zoom):
+        """
+        Renvoie la tuile (x, y, zoom) depuis la mémoire de préchargement si elle y est
+        (en attendant la fin de son téléchargement si besoin), sinon la télécharge.
+        """
+        with self._verrou_memoire:
+            future = self._memoire.get((x, y, zoom))
+            if future is not None:
+                self._memoire.move_to_end((x, y, zoom))
+        if future is not None:
+            try:
+                tile = future.result()
+                self.prechargement_hits += 1
+                return tile
+            except Exception:
+                with self._verrou_memoire:
+                    self._memoire.pop((x, y, zoom), None)
+        if self.prechargement:
+            self.prechargement_miss += 1
+        return self.download_tile(x, y, zoom)
+
+    def _precharger(self, tile):
+        """
+        Garde la tuile courante en mémoire et lance le téléchargement en tâche de fond
+        des tuiles voisines, les plus proches d'abord.
+        """
+        if not self.prechargement:
+            return
+        if self._executeur is None:
+            self._executeur = ThreadPoolExecutor(max_workers=4)
+        courante = Future()
+        courante.set_result(tile)
+        r = self.rayon_prechargement
+        voisins = sorted(((dx, dy) for dx in range(-r, r + 1) for dy in range(-r, r + 1) if (dx, dy) != (0, 0)),
+                         key=lambda d: max(abs(d[0]), abs(d[1])))
+        with self._verrou_memoire:
+            self._memoire[(self.x, self.y, self.zoom)] = courante
+            self._memoire.move_to_end((self.x, self.y, self.zoom))
+            for dx, dy in reversed(voisins):  # les plus proches finissent en fin de LRU
+                cle = (self.x + dx, self.y + dy, self.zoom)
+                if cle in self._memoire:
+                    self._memoire.move_to_end(cle)
+                else:
+                    self._memoire[cle] = self._executeur.submit(self.download_tile, *cle)
+            while len(self._memoire) > self.taille_memoire:
+                _, ancienne = self._memoire.popitem(last=False)
+                ancienne.cancel()
+
+    def taux_prechargement(self):
+        """Proportion des tuiles capturées qui étaient déjà préchargées."""
+        total = self.prechargement_hits + self.prechargement_miss
+        return self.prechargement_hits / total if total else 0.0
+
+    def arreter_prechargement(self):
+        """Abandonne les préchargements en cours et libère la mémoire."""
+        if self._executeur is not None:
+            self._executeur.shutdown(wait=False, cancel_futures=True)
+            self._executeur = None
+        with self._verrou_memoire:
+            self._memoire.clear()
+
+    def _capturer_tuile_courante(self, contraste):
+        """
+        Récupère la tuile (self.x, self.y, self.zoom), améliore son contraste, la sauvegarde
+        dans self.stockage, met à jour self.captured_image et relance le préchargement.
+        Renvoie l'emplacement de la tuile sauvegardée.
+        """
+        tile = self._obtenir_tuile(self.x, self.y, self.zoom)
+        img = self.enhance_contrast(tile, facteur=contraste)
+        path = self.stockage.ecrire(self.zoom, self.x, self.y, tile)
+        self.captured_image = img
+        self.visited_tiles.append((self.x, self.y, self.zoom))
+        self.mosaique.ajouter(self.x, self.y, tile)
+        self._precharger(tile)
+        return path
+
     def capture_image(self, lat, lon, zoom, contraste=1.8):
         """
         Capture la tuile correspondant à (lat, lon, zoom), améliore son contraste,
@@ -69,26 +244,14 @@ class Drone:
         self.lat, self.lon, self.zoom = lat, lon, zoom
         self.x, self.y = self.latlon_to_tile(lat, lon, zoom)
 
-        # Téléchargement
-        tile = self.download_tile(self.x, self.y, zoom)
-
-        # Contraste
-        img = self.enhance_contrast(tile, facteur=contraste)
-
-        # Sauvegarde
-        os.makedirs("tiles", exist_ok=True)
-        path = f"tiles/tuile_{zoom}_{self.x}_{self.y}.png"
-        tile.save(path)
-
-        # Mise à jour des attributs
-        self.captured_image = img
-        self.visited_tiles.append((self.x, self.y, zoom))
+        path = self._capturer_tuile_courante(contraste)
         print(f"Tuiles téléchargées : 1 (x={self.x}, y={self.y}, zoom={zoom}) → {path}")
 
     def deplacement(self, direction: str):
         """
         Déplace la tuile courante d’un pas selon `direction`,
         télécharge, dessine le marqueur, sauvegarde et met à jour self.captured_image.
+        Si la tuile a été préchargée, elle est servie depuis la mémoire.
         """
         if self.x is None or self.y is None:
             print("donner coordonnées init")
@@ -109,44 +272,44 @@ class Drone:
         self.lat, self.lon = self.tile_to_latlon(self.x, self.y, self.zoom)
         print(f"Nouvelles coordonnées de tuile : x={self.x}, y={self.y}, zoom={self.zoom}")
 
-        tile = self.download_tile(self.x, self.y, self.zoom)
-        img = self.enhance_contrast(tile, facteur=1.8)
-        os.makedirs("tiles", exist_ok=True)
-        path = f"tiles/tuile_{self.zoom}_{self.x}_{self.y}.png"
-        tile.save(path)
-        self.captured_image = img
-        self.visited_tiles.append((self.x, self.y, self.zoom))
+        path = self._capturer_tuile_courante(1.8)
         print(f"Tuiles sauvegardée : {path}")
 
+    def recharger_mosaique(self):
+        """
+        Reconstruit la mosaïque des tuiles de self.visited_tiles à partir de
+        self.stockage, avec une lecture par zone pour chaque niveau de zoom.
+        """
+        self.mosaique = Mosaique()
+        visitees = set(self.visited_tiles)
+        for zoom in sorted({t[2] for t in visitees}):
+            xs = [t[0] for t in visitees if t[2] == zoom]
+            ys = [t[1] for t in visitees if t[2] == zoom]
+            trouvees = 0
+            for x, y, tuile in self.stockage.lire_zone(zoom, min(xs), max(xs), min(ys), max(ys)):
+                if (x, y, zoom) in visitees:
+                    self.mosaique.ajouter(x, y, tuile)
+                    trouvees += 1
+            if trouvees < len(xs):
+                print(f"Tuiles manquantes au zoom {zoom} : {len(xs) - trouvees}")
+
     def recoller(self, output_file: str = "mosaic.png") -> Image.Image:
         """
-        Reconstruit une mosaïque de toutes les tuiles déjà téléchargées,
-        la sauvegarde sous `output_file` et la renvoie comme PIL.Image.
+        Renvoie la mosaïque de toutes les tuiles déjà capturées comme PIL.Image.
+        Elle est tenue à jour à chaque capture (ou relue depuis le stockage si
+        besoin) ; elle n'est écrite sous `output_file` que si celui-ci n'est pas None.
         """
         if not self.visited_tiles:
             print("Aucune tuile à recoller.")
             return None
 
-        tile_size = 256
-        xs = [t[0] for t in self.visited_tiles]
-        ys = [t[1] for t in self.visited_tiles]
-        min_x, max_x = min(xs), max(xs)
-        min_y, max_y = min(ys), max(ys)
-
-        width  = (max_x - min_x + 1) * tile_size
-        height = (max_y - min_y + 1) * tile_size
-        mosaic = Image.new("RGB", (width, height))
-
-        for x, y, zoom in self.visited_tiles:
-            path = f"tiles/tuile_{zoom}_{x}_{y}.png"
-            try:
-                tile = Image.open(path)
-            except FileNotFoundError:
-                print(f"Fichier manquant : {path}")
-                continue
-            mosaic.paste(tile, ((x - min_x) * tile_size,
-                                (y - min_y) * tile_size))
-
-        mosaic.save(output_file)
-        print(f"Mosaïque sauvegardée sous : {output_file}")
-        return mosaic
\ No newline at end of file
+        if self.mosaique.canvas is None:
+            self.recharger_mosaique()
+        mosaic = self.mosaique.image()
+        if mosaic is None:
+            print("Aucune tuile à recoller.")
+            return None
+        if output_file is not None:
+            mosaic.save(output_file)
+            print(f"Mosaïque sauvegardée sous : {output_file}")
+        return mosaic
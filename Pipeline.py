@@ -0,0 +1,167 @@
+import functools
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+from Drone import Mosaique
+from Traitement_image import CENTRES_CARTE, COULEURS_ZONES, Traitement_image, classer_palette, kmeans_histogramme
+
+
+def classer_centres(tuile: np.ndarray) -> np.ndarray:
+    """
+    Segmente une tuile RGB en affectant chaque pixel à la couleur de carte la plus
+    proche (CENTRES_CARTE), c'est-à-dire une étape d'affectation de K-means avec
+    les centres de référence. Renvoie la tuile recoloriée avec COULEURS_ZONES.
+    """
+    return COULEURS_ZONES[classer_palette(tuile, bits=8)]
+
+
+class Resultat_tuile:
+    """Résultat du traitement d'une tuile : image segmentée et masques (Traitement_image)."""
+    def __init__(self, x, y, zoom, segmentee: np.ndarray):
+        self.x, self.y, self.zoom = x, y, zoom
+        self.segmentee = segmentee
+        self.masques = Traitement_image(segmentee)
+        self.masques.creer_masques_couleurs()
+
+
+def nom_methode(classer) -> str:
+    """Nom stable de la fonction de segmentation (et de ses arguments si functools.partial), pour le cache."""
+    if isinstance(classer, functools.partial):
+        return f"{nom_methode(classer.func)}{classer.args!r}{sorted(classer.keywords.items())!r}"
+    return f"{classer.__module__}.{classer.__qualname__}"
+
+
+def _traiter_tuile(drone, tuile, classer, cache):
+    """Télécharge, décode et segmente une tuile (exécuté dans un thread du pipeline)."""
+    x, y, zoom = tuile
+    img = np.asarray(drone.download_tile(x, y, zoom))
+    segmentee = classer(img) if cache is None else cache.segmenter(img, nom_methode(classer), classer)
+    return Resultat_tuile(x, y, zoom, segmentee)
+
+
+def flux_segmentation(drone, tuiles, profondeur: int = 8, classer=classer_centres, cache=None):
+    """
+    Générateur : télécharge et segmente les tuiles (x, y, zoom) et produit chaque
+    Resultat_tuile dès qu'il est prêt, sans attendre les autres. Au plus `profondeur`
+    tuiles sont en cours à la fois, ce qui borne la mémoire utilisée.
+    cache : Cache_segmentation ; une tuile de même contenu qu'une tuile déjà segmentée
+    par classer n'est pas segmentée à nouveau. classer doit alors être une fonction
+    nommée (ou un functools.partial) : son nom fait partie de la clé. Avec classer_centres,
+    une simple lecture de table, le cache ne gagne presque rien ; il sert avec une
+    segmentation coûteuse, par exemple functools.partial(Moyenne_couleur.segmenter_tuile,
+    seuil_variance=50).
+    """
+    tuiles = iter(tuiles)
+    with ThreadPoolExecutor(max_workers=profondeur) as pool:
+        en_cours = set()
+
+        def lancer():
+            tuile = next(tuiles, None)
+            if tuile is not None:
+                en_cours.add(pool.submit(_traiter_tuile, drone, tuple(tuile), classer, cache))
+
+        for _ in range(profondeur):
+            lancer()
+        while en_cours:
+            finis, _ = wait(en_cours, return_when=FIRST_COMPLETED)
+            for future in finis:
+                en_cours.discard(future)
+                lancer()
+                yield future.result()
+
+
+def assembler(resultats, taille_tuile: int = 256) -> Traitement_image:
+    """
+    Étape finale : recolle les tuiles segmentées et calcule les traitements qui
+    dépendent de toute l'image (composantes de mer, trait de côte, eaux intérieures).
+    Chaque résultat est collé dès qu'il arrive puis n'est plus référencé ici : avec
+    flux_segmentation, seules `profondeur` tuiles sont en cours en plus de la mosaïque.
+    La mosaïque, elle, grandit comme la zone survolée (O(aire)) : son canevas, jusqu'à
+    4 fois l'aire pendant les agrandissements, est libéré une fois recadré.
+    """
+    mosaique = Mosaique(taille_tuile)
+    for resultat in resultats:
+        mosaique.ajouter(resultat.x, resultat.y, Image.fromarray(resultat.segmentee))
+        del resultat  # le dernier résultat ne reste pas en mémoire pendant les traitements
+    image = mosaique.image()
+    del mosaique  # canevas libéré : il ne reste que l'image recadrée
+    if image is None:
+        return None
+    img_array = np.array(image)
+    del image
+    helper = Traitement_image(img_array)
+    helper.creer_masques_couleurs()
+    helper.tracer_trait_de_cote()
+    helper.trouver_eaux_interieur()
+    return helper
+
+
+class Kmean_incremental:
+    """
+    K-means tenu à jour au fil des déplacements du drone. Le premier appel ajuste
+    K-means sur toutes les tuiles fournies ; ensuite, chaque nouvelle tuile met à jour
+    les centres par un pas de mini-batch (moyenne glissante pondérée par le nombre
+    de pixels déjà vus dans chaque cluster) et seule cette tuile est étiquetée, puis
+    collée dans la mosaïque segmentée. Le coût d'un déplacement ne dépend donc pas
+    de la longueur du vol.
+    Pas de Cache_segmentation ici : les labels d'une tuile dépendent des centres du
+    moment, que chaque tuile déplace, et reprendre ceux d'une tuile de même contenu
+    (en sautant son pas de mini-batch) changerait la suite de la segmentation.
+    """
+    def __init__(self, k: int = 4, taille_tuile: int = 256):
+        self.k = k
+        self.centres = None   # (k, 3) en float64
+        self.comptes = None   # nombre de pixels déjà affectés à chaque centre
+        self.mosaique = Mosaique(taille_tuile)
+        self.tuiles = set()   # (x, y) déjà segmentées
+
+    def _etiqueter(self, pixels):
+        """Indice du centre le plus proche de chaque pixel (N, 3)."""
+        d = ((pixels[:, None, :].astype(np.float64) - self.centres[None]) ** 2).sum(axis=2)
+        return d.argmin(axis=1)
+
+    def _pas_mini_batch(self, pixels):
+        """Met à jour les centres avec les pixels (N, 3) d'une nouvelle tuile."""
+        labels = self._etiqueter(pixels)
+        nombres = np.bincount(labels, minlength=self.k)
+        for j in np.flatnonzero(nombres):
+            self.comptes[j] += nombres[j]
+            somme = pixels[labels == j].sum(axis=0, dtype=np.float64)
+            self.centres[j] += (somme - nombres[j] * self.centres[j]) / self.comptes[j]
+
+    def _coller(self, x, y, labels):
+        t = self.mosaique.taille_tuile
+        self.mosaique.ajouter(x, y, Image.fromarray(COULEURS_ZONES[labels].reshape(t, t, 3)))
+        self.tuiles.add((x, y))
+
+    def ajouter_tuiles(self, tuiles):
+        """
+        tuiles : liste de (x, y, tuile RGB en np.ndarray ou PIL.Image). Les tuiles
+        déjà segmentées sont ignorées (une tuile ne change pas entre deux passages).
+        """
+        nouvelles, vues = [], set(self.tuiles)
+        for x, y, tuile in tuiles:
+            if (x, y) not in vues:
+                vues.add((x, y))
+                nouvelles.append((x, y, np.asarray(tuile)[..., :3].reshape(-1, 3)))
+        if not nouvelles:
+            return
+        if self.centres is None:
+            pixels = np.concatenate([p for _, _, p in nouvelles])
+            labels, km = kmeans_histogramme(pixels, CENTRES_CARTE[:self.k], self.k)
+            self.centres = km.cluster_centers_.astype(np.float64)
+            self.comptes = np.bincount(labels, minlength=self.k).astype(np.float64)
+            debut = 0
+            for x, y, p in nouvelles:
+                self._coller(x, y, labels[debut:debut + len(p)])
+                debut += len(p)
+            return
+        for x, y, p in nouvelles:
+            self._pas_mini_batch(p)
+            self._coller(x, y, self._etiqueter(p))
+
+    def image(self):
+        """Mosaïque segmentée (PIL.Image), ou None si aucune tuile."""
+        return self.mosaique.image()
@@ -1,12 +1,24 @@
-import math
-import requests
+import os
+import sys
+import numpy as np
 from PIL import Image, ImageEnhance
 from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# modules communs à la racine du dépôt (coordonnées des tuiles, session HTTP), après les modules de ce dossier
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Coordonnees_tuiles import latlon_vers_tuiles, tuiles_de_bbox
+from Session_http import session_partagee
+
+URL_TUILES = "https://basemaps.cartocdn.com/rastertiles/voyager_nolabels/{zoom}/{x}/{y}.png"
+
 
 class Drone:
-    def __init__(self):
+    def __init__(self, nb_workers=8, session=None):
         """
         Initialise les attributs du drone.
+        nb_workers : nombre de tuiles téléchargées en parallèle.
+        session : session HTTP à utiliser (par défaut la session partagée).
         """
         self.zoom = None
         self.lat_min = None
@@ -15,57 +27,115 @@ class Drone:
         self.lon_max = None
         self.num_tiles = 0
         self.captured_image = None
+        self.nb_workers = nb_workers
+        self.url_tuiles = URL_TUILES
+        self.session = session if session is not None else session_partagee()
+        self.timeout = (5, 10)  # (connexion, lecture) en secondes, pour chaque tentative
+        self.pyramide = None  # PyramideTuiles partagée par les drones d'une mission multi-zoom
 
     def latlon_to_tile(self, lat, lon, zoom):
-        lat_rad = math.radians(lat)
-        n = 2 ** zoom
-        x = int((lon + 180.0) / 360.0 * n)
-        y = int((1.0 - math.log(math.tan(lat_rad) + (1 / math.cos(lat_rad))) / math.pi) / 2.0 * n)
-        return x, y
+        x, y = latlon_vers_tuiles(lat, lon, zoom)
+        return int(x), int(y)
 
     def tiles_from_bbox(self, min_lat, min_lon, max_lat, max_lon, zoom):
-        x_min, y_max = self.latlon_to_tile(min_lat, min_lon, zoom)
-        x_max, y_min = self.latlon_to_tile(max_lat, max_lon, zoom)
-
-        tile_list = []
-        for x in range(min(x_min, x_max), max(x_min, x_max) + 1):
-            for y in range(min(y_min, y_max), max(y_min, y_max) + 1):
-                tile_list.append((x, y, zoom))
-
-        return tile_list
+        return [tuple(t) for t in tuiles_de_bbox(min_lat, min_lon, max_lat, max_lon, zoom).tolist()]
 
     def download_tile(self, x, y, zoom):
-        url = f"https://basemaps.cartocdn.com/rastertiles/voyager_nolabels/{zoom}/{x}/{y}.png"
+        """
+        Renvoie la tuile (x, y, zoom), depuis la pyramide locale si le drone en a une
+        (zoom plus grossier dérivé des tuiles fines), sinon depuis le serveur.
+        """
+        if self.pyramide is not None and zoom <= self.pyramide.zoom_max:
+            return self.pyramide.tuile(x, y, zoom)
+        return self.telecharger_tuile(x, y, zoom)
+
+    def telecharger_tuile(self, x, y, zoom):
+        """Télécharge la tuile (x, y, zoom) depuis le serveur de tuiles."""
+        url = self.url_tuiles.format(zoom=zoom, x=x, y=y)
         headers = {
             "User-Agent": "DroneMappingSim/1.0 (contact: noam.grolleau@ensta.fr)"
         }
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers, timeout=self.timeout)
         response.raise_for_status()
         return Image.open(BytesIO(response.content)).convert("RGB")
 
-    def create_image_from_tiles(self, tiles):
+    def _telecharger_tuiles(self, tiles, coller, nb_workers=None):
+        """
+        Télécharge les tuiles en parallèle (nb_workers threads) et appelle
+        coller(pos_x, pos_y, tuile) au fur et à mesure de leur arrivée.
+        Une tuile qui ne peut pas être téléchargée lève son exception ici (les
+        téléchargements pas encore commencés sont annulés) : la mosaïque n'est
+        jamais rendue avec un carré noir à sa place.
+        """
         tile_size = 256
         min_x = min(tile[0] for tile in tiles)
         min_y = min(tile[1] for tile in tiles)
-        max_x = max(tile[0] for tile in tiles)
-        max_y = max(tile[1] for tile in tiles)
 
-        width = (max_x - min_x + 1) * tile_size
-        height = (max_y - min_y + 1) * tile_size
-        image = Image.new('RGB', (width, height))
+        pool = ThreadPoolExecutor(max_workers=nb_workers or self.nb_workers)
+        try:
+            futures = {pool.submit(self.download_tile, x, y, zoom): (x, y) for x, y, zoom in tiles}
+            for future in as_completed(futures):
+                x, y = futures.pop(future)  # libère la tuile une fois collée
+                pos_x = (x - min_x) * tile_size
+                pos_y = (y - min_y) * tile_size
+                coller(pos_x, pos_y, future.result())
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @staticmethod
+    def taille_mosaique(tiles, tile_size=256):
+        """(largeur, hauteur) en pixels de la mosaïque couvrant les tuiles."""
+        width = (max(t[0] for t in tiles) - min(t[0] for t in tiles) + 1) * tile_size
+        height = (max(t[1] for t in tiles) - min(t[1] for t in tiles) + 1) * tile_size
+        return width, height
+
+    def create_image_from_tiles(self, tiles, nb_workers=None):
+        """
+        Télécharge les tuiles en parallèle (nb_workers threads) et les colle
+        dans la mosaïque au fur et à mesure de leur arrivée.
+        """
+        image = Image.new('RGB', self.taille_mosaique(tiles))
+        self._telecharger_tuiles(tiles, lambda px, py, tuile: image.paste(tuile, (px, py)), nb_workers)
+        return image
+
+    def create_raster_from_tiles(self, tiles, fichier, nb_workers=None):
+        """
+        Même mosaïque que create_image_from_tiles, mais écrite tuile par tuile dans un
+        tableau NumPy (hauteur, largeur, 3) projeté en mémoire depuis le fichier .npy
+        `fichier` : seules les pages en cours d'utilisation occupent la RAM.
+        """
+        width, height = self.taille_mosaique(tiles)
+        raster = np.lib.format.open_memmap(fichier, mode="w+", dtype=np.uint8, shape=(height, width, 3))
 
-        for x, y, zoom in tiles:
-            tile_img = self.download_tile(x, y, zoom)
-            pos_x = (x - min_x) * tile_size
-            pos_y = (y - min_y) * tile_size
-            image.paste(tile_img, (pos_x, pos_y))
+        def coller(px, py, tuile):
+            raster[py:py + tuile.height, px:px + tuile.width] = np.asarray(tuile)
 
-        return image
+        self._telecharger_tuiles(tiles, coller, nb_workers)
+        raster.flush()
+        return raster
 
     def enhance_contrast(self, img, facteur=1.8):
         enhancer = ImageEnhance.Contrast(img)
         return enhancer.enhance(facteur)
 
+    def enhance_contrast_raster(self, raster, facteur=1.8, hauteur_bande=1024):
+        """
+        Équivalent de enhance_contrast appliqué en place à un raster (memmap) par bandes
+        de lignes : une passe pour la moyenne des niveaux de gris, une passe pour le mélange.
+        """
+        histogramme = np.zeros(256, dtype=np.int64)
+        for y in range(0, raster.shape[0], hauteur_bande):
+            bande = Image.fromarray(np.ascontiguousarray(raster[y:y + hauteur_bande]))
+            histogramme += np.array(bande.convert("L").histogram(), dtype=np.int64)
+        moyenne = int((histogramme * np.arange(256)).sum() / histogramme.sum() + 0.5)
+        for y in range(0, raster.shape[0], hauteur_bande):
+            bande = Image.fromarray(np.ascontiguousarray(raster[y:y + hauteur_bande]))
+            gris = Image.new("L", bande.size, moyenne).convert("RGB")
+            raster[y:y + hauteur_bande] = np.asarray(Image.blend(gris, bande, facteur))
+        if isinstance(raster, np.memmap):
+            raster.flush()
+        return raster
+
     def clear_attributes(self):
         self.zoom = None
         self.lat_min = None
@@ -75,10 +145,12 @@ class Drone:
         self.num_tiles = 0
         self.captured_image = None
 
-    def capture_image(self, lat_min, lon_min, lat_max, lon_max, zoom, contraste=1.8):
+    def capture_image(self, lat_min, lon_min, lat_max, lon_max, zoom, contraste=1.8, fichier_raster=None):
         """
         Capture une image de la zone spécifiée et améliore le contraste.
         L'image n'est pas affichée automatiquement.
+        Si fichier_raster est donné, l'image est un raster NumPy projeté en mémoire
+        depuis ce fichier .npy au lieu d'une PIL.Image (zones plus grandes que la RAM).
         """
         self.lat_min = lat_min
         self.lon_min = lon_min
@@ -90,6 +162,10 @@ class Drone:
         self.num_tiles = len(tiles)
         print(f"{self.num_tiles} tuiles trouvées.")
 
+        if fichier_raster is not None:
+            raster = self.create_raster_from_tiles(tiles, fichier_raster)
+            self.captured_image = self.enhance_contrast_raster(raster, facteur=contraste)
+            return
         image = self.create_image_from_tiles(tiles)
         self.captured_image = self.enhance_contrast(image, facteur=contraste)
 
@@ -97,7 +173,9 @@ class Drone:
         """
         Affiche l'image capturée si elle existe.
         """
-        if self.captured_image:
+        if isinstance(self.captured_image, np.ndarray):
+            Image.fromarray(self.captured_image).show()
+        elif self.captured_image:
             self.captured_image.show()
         else:
             print("Aucune image à afficher. Veuillez d'abord appeler capture_image().")
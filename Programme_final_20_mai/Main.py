@@ -1,10 +1,40 @@
 from Drone import *
 from traitement_image import *
+from pyramide import PyramideTuiles
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import os
+import time
+
+
+def segmenter(img, k=4):
+    """
+    Segmentation K-means d'une image, exécutée dans un processus du pool.
+    Un raster projeté en mémoire est rouvert depuis son fichier au lieu d'être copié.
+    Seuls les labels (un octet par pixel) sont renvoyés au processus principal, qui a
+    déjà l'image : elle n'est ni rechargée en RAM ni recopiée d'un processus à l'autre.
+    """
+    if isinstance(img, tuple):
+        img = np.load(img[1], mmap_mode="r")
+    debut = time.perf_counter()
+    traiter = TraitementImage()
+    traiter.k_means(img, k=k, methode="histogramme")
+    return traiter.labels.astype(np.uint8), time.perf_counter() - debut
+
 
 class Mission():
 
-    def __init__(self, nom_de_mission, nb_drones, lat_min, lat_max, lon_min, lon_max, liste_zoom):
+    def __init__(self, nom_de_mission, nb_drones, lat_min, lat_max, lon_min, lon_max, liste_zoom, dossier_raster=None,
+                 dossier_pyramide=None, max_paralleles=None):
+        """
+        dossier_raster : si donné, chaque drone écrit son image dans un raster .npy projeté
+        en mémoire dans ce dossier plutôt que de la garder entièrement en RAM.
+        dossier_pyramide : si donné et si la mission a plusieurs zooms, seules les tuiles du
+        zoom le plus fin sont téléchargées ; les autres en sont dérivées (par sous-échantillonnage,
+        donc un peu différentes des tuiles du serveur) et gardées dans ce dossier. Par défaut
+        (None), chaque zoom est téléchargé.
+        max_paralleles : nombre maximal de drones capturés (threads) et d'images segmentées
+        (processus) en même temps ; par défaut tous les drones / tous les cœurs.
+        """
         assert nb_drones == len(liste_zoom), "Il doit y avoir autant de drones que de niveaux de zoom"
         self.nb_drones = nb_drones
         self.lat_min = lat_min
@@ -14,32 +44,100 @@ class Mission():
         self.liste_zoom = liste_zoom
         self.liste_drones = [Drone() for _ in range(nb_drones)]
         self.nom_de_mission = nom_de_mission
+        self.dossier_raster = dossier_raster
+        self.max_paralleles = max_paralleles
+        self.rapport = {i: {"zoom": z, "statut": "en attente"} for i, z in enumerate(liste_zoom)}
+        self.pyramide = None
+        if dossier_pyramide is not None and len(set(liste_zoom)) > 1:
+            tuiles_fines = np.array(self.liste_drones[0].tiles_from_bbox(lat_min, lon_min, lat_max, lon_max, max(liste_zoom)))
+            zone_fine = (tuiles_fines[:, 0].min(), tuiles_fines[:, 0].max(), tuiles_fines[:, 1].min(), tuiles_fines[:, 1].max())
+            self.pyramide = PyramideTuiles(self.liste_drones[0].telecharger_tuile, max(liste_zoom), dossier_pyramide,
+                                           zone_fine=zone_fine)
+            for drone in self.liste_drones:
+                drone.pyramide = self.pyramide
 
-    def lancer_reconnaissance(self):
-        for i in range(len(self.liste_drones)):
+    def fichier_raster(self, zoom):
+        """Fichier .npy du raster d'un drone, ou None si on travaille en mémoire."""
+        if self.dossier_raster is None:
+            return None
+        os.makedirs(self.dossier_raster, exist_ok=True)
+        return os.path.join(self.dossier_raster, f"raster_{self.nom_de_mission}_zoom_{zoom}.npy")
+
+    def _capturer(self, i):
+        """Capture du drone i (dans un thread), résultat et erreur notés dans le rapport."""
+        debut = time.perf_counter()
+        try:
             self.liste_drones[i].capture_image(
                 self.lat_min,
                 self.lon_min,
                 self.lat_max,
                 self.lon_max,
-                self.liste_zoom[i]
+                self.liste_zoom[i],
+                fichier_raster=self.fichier_raster(self.liste_zoom[i])
             )
+            self.rapport[i].update(statut="capturé", nb_tuiles=self.liste_drones[i].num_tiles)
+        except Exception as e:
+            self.rapport[i].update(statut="erreur capture", erreur=repr(e))
+        self.rapport[i]["duree_capture"] = time.perf_counter() - debut
+
+    def lancer_reconnaissance(self):
+        """
+        Capture de tous les drones en parallèle (téléchargements : threads). Le zoom le plus fin
+        est lancé d'abord : la pyramide dérive les zooms plus grossiers de ses tuiles.
+        """
+        ordre = sorted(range(len(self.liste_drones)), key=lambda i: -self.liste_zoom[i])
+        with ThreadPoolExecutor(max_workers=self.max_paralleles or len(ordre)) as pool:
+            list(pool.map(self._capturer, ordre))
 
     def enregistrer_image(self, drone, img):
         nom_fichier = f"img_traitee_{self.nom_de_mission}_zoom_{drone.zoom}.png"
         chemin_complet = os.path.join(os.getcwd(), nom_fichier)
+        if isinstance(img, np.ndarray):
+            img = Image.fromarray(img)
         img.save(chemin_complet)
         print(f"Image enregistrée sous : {chemin_complet}")
 
+    def segmenter_images(self, k=4):
+        """
+        Segmentation K-means des images capturées dans un pool de processus (calcul).
+        Renvoie {indice du drone: TraitementImage} ; l'image de chaque TraitementImage est
+        celle du drone (un raster projeté reste projeté), seuls les labels viennent du pool.
+        """
+        a_traiter = [i for i, drone in enumerate(self.liste_drones) if drone.captured_image is not None]
+        if not a_traiter:
+            return {}
+        resultats = {}
+        with ProcessPoolExecutor(max_workers=min(self.max_paralleles or os.cpu_count(), len(a_traiter))) as pool:
+            futures = {}
+            for i in a_traiter:
+                img = self.liste_drones[i].captured_image
+                if isinstance(img, np.memmap):
+                    img = ("npy", img.filename)
+                futures[i] = pool.submit(segmenter, img, k)
+            for i, future in futures.items():
+                try:
+                    labels, duree = future.result()
+                    resultats[i] = TraitementImage()
+                    resultats[i].appliquer_labels(self.liste_drones[i].captured_image, labels)
+                    self.rapport[i].update(statut="segmenté", duree_segmentation=duree)
+                except Exception as e:
+                    self.rapport[i].update(statut="erreur segmentation", erreur=repr(e))
+        return resultats
+
     def print_save(self, paysages="all", bool_save=True):
-        for drone in self.liste_drones:
-            traiter = TraitementImage()
-            img_traitee = traiter.k_means(drone.captured_image, k=4)  # ✅ k=4 pour inclure les routes
+        for i, traiter in self.segmenter_images(k=4).items():  # ✅ k=4 pour inclure les routes
             traiter.afficher_paysage(paysages)
             if bool_save:
-                self.enregistrer_image(drone, img_traitee)
+                self.enregistrer_image(self.liste_drones[i], traiter.segmented_img)
             del traiter
 
+    def afficher_rapport(self):
+        """Affiche le résultat (ou l'erreur) de chaque drone."""
+        for i, infos in self.rapport.items():
+            details = ", ".join(f"{cle}={valeur:.2f}s" if cle.startswith("duree") else f"{cle}={valeur}"
+                                for cle, valeur in infos.items() if cle not in ("zoom", "statut"))
+            print(f"Drone {i} (zoom {infos['zoom']}) : {infos['statut']} {details}")
+
 
 # Exemple d'exécution
 min_lat, min_lon = 47.7, -5.1
@@ -50,6 +148,7 @@ if __name__ == "__main__":
     Mission_test = Mission("test", 1, min_lat, max_lat, min_lon, max_lon, [zoom])
     Mission_test.lancer_reconnaissance()
     Mission_test.print_save("all", True)
+    Mission_test.afficher_rapport()
 
 
 
@@ -0,0 +1,111 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+
+from PIL import Image
+
+
+class PyramideTuiles:
+    """
+    Pyramide de tuiles multi-zoom construite localement : seules les tuiles du zoom
+    le plus fin (zoom_max) sont téléchargées, chaque tuile d'un zoom plus grossier
+    est obtenue en réduisant 2×2 ses quatre tuiles filles. Toutes les tuiles sont
+    gardées sur disque (dossier/zoom/x/y.png) et réutilisées d'une mission à l'autre.
+    """
+    def __init__(self, telecharger, zoom_max, dossier="pyramide_tuiles", tile_size=256, zone_fine=None):
+        """
+        telecharger : fonction (x, y, zoom) -> PIL.Image qui télécharge une tuile.
+        zone_fine : (x_min, x_max, y_min, y_max) des tuiles de zoom_max téléchargées de toute
+        façon par la mission. Une tuile grossière qui déborde de cette zone (et dont les filles
+        ne sont pas déjà sur disque) est téléchargée directement : la dériver coûterait
+        plus de requêtes qu'elle n'en économise.
+        """
+        self.telecharger = telecharger
+        self.zoom_max = zoom_max
+        self.zone_fine = zone_fine
+        self.dossier = dossier
+        self.tile_size = tile_size
+        self.nb_telechargees = 0
+        self.nb_derivees = 0
+        self.nb_relues = 0
+        self._verrou = threading.Lock()
+        self._en_cours = {}  # (x, y, zoom) -> Future, pour ne pas produire deux fois la même tuile
+
+    def chemin(self, x, y, zoom):
+        return os.path.join(self.dossier, str(zoom), str(x), f"{y}.png")
+
+    def _compter(self, compteur):
+        with self._verrou:
+            setattr(self, compteur, getattr(self, compteur) + 1)
+
+    def _sauvegarder(self, img, chemin):
+        """
+        Écriture atomique (fichier temporaire renommé) pour les accès concurrents ; en cas
+        d'erreur, le fichier temporaire est supprimé.
+        """
+        os.makedirs(os.path.dirname(chemin), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(chemin), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                img.save(f, format="PNG")
+            os.replace(tmp, chemin)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def _derivable(self, x, y, zoom):
+        """Vrai si dériver la tuile ne télécharge rien en dehors de zone_fine."""
+        if self.zone_fine is None:
+            return True
+        k = 2 ** (self.zoom_max - zoom)
+        x_min, x_max, y_min, y_max = self.zone_fine
+        if x_min <= x * k and (x + 1) * k - 1 <= x_max and y_min <= y * k and (y + 1) * k - 1 <= y_max:
+            return True
+        return all(os.path.exists(self.chemin(2 * x + dx, 2 * y + dy, zoom + 1)) for dx in (0, 1) for dy in (0, 1))
+
+    def tuile(self, x, y, zoom):
+        """
+        Renvoie la tuile (x, y, zoom) : relue sur disque si elle existe, téléchargée
+        si zoom >= zoom_max, sinon dérivée de ses quatre filles (elles-mêmes relues,
+        dérivées ou téléchargées) quand c'est rentable.
+        Si un autre thread est déjà en train de produire la tuile, on attend son résultat.
+        """
+        with self._verrou:
+            future = self._en_cours.get((x, y, zoom))
+            proprietaire = future is None
+            if proprietaire:
+                future = self._en_cours[(x, y, zoom)] = Future()
+        if not proprietaire:
+            return future.result()
+        try:
+            img = self._produire(x, y, zoom)
+            future.set_result(img)
+            return img
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._verrou:
+                del self._en_cours[(x, y, zoom)]
+
+    def _produire(self, x, y, zoom):
+        """Relit, télécharge ou dérive la tuile (voir tuile)."""
+        chemin = self.chemin(x, y, zoom)
+        if os.path.exists(chemin):
+            self._compter("nb_relues")
+            return Image.open(chemin).convert("RGB")
+        if zoom >= self.zoom_max or not self._derivable(x, y, zoom):
+            img = self.telecharger(x, y, zoom)
+            self._compter("nb_telechargees")
+        else:
+            t = self.tile_size
+            filles = Image.new("RGB", (2 * t, 2 * t))
+            for dx in (0, 1):
+                for dy in (0, 1):
+                    filles.paste(self.tuile(2 * x + dx, 2 * y + dy, zoom + 1), (dx * t, dy * t))
+            img = filles.resize((t, t), Image.BOX)
+            self._compter("nb_derivees")
+        self._sauvegarder(img, chemin)
+        return img
@@ -1,21 +1,39 @@
+import os
+import sys
 import numpy as np
 from PIL import Image
 from sklearn.cluster import KMeans
 import matplotlib.pyplot as plt
 
+# K-means sur l'histogramme des couleurs : même fonction que le module Traitement_image à la racine du dépôt
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from Traitement_image import kmeans_histogramme
+
+
 class TraitementImage:
     def __init__(self):
         self.img = None
         self.segmented_img = None
         self.labels = None
 
-    def k_means(self, img, k=4):
+    def k_means(self, img, k=4, methode="kmeans"):
         """
         Appliquer K-means pour segmenter l'image en 4 zones spécifiques (eau, rural, urbain, routes).
+        methode="histogramme" ajuste le même K-means sur les couleurs distinctes pondérées
+        par leur nombre de pixels (mêmes labels, beaucoup plus rapide).
+        `img` est une PIL.Image ou un tableau numpy (hauteur, largeur, 3), éventuellement
+        projeté en mémoire (np.memmap), qui est alors lu en place. KMeans de sklearn sur
+        tous les pixels en ferait une copie en float64 (8 fois la taille du raster) : un
+        raster projeté passe donc toujours par "histogramme", qui ne garde que des entiers
+        par pixel (code couleur, labels).
         """
-        self.img = img.convert("RGB")
-        img_np = np.array(self.img)
-        h, w, d = img_np.shape
+        if isinstance(img, np.ndarray):
+            self.img = img
+            img_np = img
+        else:
+            # image déjà en mémoire : pas de conversion si elle est en RGB, une seule copie des pixels
+            self.img = img if img.mode == "RGB" else img.convert("RGB")
+            img_np = np.asarray(self.img)
         pixels = img_np.reshape((-1, 3))
 
         # Centres initiaux pour les 4 types de zones
@@ -26,10 +44,23 @@ class TraitementImage:
             [255, 255, 150]   # Jaune clair (routes)
         ], dtype=np.uint8)
 
-        kmeans = KMeans(n_clusters=k, init=initial_centers, n_init=1, random_state=0)
-        kmeans.fit(pixels)
+        if methode == "histogramme" or isinstance(img_np, np.memmap):
+            labels, _ = kmeans_histogramme(pixels, initial_centers, k)
+        else:
+            kmeans = KMeans(n_clusters=k, init=initial_centers, n_init=1, random_state=0)
+            kmeans.fit(pixels)
+            labels = kmeans.labels_
 
-        self.labels = kmeans.labels_
+        return self.appliquer_labels(self.img, labels)
+
+    def appliquer_labels(self, img, labels):
+        """
+        Garde l'image et ses labels K-means (un par pixel) et construit l'image segmentée,
+        par exemple avec les labels calculés dans un autre processus (Mission.segmenter_images).
+        """
+        self.img = img
+        self.labels = labels
+        h, w = (img.shape[:2] if isinstance(img, np.ndarray) else (img.height, img.width))
 
         # Couleurs pour afficher chaque zone
         cluster_colors = np.array([
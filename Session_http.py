@@ -0,0 +1,34 @@
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+def creer_session(nb_connexions=32, nb_essais=3, backoff=0.5, jitter=0.25):
+    """
+    Crée une session HTTP avec un pool de connexions persistantes (keep-alive)
+    et des nouvelles tentatives bornées sur les erreurs réseau et les 429/5xx,
+    espacées par un backoff exponentiel (backoff * 2**n) avec un aléa de jitter secondes.
+    """
+    essais = Retry(
+        total=nb_essais,
+        backoff_factor=backoff,
+        backoff_jitter=jitter,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET",),
+        raise_on_status=False,  # la dernière réponse en erreur passe par raise_for_status
+    )
+    adaptateur = HTTPAdapter(pool_connections=4, pool_maxsize=nb_connexions, max_retries=essais)
+    session = requests.Session()
+    session.mount("http://", adaptateur)
+    session.mount("https://", adaptateur)
+    return session
+
+
+_session_partagee = None
+
+def session_partagee():
+    """Session commune à tous les drones du processus, créée au premier appel."""
+    global _session_partagee
+    if _session_partagee is None:
+        _session_partagee = creer_session()
+    return _session_partagee
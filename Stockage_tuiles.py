@@ -0,0 +1,134 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from io import BytesIO
+
+from PIL import Image
+
+
+class Stockage_tuiles(ABC):
+    """
+    Classe mère des stockages de tuiles capturées par le drone.
+    Les tuiles sont repérées par (zoom, x, y) en convention slippy map.
+    """
+    @abstractmethod
+    def ecrire(self, zoom, x, y, tuile):
+        """Enregistre la tuile (PIL.Image) et renvoie une description de l'emplacement."""
+
+    @abstractmethod
+    def lire(self, zoom, x, y):
+        """Renvoie la tuile (PIL.Image) ou None si elle n'est pas stockée."""
+
+    def lire_zone(self, zoom, x_min, x_max, y_min, y_max):
+        """Génère les (x, y, tuile) stockées dans le rectangle d'indices (bornes incluses)."""
+        for x in range(x_min, x_max + 1):
+            for y in range(y_min, y_max + 1):
+                tuile = self.lire(zoom, x, y)
+                if tuile is not None:
+                    yield x, y, tuile
+
+    def vider(self):
+        """Écrit les tuiles encore en attente."""
+
+    def fermer(self):
+        self.vider()
+
+
+class Stockage_dossier(Stockage_tuiles):
+    """Un fichier PNG par tuile : dossier/tuile_{zoom}_{x}_{y}.png (disposition historique)."""
+    def __init__(self, dossier: str = "tiles"):
+        self.dossier = dossier
+
+    def chemin(self, zoom, x, y):
+        return f"{self.dossier}/tuile_{zoom}_{x}_{y}.png"
+
+    def ecrire(self, zoom, x, y, tuile):
+        os.makedirs(self.dossier, exist_ok=True)
+        path = self.chemin(zoom, x, y)
+        tuile.save(path)
+        return path
+
+    def lire(self, zoom, x, y):
+        try:
+            with Image.open(self.chemin(zoom, x, y)) as tuile:
+                tuile.load()  # lue en entier : le fichier est refermé tout de suite
+                return tuile
+        except FileNotFoundError:
+            return None
+
+
+class Stockage_mbtiles(Stockage_tuiles):
+    """
+    Toutes les tuiles dans un seul fichier SQLite au format MBTiles, indexé par
+    (zoom_level, tile_column, tile_row). Les insertions sont regroupées par lots de
+    taille_lot dans une seule transaction. Comme dans la norme MBTiles, tile_row
+    suit la convention TMS (axe y inversé).
+    """
+    def __init__(self, fichier: str = "tiles.mbtiles", taille_lot: int = 64, nom: str = "mission"):
+        self.fichier = fichier
+        self.taille_lot = taille_lot
+        self._en_attente = {}  # (zoom, x, y) -> PNG pas encore inséré
+        self._verrou = threading.Lock()
+        self._connexion = sqlite3.connect(fichier, check_same_thread=False)
+        with self._connexion:
+            self._connexion.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)")
+            self._connexion.execute(
+                "CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, "
+                "tile_row INTEGER, tile_data BLOB)")
+            self._connexion.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)")
+            self._connexion.executemany(
+                "INSERT OR IGNORE INTO metadata VALUES (?, ?)", [("name", nom), ("format", "png")])
+
+    @staticmethod
+    def _ligne_tms(zoom, y):
+        return (1 << zoom) - 1 - y
+
+    def ecrire(self, zoom, x, y, tuile):
+        buf = BytesIO()
+        tuile.save(buf, format="PNG")
+        with self._verrou:
+            self._en_attente[(zoom, x, y)] = buf.getvalue()
+            if len(self._en_attente) >= self.taille_lot:
+                self._inserer()
+        return f"{self.fichier}:{zoom}/{x}/{y}"
+
+    def _inserer(self):
+        """Insère le lot en attente en une transaction (verrou déjà pris)."""
+        if not self._en_attente:
+            return
+        with self._connexion:
+            self._connexion.executemany(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)",
+                [(z, x, self._ligne_tms(z, y), donnees) for (z, x, y), donnees in self._en_attente.items()])
+        self._en_attente.clear()
+
+    def vider(self):
+        with self._verrou:
+            self._inserer()
+
+    def lire(self, zoom, x, y):
+        with self._verrou:
+            donnees = self._en_attente.get((zoom, x, y))
+            if donnees is None:
+                ligne = self._connexion.execute(
+                    "SELECT tile_data FROM tiles WHERE zoom_level=? AND tile_column=? AND tile_row=?",
+                    (zoom, x, self._ligne_tms(zoom, y))).fetchone()
+                donnees = ligne[0] if ligne else None
+        return None if donnees is None else Image.open(BytesIO(donnees))
+
+    def lire_zone(self, zoom, x_min, x_max, y_min, y_max):
+        """Lecture du rectangle en une seule requête sur l'index."""
+        with self._verrou:
+            self._inserer()
+            lignes = self._connexion.execute(
+                "SELECT tile_column, tile_row, tile_data FROM tiles WHERE zoom_level=? "
+                "AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                (zoom, x_min, x_max, self._ligne_tms(zoom, y_max), self._ligne_tms(zoom, y_min))).fetchall()
+        for x, ligne, donnees in lignes:
+            yield x, self._ligne_tms(zoom, ligne), Image.open(BytesIO(donnees))
+
+    def fermer(self):
+        self.vider()
+        self._connexion.close()
@@ -1,13 +1,28 @@
 # Test.py
+import importlib
+import math
 import os
 import shutil
 import tempfile
+import threading
+import time
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 from PIL import Image
+from scipy import ndimage
 
+import requests
+from Session_http import creer_session
 from Drone import Drone
-from Traitement_image import Traitement_image, Kmean, Moyenne_couleur
+from Coordonnees_tuiles import latlon_vers_tuiles, tuiles_vers_latlon, tuiles_de_bbox
+from Cache_tuiles import Cache_tuiles
+from Cache_segmentation import Cache_segmentation
+from Stockage_tuiles import Stockage_tuiles, Stockage_dossier, Stockage_mbtiles
+from tests.serveur_tuiles import ServeurTuiles
+from Traitement_image import Traitement_image, Traitement_incremental, Kmean, Moyenne_couleur, Union_find, CENTRES_CARTE, COULEURS_ZONES, classer_palette, codes_rgb, table_classes, BIT_TRAIT_DE_COTE
+from Pipeline import flux_segmentation, assembler, classer_centres, Kmean_incremental
+from Calcul_parallele import Calcul_parallele, Tableau_partage
 from interface.Accueil import Ui_MainWindow as AccueilUI
 from interface.Explo_finistere import CheckableMenu, ExploWindow
 
@@ -16,6 +31,23 @@ import sys
 
 app = QtWidgets.QApplication(sys.argv)  # nécessaire pour tester les UI PyQt
 
+def importer_programme_final(*noms):
+    """
+    Importe les modules `noms` de Programme_final_20_mai. Son Drone masque celui de la racine :
+    celui-ci est retiré de sys.modules le temps de l'import, puis remis ; les modules importés
+    gardent leurs propres références (Main.Drone est celui de Programme_final_20_mai).
+    """
+    dossier = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Programme_final_20_mai")
+    racine = sys.modules.pop("Drone")
+    sys.path.insert(0, dossier)
+    try:
+        return [importlib.import_module(nom) for nom in noms]
+    finally:
+        sys.path.remove(dossier)
+        sys.modules["Drone"] = racine
+
+Main, Drone_final, pyramide = importer_programme_final("Main", "Drone", "pyramide")
+
 class TestTraitementImage(unittest.TestCase):
     @classmethod
     def setUpClass(cls):
@@ -62,6 +94,115 @@ class TestTraitementImage(unittest.TestCase):
         else:
             print("Attention : aucun pixel d'eau intérieure détecté dans l'image de test.")
 
+    def test_mer_et_trait_de_cote_comme_sobel(self):
+        # beaucoup de petites zones d'eau : mer = zones qui touchent le bord
+        rng = np.random.default_rng(4)
+        arr = np.zeros((60, 90, 3), dtype=np.uint8)
+        arr[rng.random((60, 90)) < 0.45] = (0, 0, 255)
+        ti = Traitement_image(arr)
+        ti.tracer_trait_de_cote()
+        labels, nb = ndimage.label(ti.aquatique)
+        mer = np.zeros_like(ti.aquatique)
+        for i in range(1, nb + 1):
+            zone = labels == i
+            if zone[0].any() or zone[-1].any() or zone[:, 0].any() or zone[:, -1].any():
+                mer |= zone
+        self.assertTrue((ti.mer == mer).all())
+        grad = np.hypot(ndimage.sobel(mer.astype(float), axis=1), ndimage.sobel(mer.astype(float), axis=0))
+        self.assertTrue((ti.trait_de_cote == (grad > 1)).all())
+
+    def test_raster_de_classes(self):
+        rng = np.random.default_rng(5)
+        couleurs = np.concatenate([COULEURS_ZONES, [[1, 2, 3], [0, 0, 254]]]).astype(np.uint8)
+        arr = couleurs[rng.integers(0, len(couleurs), (40, 50))]
+        ti = Traitement_image(arr)
+        ti.creer_masques_couleurs()
+        self.assertEqual(ti.classes.dtype, np.uint8)
+        for i, nom in enumerate(("aquatique", "rural", "urbain", "routes")):
+            attendu = (arr == COULEURS_ZONES[i]).all(axis=2)
+            self.assertTrue((getattr(ti, nom) == attendu).all(), nom)
+        ti.tracer_trait_de_cote()
+        mer = Traitement_image.extraire_mer(ti.aquatique)
+        self.assertTrue((ti.mer == mer).all())
+        self.assertTrue((ti.trait_de_cote == Traitement_image.contour(mer)).all())
+        self.assertTrue((ti.trouver_eaux_interieur() == (ti.aquatique & ~mer)).all())
+        # un masque de mer affecté de l'extérieur est utilisé tel quel
+        ti.mer = np.zeros_like(mer)
+        self.assertTrue((ti.eaux_interieur == ti.aquatique).all())
+        ti.creer_masques_couleurs()
+        self.assertTrue((ti.mer == mer).all())
+
+    def test_masques_paresseux(self):
+        rng = np.random.default_rng(6)
+        arr = COULEURS_ZONES[rng.integers(0, 4, (30, 41))]
+        reference = Traitement_image(arr)
+        reference.tracer_trait_de_cote()
+        for compacts in (False, True):
+            ti = Traitement_image(arr, masques_compacts=compacts)
+            self.assertIsNone(ti.classes)
+            # une couche de zone ne calcule ni la mer ni le trait de côte
+            self.assertTrue((ti.routes == reference.routes).all())
+            self.assertEqual(ti._couches, {"zones"})
+            # eaux_interieur a besoin de la mer, mais pas du trait de côte
+            self.assertTrue((ti.eaux_interieur == reference.eaux_interieur).all())
+            self.assertEqual(ti._couches, {"zones", "mer"})
+            self.assertTrue((ti.trait_de_cote == reference.trait_de_cote).all())
+            self.assertTrue((ti.eaux_interieur == reference.eaux_interieur).all())
+            if compacts:
+                self.assertEqual(ti._masques["routes"].nbytes, (30 * 41 + 7) // 8)
+
+    def test_traitement_par_blocs(self):
+        rng = np.random.default_rng(7)
+        zones = np.where(rng.random((70, 95)) < 0.55, 0, rng.integers(1, 4, (70, 95)))
+        arr = COULEURS_ZONES[zones]
+        entiere = Traitement_image(arr)
+        entiere.tracer_trait_de_cote()
+        dossier = tempfile.mkdtemp()
+        try:
+            for taille_bloc in (3, 32):
+                par_blocs = Traitement_image(arr, taille_bloc=taille_bloc,
+                                             fichier_classes=os.path.join(dossier, "classes.npy"))
+                par_blocs.tracer_trait_de_cote()
+                self.assertIsInstance(par_blocs.classes, np.memmap)
+                self.assertTrue((par_blocs.classes == entiere.classes).all(), taille_bloc)
+                del par_blocs
+        finally:
+            shutil.rmtree(dossier)
+
+    def test_traitement_incremental(self):
+        # vol au hasard (pas d'une tuile, sauts, trous, retours) : après chaque tuile, le raster
+        # est celui calculé sur toute la mosaïque, tuiles manquantes en noir
+        rng = np.random.default_rng(11)
+        t = 12
+        tuiles = {}
+        incremental = Traitement_incremental(taille_tuile=t)
+        x, y = 0, 0
+        for _ in range(40):
+            if rng.random() < 0.2:
+                x, y = (int(v) for v in rng.integers(-3, 4, 2))
+            else:
+                dx, dy = ((1, 0), (-1, 0), (0, 1), (0, -1))[rng.integers(4)]
+                x, y = x + dx, y + dy
+            if (x, y) not in tuiles:
+                eau = ndimage.binary_opening(rng.random((t, t)) < 0.6)
+                tuiles[(x, y)] = COULEURS_ZONES[np.where(eau, 0, rng.integers(1, 4, (t, t)))]
+            incremental.ajouter_tuile(x, y, tuiles[(x, y)])
+            xs, ys = [a for a, _ in tuiles], [b for _, b in tuiles]
+            mosaique = np.zeros(((max(ys) - min(ys) + 1) * t, (max(xs) - min(xs) + 1) * t, 3), dtype=np.uint8)
+            for (a, b), tuile in tuiles.items():
+                mosaique[(b - min(ys)) * t:(b - min(ys) + 1) * t, (a - min(xs)) * t:(a - min(xs) + 1) * t] = tuile
+            reference = Traitement_image(mosaique)
+            reference.tracer_trait_de_cote()
+            self.assertTrue((incremental.img_array == mosaique).all())
+            self.assertTrue((incremental.classes == reference.classes).all())
+        self.assertTrue((incremental.eaux_interieur == reference.eaux_interieur).all())
+
+    def test_union_find(self):
+        ensembles = Union_find(8)
+        ensembles.unir([5, 6, 1], [6, 7, 2])
+        ensembles.unir([7], [2])
+        self.assertEqual(ensembles.racines(np.arange(8)).tolist(), [0, 1, 1, 3, 4, 1, 1, 1])
+
     def test_appliquer_masque(self):
         ti = Traitement_image(self.tmpfile)
         ti.creer_masques_couleurs()
@@ -73,6 +214,44 @@ class TestTraitementImage(unittest.TestCase):
         # les autres restent inchangés (ici noir [0,0,0])
         self.assertTrue((out_arr[0,0] == [0,0,255]).all())
 
+    def test_raster_projete_en_memoire(self):
+        # un raster .npy projeté en mémoire est utilisé sans copie
+        fichier = tempfile.NamedTemporaryFile(suffix=".npy", delete=False).name
+        raster = np.lib.format.open_memmap(fichier, mode="w+", dtype=np.uint8, shape=(10, 10, 3))
+        raster[:] = np.array(Image.open(self.tmpfile))
+        raster.flush()
+        del raster
+        ti = Traitement_image(np.load(fichier, mmap_mode="r"))
+        self.assertIsInstance(ti.img_array, np.memmap)
+        ti.creer_masques_couleurs()
+        ti.tracer_trait_de_cote()
+        reference = Traitement_image(self.tmpfile)
+        reference.creer_masques_couleurs()
+        reference.tracer_trait_de_cote()
+        self.assertTrue((ti.aquatique == reference.aquatique).all())
+        self.assertTrue((ti.trait_de_cote == reference.trait_de_cote).all())
+        self.assertEqual(ti.img.size, (10, 10))
+        del ti
+        os.remove(fichier)
+
+    def test_image_en_memoire(self):
+        img = Image.open(self.tmpfile).convert("RGB")
+        ti = Traitement_image(img)
+        self.assertIs(ti.img, img)  # image RGB gardée telle quelle
+        self.assertTrue((ti.rural == Traitement_image(self.tmpfile).rural).all())
+        reference = Kmean(self.tmpfile, methode="palette", sauvegarde=None)
+        km = Kmean(img.convert("RGBA"), methode="palette", sauvegarde=None)
+        self.assertIsNone(km.ecriture)
+        self.assertTrue((km.img_array == reference.img_array).all())
+        dossier = tempfile.mkdtemp()
+        try:
+            chemin = os.path.join(dossier, "variance.png")
+            mc = Moyenne_couleur(img, sauvegarde=chemin, asynchrone=True)
+            mc.ecriture.join()
+            self.assertTrue((np.array(Image.open(chemin)) == mc.img_array).all())
+        finally:
+            shutil.rmtree(dossier)
+
     def test_kmean_segmentation(self):
         km = Kmean(self.tmpfile)
         seg = np.array(km.segmented_img)
@@ -81,6 +260,28 @@ class TestTraitementImage(unittest.TestCase):
         expected = {(0,0,255),(34,139,34),(105,105,105),(255,215,0)}
         self.assertTrue(uniques.issubset(expected))
 
+    def test_kmean_histogramme_identique(self):
+        # image à beaucoup de pixels mais peu de couleurs distinctes, comme une carte
+        rng = np.random.default_rng(1)
+        couleurs = np.clip(np.repeat(CENTRES_CARTE, 10, axis=0) + rng.integers(-12, 13, (40, 3)), 0, 255)
+        arr = couleurs[rng.integers(0, 40, (60, 80))].astype(np.uint8)
+        reference = Kmean(arr)
+        rapide = Kmean(arr, methode="histogramme")
+        self.assertTrue((np.array(rapide.segmented_img) == np.array(reference.segmented_img)).all())
+
+    def test_kmean_palette(self):
+        km = Kmean(self.tmpfile, methode="palette")
+        seg = np.array(km.segmented_img)
+        self.assertTrue((seg[0:5, 0:5] == [0, 0, 255]).all())  # le bleu pur reste de l'eau
+        self.assertTrue((km.aquatique == (seg == [0, 0, 255]).all(axis=2)).all())
+
+    def test_table_palette_exacte(self):
+        # avec 8 bits, la table donne la couleur de référence la plus proche de chaque pixel
+        pixels = np.random.default_rng(0).integers(0, 256, (500, 1, 3), dtype=np.uint8)
+        centres = CENTRES_CARTE.astype(int)
+        attendu = ((pixels.astype(int) - centres[None]) ** 2).sum(axis=2).argmin(axis=1)
+        self.assertTrue((classer_palette(pixels, bits=8)[:, 0] == attendu).all())
+
     def test_moyenne_couleur_segmentation(self):
         mc = Moyenne_couleur(self.tmpfile, seuil_variance=0)  # forcer subdivision
         seg = np.array(mc.img)
@@ -89,6 +290,70 @@ class TestTraitementImage(unittest.TestCase):
         # au moins ces couleurs devraient apparaître
         self.assertTrue(expected & uniques)
 
+    def test_moyenne_couleur_tables_integrales(self):
+        rng = np.random.default_rng(0)
+        arr = np.clip(CENTRES_CARTE[rng.integers(0, 4, (37, 53))] + rng.integers(-9, 10, (37, 53, 3)), 0, 255)
+        arr = arr.astype(np.uint8)
+        mc = Moyenne_couleur(arr)
+        tables = mc.tables_integrales(arr)
+        zones = np.array([(0, 0, 37, 53), (3, 5, 1, 1), (10, 20, 7, 30)])
+        sommes = mc.sommes_zones(tables, *zones.T)
+        for (y0, x0, h, l), somme in zip(zones, sommes):
+            zone = arr[y0:y0 + h, x0:x0 + l].reshape(-1, 3).astype(np.int64)
+            self.assertEqual(somme.tolist(), zone.sum(0).tolist() + (zone ** 2).sum(0).tolist())
+
+        # même arbre qu'avec le calcul direct de la variance de chaque tuile
+        def recurrence_directe(tile):
+            h, l, _ = tile.shape
+            if h <= 1 or l <= 1 or (mc.variance_tile(tile) < mc.seuil_variance).all():
+                return mc.quelle_couleur(tile.reshape(-1, 3).mean(0))
+            h0, l0 = h // 2, l // 2
+            return [recurrence_directe(tile[:h0, :l0]), recurrence_directe(tile[:h0, l0:]),
+                    recurrence_directe(tile[h0:, :l0]), recurrence_directe(tile[h0:, l0:])]
+        self.assertEqual(mc.arbre, recurrence_directe(arr))
+
+    def test_quelle_couleur_lot(self):
+        def quelle_couleur_scalaire(moyenne):
+            # règles d'origine : distance de Manhattan, seuil 60, égalités -> gris
+            r, g, b = map(int, moyenne)
+            d = [abs(r - c[0]) + abs(g - c[1]) + abs(b - c[2]) for c in CENTRES_CARTE.tolist()]
+            for i in range(4):
+                if d[i] <= 60 and all(d[i] < d[j] for j in range(4) if j != i):
+                    return i
+            return 2
+        rng = np.random.default_rng(3)
+        moyennes = np.concatenate([
+            rng.uniform(140, 256, (3000, 3)),                        # autour des couleurs de la carte
+            rng.integers(180, 256, (3000, 3)).astype(float),         # entiers : beaucoup d'égalités
+            CENTRES_CARTE - [60, 0, 0],                              # exactement au seuil
+            CENTRES_CARTE - [60, 0, 0.5],                            # au-delà après troncature
+        ])
+        attendu = [quelle_couleur_scalaire(m) for m in moyennes]
+        self.assertEqual(Moyenne_couleur.quelle_couleur_lot(moyennes).tolist(), attendu)
+        mc = Moyenne_couleur(self.tmpfile)
+        self.assertEqual(mc.quelle_couleur([196.5, 229, 235]), (0, 0, 255))
+        self.assertEqual(mc.quelle_couleur([0, 0, 0]), (105, 105, 105))
+
+    def test_quadtree_en_tableaux(self):
+        rng = np.random.default_rng(2)
+        arr = rng.integers(0, 256, (45, 70, 3), dtype=np.uint8)  # bruit : presque tout est découpé
+        mc = Moyenne_couleur(arr, seuil_variance=0)
+        # les feuilles pavent exactement l'image
+        aire = sum(int((n["h"] * n["l"])[n["feuille"]].sum()) for n in mc.quadtree.niveaux)
+        self.assertEqual(aire, 45 * 70)
+        # peinture vectorisée identique au remplissage feuille par feuille
+        attendu = np.zeros((45, 70, 3), dtype=np.uint8)
+        for niveau in mc.quadtree.niveaux:
+            for y0, x0, h, l, f, c in zip(*(niveau[k] for k in ("y0", "x0", "h", "l", "feuille", "couleur"))):
+                if f:
+                    attendu[y0:y0 + h, x0:x0 + l] = COULEURS_ZONES[c]
+        self.assertTrue((mc.reconstruction() == attendu).all())
+        # aller-retour avec le format historique
+        copie = Moyenne_couleur(arr, seuil_variance=0)
+        copie.arbre = mc.arbre
+        self.assertTrue((copie.reconstruction() == attendu).all())
+        self.assertEqual(copie.quadtree.vers_imbrique(), mc.arbre)
+
 class TestDrone(unittest.TestCase):
     def setUp(self):
         self.drone = Drone()
@@ -113,6 +378,654 @@ class TestDrone(unittest.TestCase):
         os.remove("test_mosaic.png")
         shutil.rmtree("tiles")
 
+    def test_mosaique_incrementale(self):
+        # la mosaïque incrémentale doit être identique à un recollage complet
+        self.drone.download_tile = lambda x, y, z: Image.new("RGB", (256, 256), (x % 256, y % 256, 7))
+        self.drone.capture_image(48, -4, 11)
+        for direction in ["gauche", "haut", "haut", "droite", "droite", "droite", "bas", "bas", "bas", "gauche"]:
+            self.drone.deplacement(direction)
+        mosaic = self.drone.recoller(output_file=None)
+        xs = [t[0] for t in self.drone.visited_tiles]
+        ys = [t[1] for t in self.drone.visited_tiles]
+        reference = Image.new("RGB", ((max(xs) - min(xs) + 1) * 256, (max(ys) - min(ys) + 1) * 256))
+        for x, y, z in self.drone.visited_tiles:
+            reference.paste(self.drone.download_tile(x, y, z), ((x - min(xs)) * 256, (y - min(ys)) * 256))
+        self.assertEqual(mosaic.size, reference.size)
+        self.assertEqual(mosaic.tobytes(), reference.tobytes())
+        self.assertFalse(os.path.exists("mosaic.png"))
+        shutil.rmtree("tiles")
+
+class TestConversionsVectorisees(unittest.TestCase):
+    def test_latlon_vers_tuiles_comme_scalaire(self):
+        def latlon_to_tile(lat, lon, zoom):  # formule scalaire d'origine de Drone.latlon_to_tile
+            lat_rad = math.radians(lat)
+            n = 2 ** zoom
+            x = int((lon + 180.0) / 360.0 * n)
+            y = int((1.0 - math.log(math.tan(lat_rad) + 1/math.cos(lat_rad)) / math.pi) / 2.0 * n)
+            return x, y
+        lat = np.linspace(47.7, 48.8, 50)
+        lon = np.linspace(-5.1, -3.2, 50)
+        x, y = latlon_vers_tuiles(lat, lon, 13)
+        self.assertEqual(list(zip(x.tolist(), y.tolist())),
+                         [latlon_to_tile(a, b, 13) for a, b in zip(lat, lon)])
+        self.assertEqual(Drone().latlon_to_tile(48.3904, -4.4861, 13), (3993, 2834))  # Brest
+
+    def test_aller_retour_avec_pixels(self):
+        lat = np.array([47.9, 48.3, 48.75])
+        lon = np.array([-4.9, -4.1, -3.3])
+        x, y, px, py = latlon_vers_tuiles(lat, lon, 12, pixels=True)
+        self.assertTrue(((px >= 0) & (px < 256) & (py >= 0) & (py < 256)).all())
+        lat2, lon2 = tuiles_vers_latlon(x, y, 12, px, py)
+        np.testing.assert_allclose(lat2, lat, atol=1e-9)
+        np.testing.assert_allclose(lon2, lon, atol=1e-9)
+
+    def test_tuiles_de_bbox(self):
+        tuiles = tuiles_de_bbox(47.7, -5.1, 48.8, -3.2, 9)
+        x_min, y_max = Drone().latlon_to_tile(47.7, -5.1, 9)
+        x_max, y_min = Drone().latlon_to_tile(48.8, -3.2, 9)
+        attendu = [(x, y, 9) for x in range(x_min, x_max + 1) for y in range(y_min, y_max + 1)]
+        self.assertEqual([tuple(t) for t in tuiles.tolist()], attendu)
+        self.assertEqual(Drone().tiles_from_bbox(47.7, -5.1, 48.8, -3.2, 9), attendu)
+
+class TestCacheTuiles(unittest.TestCase):
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier)
+
+    def test_hits_miss_et_persistance(self):
+        cache = Cache_tuiles(self.dossier)
+        self.assertIsNone(cache.lire("src", 11, 1, 2))
+        cache.ecrire("src", 11, 1, 2, b"abcd")
+        self.assertEqual(cache.lire("src", 11, 1, 2), b"abcd")
+        stats = cache.statistiques()
+        self.assertEqual((stats["hits"], stats["miss"]), (1, 1))
+        self.assertEqual(stats["octets_economises"], 4)
+        # un nouveau cache sur le même dossier retrouve la tuile
+        self.assertEqual(Cache_tuiles(self.dossier).lire("src", 11, 1, 2), b"abcd")
+
+    def test_eviction_lru(self):
+        cache = Cache_tuiles(self.dossier, taille_max=25)
+        cache.ecrire("src", 11, 0, 0, b"a" * 10)
+        cache.ecrire("src", 11, 0, 1, b"b" * 10)
+        cache.lire("src", 11, 0, 0)              # (0,0) devient la plus récente
+        cache.ecrire("src", 11, 0, 2, b"c" * 10)  # dépasse le budget : (0,1) est évincée
+        self.assertIsNone(cache.lire("src", 11, 0, 1))
+        self.assertIsNotNone(cache.lire("src", 11, 0, 0))
+        self.assertIsNotNone(cache.lire("src", 11, 0, 2))
+        self.assertLessEqual(cache.taille(), 25)
+
+    def test_drone_utilise_le_cache(self):
+        with ServeurTuiles() as serveur:
+            drone = Drone(cache=Cache_tuiles(self.dossier))
+            drone.url_tuiles = serveur.url_tuiles
+            t1 = drone.download_tile(3, 4, 11)
+            t2 = drone.download_tile(3, 4, 11)
+            self.assertEqual(serveur.nb_requetes, 1)
+        self.assertEqual(t1.tobytes(), t2.tobytes())
+        self.assertEqual(drone.cache.hits, 1)
+
+class TestCacheSegmentation(unittest.TestCase):
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        rng = np.random.default_rng(5)
+        self.tuile = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier)
+
+    def test_hits_et_cle(self):
+        cache = Cache_segmentation()
+        appels = []
+        def classer(img):
+            appels.append(1)
+            return classer_centres(img)
+        premier = cache.segmenter(self.tuile, "centres", classer, bits=8)
+        # même contenu dans un autre tableau : repris du cache, en lecture seule
+        second = cache.segmenter(self.tuile.copy(), "centres", classer, bits=8)
+        self.assertIs(second, premier)
+        self.assertFalse(second.flags.writeable)
+        # autre paramètre ou autre méthode : nouvelle segmentation
+        cache.segmenter(self.tuile, "centres", classer, bits=5)
+        cache.segmenter(self.tuile, "autre", classer, bits=8)
+        self.assertEqual(len(appels), 3)
+        stats = cache.statistiques()
+        self.assertEqual((stats["hits"], stats["miss"], stats["entrees"]), (1, 3, 3))
+        self.assertEqual(stats["taux_hits"], 0.25)
+
+    def test_copie_en_lecture_seule(self):
+        cache = Cache_segmentation()
+        resultat = np.zeros(4, dtype=np.uint8)
+        garde = cache.ecrire("a", resultat)
+        resultat[0] = 7  # le tableau de l'appelant reste modifiable, sans changer le cache
+        self.assertFalse(garde.flags.writeable)
+        self.assertEqual(cache.lire("a")[0], 0)
+
+    def test_tuiles_identiques_segmentees_une_fois(self):
+        mer = np.full((32, 32, 3), CENTRES_CARTE[0], dtype=np.uint8)
+        terre = self.tuile
+        cache = Cache_segmentation()
+        # Traitement_incremental : zones et composantes de la pleine mer calculées une fois
+        appels = []
+        incremental = Traitement_incremental(taille_tuile=32, cache=cache)
+        zones_tuile = incremental.zones_tuile
+        incremental.zones_tuile = lambda tuile: appels.append(1) or zones_tuile(tuile)
+        incremental.ajouter_tuiles([(x, 0, mer) for x in range(6)] + [(6, 0, terre)])
+        self.assertEqual(len(appels), 2)
+        reference = Traitement_incremental(taille_tuile=32)
+        reference.ajouter_tuiles([(x, 0, mer) for x in range(6)] + [(6, 0, terre)])
+        self.assertTrue((incremental.classes == reference.classes).all())
+        # Moyenne_couleur par tuile : un seul arbre pour les tuiles de mer
+        miss = cache.miss
+        for _ in range(6):
+            reconstruite = Moyenne_couleur.segmenter_tuile(mer, cache=cache)
+        self.assertEqual(cache.miss, miss + 1)
+        self.assertTrue((reconstruite == Moyenne_couleur(mer, sauvegarde=None).img_array).all())
+
+    def test_eviction_lru_et_persistance(self):
+        fichier = os.path.join(self.dossier, "segmentation.npz")
+        cache = Cache_segmentation(taille_max=25, fichier=fichier)
+        a, b, c = (np.full(10, v, dtype=np.uint8) for v in (1, 2, 3))
+        cache.ecrire("a", a)
+        cache.ecrire("b", b)
+        cache.lire("a")            # "a" devient le plus récent
+        cache.ecrire("c", c)       # dépasse le budget : "b" est évincé
+        self.assertIsNone(cache.lire("b"))
+        self.assertEqual(cache.statistiques()["evictions"], 1)
+        self.assertLessEqual(cache.taille(), 25)
+        cache.sauvegarder()
+        relu = Cache_segmentation(taille_max=25, fichier=fichier)
+        self.assertTrue((relu.lire("a") == a).all())
+        self.assertTrue((relu.lire("c") == c).all())
+        self.assertIsNone(relu.lire("b"))
+
+    def test_kmean_et_moyenne_couleur(self):
+        cache = Cache_segmentation()
+        for methode in ("palette", "histogramme"):
+            attendu = Kmean(self.tuile, methode=methode, sauvegarde=None).img_array
+            for _ in range(2):
+                km = Kmean(self.tuile, methode=methode, sauvegarde=None, cache=cache)
+                self.assertTrue((km.img_array == attendu).all())
+        reference = Moyenne_couleur(self.tuile, seuil_variance=0, sauvegarde=None)
+        Moyenne_couleur(self.tuile, seuil_variance=0, sauvegarde=None, cache=cache)
+        mc = Moyenne_couleur(self.tuile, seuil_variance=0, sauvegarde=None, cache=cache)
+        self.assertTrue((mc.img_array == reference.img_array).all())
+        # l'arbre n'a pas été construit, il l'est à la demande
+        self.assertIsNone(mc._quadtree)
+        self.assertEqual(mc.arbre, reference.arbre)
+        self.assertEqual(cache.statistiques()["hits"], 3)
+
+class TestSessionHTTP(unittest.TestCase):
+    def test_reessaie_apres_erreurs_5xx(self):
+        with ServeurTuiles(nb_erreurs=2, latence=0.01) as serveur:
+            drone = Drone(session=creer_session(nb_essais=3, backoff=0.01, jitter=0.01))
+            drone.url_tuiles = serveur.url_tuiles
+            tuile = drone.download_tile(5, 6, 11)
+            self.assertEqual(serveur.nb_requetes, 3)
+        self.assertEqual(tuile.getpixel((255, 255)), ServeurTuiles.couleur(11, 5, 6))
+
+    def test_abandon_apres_trop_d_erreurs(self):
+        with ServeurTuiles(nb_erreurs=10) as serveur:
+            drone = Drone(session=creer_session(nb_essais=2, backoff=0.01, jitter=0.0))
+            drone.url_tuiles = serveur.url_tuiles
+            with self.assertRaises(requests.HTTPError):
+                drone.download_tile(5, 6, 11)
+            self.assertEqual(serveur.nb_requetes, 3)  # 1 essai + 2 nouvelles tentatives
+
+    def test_timeout_par_requete(self):
+        with ServeurTuiles(latence=0.5) as serveur:
+            drone = Drone(session=creer_session(nb_essais=0))
+            drone.url_tuiles = serveur.url_tuiles
+            drone.timeout = (1, 0.1)
+            with self.assertRaises(requests.RequestException):
+                drone.download_tile(5, 6, 11)
+
+    def test_connexions_reutilisees(self):
+        with ServeurTuiles() as serveur:
+            drone = Drone(session=creer_session())
+            drone.url_tuiles = serveur.url_tuiles
+            for x in range(5):
+                drone.download_tile(x, 0, 11)
+            pool = drone.session.get_adapter(serveur.url_tuiles).poolmanager
+            self.assertEqual(len(pool.pools), 1)
+            cle, = pool.pools.keys()
+            self.assertEqual(pool.pools[cle].num_connections, 1)
+
+class TestPrechargement(unittest.TestCase):
+    def setUp(self):
+        self.appels = []
+        def telecharger(x, y, z):
+            self.appels.append((x, y, z))
+            return Image.new("RGB", (256, 256), (x % 256, y % 256, 0))
+        self.drone = Drone(prechargement=True, taille_memoire=20)
+        self.drone.download_tile = telecharger
+
+    def tearDown(self):
+        self.drone.arreter_prechargement()
+        shutil.rmtree("tiles", ignore_errors=True)
+
+    def attendre(self):
+        """Attend la fin des préchargements : plus aucun nouveau téléchargement pendant 50 ms."""
+        fin = time.monotonic() + 5
+        vus = -1
+        while len(self.appels) != vus and time.monotonic() < fin:
+            vus = len(self.appels)
+            time.sleep(0.05)
+
+    def test_deplacement_servi_depuis_la_memoire(self):
+        self.drone.capture_image(48, -4, 11, contraste=1.0)
+        self.attendre()
+        x, y = self.drone.x, self.drone.y
+        self.assertEqual(len(self.appels), 9)  # la tuile et ses 8 voisines
+        nb_appels = len(self.appels)
+        self.drone.deplacement("droite")
+        tuile = Image.open(f"tiles/tuile_11_{x + 1}_{y}.png")
+        self.assertEqual(tuile.getpixel((0, 0))[:2], ((x + 1) % 256, y % 256))
+        self.assertEqual(self.drone.prechargement_hits, 1)
+        self.attendre()
+        # seules les 3 nouvelles voisines sont téléchargées
+        self.assertEqual(len(self.appels), nb_appels + 3)
+        self.drone.deplacement("gauche")
+        self.assertEqual(self.drone.taux_prechargement(), 2 / 3)
+
+    def test_memoire_bornee(self):
+        def aller_retour(drone):
+            drone.capture_image(48, -4, 11)
+            for direction in ["bas"] * 10 + ["haut"] * 10:
+                self.attendre()
+                drone.deplacement(direction)
+            self.attendre()
+            self.assertEqual(drone.prechargement_hits, 20)  # chaque déplacement vient de la mémoire
+        # mémoire bornée à 20 tuiles : celles du départ ont été oubliées et sont retéléchargées
+        aller_retour(self.drone)
+        self.assertGreater(len(self.appels), len(set(self.appels)))
+        # mémoire assez grande : aucune tuile n'est téléchargée deux fois
+        self.appels.clear()
+        drone = Drone(prechargement=True, taille_memoire=1000)
+        drone.download_tile = self.drone.download_tile
+        try:
+            aller_retour(drone)
+        finally:
+            drone.arreter_prechargement()
+        self.assertEqual(len(self.appels), len(set(self.appels)))
+
+class TestStockageTuiles(unittest.TestCase):
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dossier)
+
+    @staticmethod
+    def tuile(x, y):
+        return Image.new("RGB", (256, 256), (x % 256, y % 256, 9))
+
+    def test_mbtiles_lots_et_lecture_par_zone(self):
+        stockage = Stockage_mbtiles(os.path.join(self.dossier, "t.mbtiles"), taille_lot=4)
+        for x in range(10, 13):
+            for y in range(20, 23):
+                stockage.ecrire(12, x, y, self.tuile(x, y))
+        # les 9 tuiles sont lisibles, qu'elles soient déjà insérées ou encore dans le lot
+        self.assertEqual(stockage.lire(12, 12, 22).getpixel((0, 0)), (12, 22, 9))
+        zone = {(x, y): t.getpixel((0, 0)) for x, y, t in stockage.lire_zone(12, 11, 12, 20, 21)}
+        self.assertEqual(zone, {(x, y): (x, y, 9) for x in (11, 12) for y in (20, 21)})
+        self.assertIsNone(stockage.lire(12, 0, 0))
+        stockage.fermer()
+        # persistance et convention TMS du format MBTiles
+        relu = Stockage_mbtiles(os.path.join(self.dossier, "t.mbtiles"))
+        ligne = relu._connexion.execute(
+            "SELECT tile_row FROM tiles WHERE zoom_level=12 AND tile_column=10 ORDER BY tile_row").fetchone()
+        self.assertEqual(ligne[0], 2 ** 12 - 1 - 22)
+        self.assertEqual(relu.lire(12, 10, 20).getpixel((0, 0)), (10, 20, 9))
+        relu.fermer()
+
+    def test_classe_mere_abstraite_et_fichier_referme(self):
+        class Incomplet(Stockage_tuiles):
+            def ecrire(self, zoom, x, y, tuile):
+                return None
+        with self.assertRaises(TypeError):  # lire manque : erreur dès la création
+            Incomplet()
+        stockage = Stockage_dossier(self.dossier)
+        chemin = stockage.ecrire(12, 3, 4, self.tuile(3, 4))
+        tuile = stockage.lire(12, 3, 4)
+        os.remove(chemin)  # la tuile est déjà lue, son fichier n'est plus ouvert
+        self.assertEqual(tuile.getpixel((0, 0)), (3, 4, 9))
+
+    def test_drone_recolle_depuis_le_stockage(self):
+        for stockage in (Stockage_dossier(os.path.join(self.dossier, "tiles")),
+                         Stockage_mbtiles(os.path.join(self.dossier, "t.mbtiles"))):
+            drone = Drone(stockage=stockage)
+            drone.download_tile = lambda x, y, z: self.tuile(x, y)
+            drone.capture_image(48, -4, 11)
+            drone.deplacement("droite")
+            drone.deplacement("bas")
+            attendu = drone.recoller(output_file=None).tobytes()
+            # mosaïque perdue : elle est relue depuis le stockage
+            relu = Drone(stockage=stockage)
+            relu.visited_tiles = list(drone.visited_tiles)
+            self.assertEqual(relu.recoller(output_file=None).tobytes(), attendu)
+            stockage.fermer()
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.drone = Drone()
+        self.en_cours = 0
+        self.max_en_cours = 0
+        def telecharger(x, y, z):
+            self.en_cours += 1
+            self.max_en_cours = max(self.max_en_cours, self.en_cours)
+            arr = np.zeros((256, 256, 3), dtype=np.uint8)
+            arr[:] = (195, 229, 235) if (x + y) % 3 else (218, 238, 199)  # eau / rural
+            arr[100:140, :] = (255, 255, 150)                              # une route
+            self.en_cours -= 1
+            return Image.fromarray(arr)
+        self.drone.download_tile = telecharger
+        self.tuiles = [(x, y, 12) for x in range(4) for y in range(3)]
+
+    def test_resultats_par_tuile(self):
+        flux = flux_segmentation(self.drone, self.tuiles, profondeur=3)
+        premier = next(flux)
+        self.assertEqual(premier.segmentee.shape, (256, 256, 3))
+        self.assertTrue(premier.masques.routes[100:140].all())
+        resultats = [premier] + list(flux)
+        self.assertEqual(sorted((r.x, r.y, r.zoom) for r in resultats), sorted(self.tuiles))
+        self.assertLessEqual(self.max_en_cours, 3)
+
+    def test_cache_segmentation(self):
+        # deux contenus de tuile distincts (eau, rural) : seuls deux calculs
+        cache = Cache_segmentation()
+        resultats = list(flux_segmentation(self.drone, self.tuiles, profondeur=1, cache=cache))
+        self.assertEqual((cache.hits, cache.miss), (len(self.tuiles) - 2, 2))
+        for r in resultats:
+            attendu = classer_centres(np.asarray(self.drone.download_tile(r.x, r.y, r.zoom)))
+            self.assertTrue((r.segmentee == attendu).all())
+
+    def test_assemblage_identique_au_traitement_global(self):
+        helper = assembler(flux_segmentation(self.drone, self.tuiles))
+        mosaic = np.zeros((3 * 256, 4 * 256, 3), dtype=np.uint8)
+        for x, y, z in self.tuiles:
+            mosaic[y * 256:(y + 1) * 256, x * 256:(x + 1) * 256] = np.asarray(self.drone.download_tile(x, y, z))
+        reference = Traitement_image(classer_centres(mosaic))
+        reference.creer_masques_couleurs()
+        reference.tracer_trait_de_cote()
+        reference.trouver_eaux_interieur()
+        for attr in ("aquatique", "rural", "routes", "mer", "trait_de_cote", "eaux_interieur"):
+            self.assertTrue((getattr(helper, attr) == getattr(reference, attr)).all(), attr)
+
+    def test_kmean_incremental(self):
+        km = Kmean_incremental()
+        tuiles = [(x, y, self.drone.download_tile(x, y, z)) for x, y, z in self.tuiles[:6]]
+        km.ajouter_tuiles(tuiles)
+        # premier appel : même résultat que K-means sur la mosaïque complète
+        mosaic = np.zeros((3 * 256, 2 * 256, 3), dtype=np.uint8)
+        for x, y, tuile in tuiles:
+            mosaic[y * 256:(y + 1) * 256, x * 256:(x + 1) * 256] = np.asarray(tuile)
+        reference = Kmean(mosaic, methode="histogramme")
+        self.assertTrue((np.array(km.image()) == reference.img_array).all())
+        # déplacement : seule la nouvelle tuile est étiquetée, le reste ne bouge pas
+        avant = np.array(km.image())
+        comptes = km.comptes.sum()
+        km.ajouter_tuiles([(2, 0, self.drone.download_tile(2, 0, 12))] + tuiles)
+        apres = np.array(km.image())
+        self.assertEqual(apres.shape, (3 * 256, 3 * 256, 3))
+        self.assertTrue((apres[:, :512] == avant).all())
+        self.assertTrue((apres[100:140, 512:] == (255, 215, 0)).all())
+        self.assertEqual(km.comptes.sum(), comptes + 256 * 256)  # seuls les pixels de la tuile (2, 0)
+
+class TestCalculParallele(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.parallele = Calcul_parallele(processus=2)
+        rng = np.random.default_rng(4)
+        cls.arr = np.clip(CENTRES_CARTE[rng.integers(0, 4, (67, 91))] + rng.integers(-9, 10, (67, 91, 3)), 0, 255)
+        cls.arr = cls.arr.astype(np.uint8)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.parallele.fermer()
+
+    def test_segmentation_et_masques_identiques(self):
+        for methode in ("palette", "histogramme"):
+            reference = Kmean(self.arr, methode=methode)
+            parallele = Kmean(self.arr, methode=methode, parallele=self.parallele)
+            self.assertTrue((parallele.img_array == reference.img_array).all(), methode)
+            reference.tracer_trait_de_cote()
+            parallele.tracer_trait_de_cote()
+            self.assertTrue((parallele.classes == reference.classes).all(), methode)
+
+    def test_quadtree_identique(self):
+        for seuil in (0, 50, 10 ** 6):  # tout découpé, cas courant, racine seule feuille
+            reference = Moyenne_couleur(self.arr, seuil_variance=seuil)
+            parallele = Moyenne_couleur(self.arr, seuil_variance=seuil, parallele=self.parallele)
+            self.assertTrue((parallele.img_array == reference.img_array).all(), seuil)
+            self.assertEqual(len(parallele.quadtree.niveaux), len(reference.quadtree.niveaux))
+            for niveau, attendu in zip(parallele.quadtree.niveaux, reference.quadtree.niveaux):
+                for cle in attendu:
+                    self.assertTrue((niveau[cle] == attendu[cle]).all(), (seuil, cle))
+
+    def test_tableaux_partages_sans_copie(self):
+        reference = Kmean(self.arr, methode="palette")
+        reference.tracer_trait_de_cote()
+        quadtree = Moyenne_couleur(self.arr)
+        table = table_classes()
+        hauteur, largeur, _ = self.arr.shape
+        with Tableau_partage.copie(self.arr) as img, Tableau_partage((hauteur, largeur), table.dtype) as classes, \
+                Tableau_partage((hauteur, largeur, 3), np.uint8) as reconstruite:
+            # les processus écrivent dans les tableaux donnés, qui sont renvoyés tels quels
+            rendu = self.parallele.classer(img, table, sortie=classes)
+            self.assertIs(rendu, classes.tableau)
+            self.assertTrue((classes.tableau == table[codes_rgb(self.arr)]).all())
+            _, rendu = self.parallele.construire_arbre(img, 50, sortie=reconstruite)
+            self.assertIs(rendu, reconstruite.tableau)
+            self.assertTrue((reconstruite.tableau == quadtree.img_array).all())
+            # trait de côte mis à jour en place
+            with Tableau_partage.copie(reference.classes & ~np.uint8(BIT_TRAIT_DE_COTE)) as raster:
+                self.parallele.contour_mer(raster)
+                self.assertTrue((raster.tableau == reference.classes).all())
+            with self.assertRaises(ValueError):
+                self.parallele.classer(img, table, sortie=reconstruite)
+            del rendu
+
+class TestDroneFinal(unittest.TestCase):
+    """Drone de Programme_final_20_mai, contre le serveur de tuiles local."""
+    ZONE = (48.30, 48.45, -4.60, -4.40)  # lat_min, lat_max, lon_min, lon_max
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.serveur = ServeurTuiles().demarrer()
+
+    def tearDown(self):
+        self.serveur.arreter()
+        shutil.rmtree(self.dossier)
+
+    def drone(self, **options):
+        drone = Drone_final.Drone(**options)
+        drone.url_tuiles = self.serveur.url_tuiles
+        return drone
+
+    def capturer(self, zoom, fichier_raster=None):
+        lat_min, lat_max, lon_min, lon_max = self.ZONE
+        drone = self.drone()
+        drone.capture_image(lat_min, lon_min, lat_max, lon_max, zoom, fichier_raster=fichier_raster)
+        return drone.captured_image
+
+    def test_telechargement_parallele(self):
+        lat_min, lat_max, lon_min, lon_max = self.ZONE
+        tuiles = self.drone().tiles_from_bbox(lat_min, lon_min, lat_max, lon_max, 12)
+        self.assertGreater(len(tuiles), 4)
+        mosaiques = {n: self.drone(nb_workers=n).create_image_from_tiles(tuiles) for n in (1, 8)}
+        self.assertEqual(mosaiques[1].tobytes(), mosaiques[8].tobytes())
+        # chaque tuile est à sa place (pas de carré noir)
+        min_x, min_y = min(t[0] for t in tuiles), min(t[1] for t in tuiles)
+        for x, y, zoom in tuiles:
+            attendue = self.drone().telecharger_tuile(x, y, zoom)
+            boite = ((x - min_x) * 256, (y - min_y) * 256, (x - min_x + 1) * 256, (y - min_y + 1) * 256)
+            self.assertEqual(mosaiques[8].crop(boite).tobytes(), attendue.tobytes())
+
+    def test_tuile_en_erreur(self):
+        lat_min, lat_max, lon_min, lon_max = self.ZONE
+        drone = self.drone(nb_workers=8)
+        tuiles = drone.tiles_from_bbox(lat_min, lon_min, lat_max, lon_max, 12)
+        en_panne = tuiles[len(tuiles) // 2]
+        telecharger = drone.telecharger_tuile
+        def telecharger_tuile(x, y, zoom):
+            if (x, y, zoom) == en_panne:
+                raise requests.HTTPError("503 Server Error")
+            return telecharger(x, y, zoom)
+        drone.telecharger_tuile = telecharger_tuile
+        # l'erreur remonte au lieu de laisser un carré noir dans la mosaïque
+        with self.assertRaises(requests.HTTPError):
+            drone.create_image_from_tiles(tuiles)
+        with self.assertRaises(requests.HTTPError):
+            drone.create_raster_from_tiles(tuiles, os.path.join(self.dossier, "raster.npy"))
+        with self.assertRaises(requests.HTTPError):
+            drone.capture_image(lat_min, lon_min, lat_max, lon_max, 12)
+        self.assertIsNone(drone.captured_image)
+
+    def test_raster_identique_a_l_image(self):
+        for zoom in (10, 11):
+            image = self.capturer(zoom)
+            raster = self.capturer(zoom, fichier_raster=os.path.join(self.dossier, f"raster_{zoom}.npy"))
+            self.assertIsInstance(raster, np.memmap)
+            # mosaïque et contraste : octet pour octet
+            self.assertEqual(raster.shape, (image.height, image.width, 3))
+            self.assertEqual(raster.tobytes(), image.tobytes())
+            # contraste par bandes de quelques lignes : même résultat qu'en une fois
+            bandes = np.array(raster)
+            Drone_final.Drone().enhance_contrast_raster(bandes, facteur=1.3, hauteur_bande=100)
+            attendu = Drone_final.Drone().enhance_contrast(image, facteur=1.3)
+            self.assertEqual(bandes.tobytes(), attendu.tobytes())
+            # segmentation : mêmes labels sur le raster projeté et sur l'image
+            sur_raster, sur_image = Main.TraitementImage(), Main.TraitementImage()
+            sur_raster.k_means(raster)
+            sur_image.k_means(image, methode="histogramme")
+            self.assertTrue((sur_raster.labels == sur_image.labels).all())
+            self.assertEqual(sur_raster.segmented_img.tobytes(), sur_image.segmented_img.tobytes())
+
+class TestPyramide(unittest.TestCase):
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.serveur = ServeurTuiles().demarrer()
+        self.drone = Drone_final.Drone()
+        self.drone.url_tuiles = self.serveur.url_tuiles
+        self.demandees = []  # (x, y, zoom) téléchargées
+
+    def tearDown(self):
+        self.serveur.arreter()
+        shutil.rmtree(self.dossier)
+
+    def telecharger(self, x, y, zoom):
+        self.demandees.append((x, y, zoom))
+        return self.drone.telecharger_tuile(x, y, zoom)
+
+    def fichiers(self):
+        return [os.path.join(racine, nom) for racine, _, noms in os.walk(self.dossier) for nom in noms]
+
+    def test_tuile_derivee_sans_requete(self):
+        pyr = pyramide.PyramideTuiles(self.telecharger, 12, self.dossier)
+        derivee = pyr.tuile(5, 7, 11)
+        # seules les quatre filles sont téléchargées, pas la tuile du zoom 11
+        self.assertEqual(sorted(self.demandees), [(10, 14, 12), (10, 15, 12), (11, 14, 12), (11, 15, 12)])
+        self.assertEqual(self.serveur.nb_requetes, 4)
+        self.assertEqual((pyr.nb_telechargees, pyr.nb_derivees), (4, 1))
+        # réduction 2x2 (BOX) des filles
+        filles = Image.new("RGB", (512, 512))
+        for dx in (0, 1):
+            for dy in (0, 1):
+                filles.paste(self.drone.telecharger_tuile(10 + dx, 14 + dy, 12), (dx * 256, dy * 256))
+        self.assertEqual(derivee.tobytes(), filles.resize((256, 256), Image.BOX).tobytes())
+        # relue sur disque ensuite, sans rien télécharger ni dériver
+        self.assertEqual(pyr.tuile(5, 7, 11).tobytes(), derivee.tobytes())
+        self.assertEqual((pyr.nb_telechargees, pyr.nb_derivees, pyr.nb_relues), (4, 1, 1))
+
+    def test_meme_tuile_demandee_en_meme_temps(self):
+        commence, libere = threading.Event(), threading.Event()
+        def telecharger(x, y, zoom):
+            commence.set()
+            libere.wait(5)
+            return self.telecharger(x, y, zoom)
+        pyr = pyramide.PyramideTuiles(telecharger, 12, self.dossier)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            premiere = pool.submit(pyr.tuile, 3, 4, 12)
+            commence.wait(5)
+            autres = [pool.submit(pyr.tuile, 3, 4, 12) for _ in range(3)]
+            time.sleep(0.2)  # les autres demandes attendent la Future de la première
+            libere.set()
+            tuiles = [premiere.result()] + [f.result() for f in autres]
+        self.assertEqual(self.demandees, [(3, 4, 12)])
+        for tuile in tuiles[1:]:
+            self.assertIs(tuile, tuiles[0])
+        self.assertEqual(pyr._en_cours, {})
+
+    def test_ecriture_atomique(self):
+        pyr = pyramide.PyramideTuiles(self.telecharger, 12, self.dossier)
+        pyr.tuile(5, 7, 11)
+        self.assertEqual(sorted(os.path.relpath(f, self.dossier) for f in self.fichiers()),
+                         sorted(os.path.relpath(pyr.chemin(*t), self.dossier)
+                                for t in [(5, 7, 11)] + self.demandees))
+        # écriture qui échoue (un PNG ne peut pas être en CMYK) : ni tuile, ni fichier temporaire
+        pyr = pyramide.PyramideTuiles(lambda x, y, zoom: Image.new("CMYK", (256, 256)), 12, self.dossier)
+        with self.assertRaises(OSError):
+            pyr.tuile(0, 0, 12)
+        self.assertFalse(os.path.exists(pyr.chemin(0, 0, 12)))
+        self.assertEqual([f for f in self.fichiers() if f.endswith(".tmp")], [])
+        self.assertEqual(pyr._en_cours, {})
+
+class TestMission(unittest.TestCase):
+    ZONE = (48.30, 48.45, -4.60, -4.40)  # lat_min, lat_max, lon_min, lon_max
+
+    def setUp(self):
+        self.dossier = tempfile.mkdtemp()
+        self.serveur = ServeurTuiles().demarrer()
+
+    def tearDown(self):
+        self.serveur.arreter()
+        shutil.rmtree(self.dossier)
+
+    def mission(self, zooms, **options):
+        m = Main.Mission("test", len(zooms), *self.ZONE, zooms, max_paralleles=2, **options)
+        for drone in m.liste_drones:
+            drone.url_tuiles = self.serveur.url_tuiles
+        return m
+
+    def test_rapport_et_labels(self):
+        for dossier_raster in (None, os.path.join(self.dossier, "rasters")):
+            m = self.mission([10, 11], dossier_raster=dossier_raster)
+            m.lancer_reconnaissance()
+            resultats = m.segmenter_images()
+            self.assertEqual(sorted(resultats), [0, 1])
+            for i, drone in enumerate(m.liste_drones):
+                rapport = m.rapport[i]
+                self.assertEqual((rapport["zoom"], rapport["statut"]), (m.liste_zoom[i], "segmenté"))
+                self.assertEqual(rapport["nb_tuiles"], drone.num_tiles)
+                self.assertGreater(rapport["nb_tuiles"], 0)
+                self.assertIn("duree_capture", rapport)
+                self.assertIn("duree_segmentation", rapport)
+                # l'image est celle du drone (un raster projeté le reste), les labels ceux d'un calcul local
+                self.assertIs(resultats[i].img, drone.captured_image)
+                self.assertEqual(isinstance(resultats[i].img, np.memmap), dossier_raster is not None)
+                attendu = Main.TraitementImage()
+                attendu.k_means(np.array(drone.captured_image), methode="histogramme")
+                self.assertTrue((resultats[i].labels == attendu.labels).all())
+                self.assertEqual(resultats[i].segmented_img.tobytes(), attendu.segmented_img.tobytes())
+
+    def test_erreurs_dans_le_rapport(self):
+        m = self.mission([10, 11])
+        def panne(x, y, zoom):
+            raise requests.ConnectionError("serveur injoignable")
+        m.liste_drones[0].telecharger_tuile = panne
+        m.lancer_reconnaissance()
+        self.assertEqual(m.rapport[0]["statut"], "erreur capture")
+        self.assertIn("serveur injoignable", m.rapport[0]["erreur"])
+        self.assertIsNone(m.liste_drones[0].captured_image)
+        self.assertEqual(m.rapport[1]["statut"], "capturé")
+        m.liste_drones[1].captured_image = np.zeros((4, 4), dtype=np.uint8)  # pas une image RGB
+        self.assertEqual(m.segmenter_images(), {})
+        self.assertEqual(m.rapport[0]["statut"], "erreur capture")  # pas segmenté : rien de capturé
+        self.assertEqual(m.rapport[1]["statut"], "erreur segmentation")
+        self.assertIn("erreur", m.rapport[1])
+
 class TestAccueil(unittest.TestCase):
     def setUp(self):
         self.ui = AccueilUI()
@@ -155,5 +1068,53 @@ class TestExploFinistere(unittest.TestCase):
         self.assertEqual(ew.mission_name,"M")
         self.assertEqual(ew.zoom,12)
 
+    def vol(self, dossier, cache):
+        """
+        Vol ligne par ligne au-dessus de la pleine mer (tuiles identiques) bordée de terre
+        à gauche, filtré avec chaque méthode après chaque déplacement ; renvoie les vues affichées.
+        """
+        rng = np.random.default_rng(6)
+        terre = {y: np.clip(CENTRES_CARTE[rng.integers(0, 4, (256, 256))] + rng.integers(-9, 10, (256, 256, 3)),
+                            0, 255).astype(np.uint8) for y in range(3)}
+        mer = np.full((256, 256, 3), CENTRES_CARTE[0], dtype=np.uint8)
+        os.makedirs(dossier)
+        ew = ExploWindow("M", 48.0, -4.0, 12, fichier_tuiles=os.path.join(dossier, "tiles.mbtiles"))
+        fenetre = QtWidgets.QMainWindow()
+        ew.setupUi(fenetre)
+        ew.drone.stockage.fermer()
+        ew.drone = Drone(stockage=Stockage_dossier(os.path.join(dossier, "tiles")))
+        x0, _ = ew.drone.latlon_to_tile(ew.lat, ew.lon, ew.zoom)
+        ew.drone.download_tile = lambda x, y, z: Image.fromarray(terre[y % 3] if x < x0 else mer)
+        ew.cache_segmentation = cache
+        for cb in ew.terrainMenu.checkboxes:
+            cb.setChecked(True)
+        vues = []
+        ew.affichage = lambda img: vues.append(np.array(img))
+        def filtrer():
+            for methode in ("Satellite", "K-means", "Variance"):
+                ew.comboMethod.setCurrentText(methode)
+                ew.traitement_et_affichage()
+        ew.capture()  # premier ajustement du K-means sur une tuile de mer
+        filtrer()
+        for direction in ["droite"] * 2 + ["bas"] + ["gauche"] * 3 + ["bas"] + ["droite"] * 3:
+            ew.move(direction)
+            filtrer()
+        if ew.parallele is not None:
+            ew.parallele.fermer()
+        return vues
+
+    def test_vol_identique_avec_et_sans_cache(self):
+        dossier = tempfile.mkdtemp()
+        try:
+            cache = Cache_segmentation()
+            sans_cache = self.vol(os.path.join(dossier, "sans"), None)
+            avec_cache = self.vol(os.path.join(dossier, "avec"), cache)
+        finally:
+            shutil.rmtree(dossier)
+        self.assertGreater(cache.hits, 0)
+        self.assertEqual(len(avec_cache), len(sans_cache))
+        for i, (vue, attendue) in enumerate(zip(avec_cache, sans_cache)):
+            self.assertTrue((vue == attendue).all(), i)
+
 if __name__ == "__main__":
     unittest.main()
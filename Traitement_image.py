@@ -1,82 +1,487 @@
+import threading
 import numpy as np
 from PIL import Image
 from scipy import ndimage
 from sklearn.cluster import KMeans
 
+#Couleurs de la carte d'origine : eau, rural, urbain, routes
+CENTRES_CARTE = np.array([
+    [195, 229, 235],
+    [218, 238, 199],
+    [255, 255, 249],
+    [255, 255, 150]
+], dtype=np.uint8)
+
+#Couleurs utilisées pour afficher chaque zone segmentée (même ordre)
+COULEURS_ZONES = np.array([
+    [0,   0,   255],
+    [34, 139,  34],
+    [105,105, 105],
+    [255,215,   0]
+], dtype=np.uint8)
+
+#Raster de classes (Traitement_image.classes), un octet par pixel : indice de la zone dans
+#COULEURS_ZONES sur les 4 bits de poids faible (AUCUNE_ZONE si la couleur n'en est pas une),
+#plus un bit pour la mer et un pour le trait de côte
+AUCUNE_ZONE = 4
+BIT_MER = 0x40
+BIT_TRAIT_DE_COTE = 0x80
+
+def _tables_masques():
+    """Pour chaque masque, table octet du raster de classes -> booléen."""
+    octets = np.arange(256)
+    zone, mer, trait = octets & 0x0F, (octets & BIT_MER) != 0, (octets & BIT_TRAIT_DE_COTE) != 0
+    return {
+        "aquatique": zone == 0,
+        "rural": zone == 1,
+        "urbain": zone == 2,
+        "routes": zone == 3,
+        "mer": mer,
+        "trait_de_cote": trait,
+        "eaux_interieur": (zone == 0) & ~mer,
+    }
+
+TABLES_MASQUES = _tables_masques()
+#Couches du raster de classes dont dépend chaque masque
+COUCHES_MASQUES = {
+    "aquatique": {"zones"}, "rural": {"zones"}, "urbain": {"zones"}, "routes": {"zones"},
+    "mer": {"mer"}, "trait_de_cote": {"trait_de_cote"}, "eaux_interieur": {"zones", "mer"},
+}
+#Couches dont dépend le calcul de chaque couche : la mer part des zones aquatiques,
+#le trait de côte est le contour de la mer
+DEPENDANCES_COUCHES = {"zones": set(), "mer": {"zones"}, "trait_de_cote": {"mer"}}
+
+_tables_palette = {}
+_verrou_tables = threading.Lock()
+_table_classes = None
+
+
+def codes_rgb(img_array: np.ndarray) -> np.ndarray:
+    """Couleur de chaque pixel codée sur un entier : R << 16 | G << 8 | B."""
+    return (img_array[..., 0].astype(np.uint32) << 16) | (img_array[..., 1].astype(np.uint32) << 8) | img_array[..., 2]
+
+
+def table_classes() -> np.ndarray:
+    """Table code RGB (2**24 entrées, 16 Mo) -> indice de COULEURS_ZONES ou AUCUNE_ZONE, calculée une fois."""
+    global _table_classes
+    with _verrou_tables:
+        if _table_classes is None:
+            table = np.full(1 << 24, AUCUNE_ZONE, dtype=np.uint8)
+            table[codes_rgb(COULEURS_ZONES)] = np.arange(len(COULEURS_ZONES))
+            _table_classes = table
+    return _table_classes
+
+def table_palette(bits: int = 5, k: int = 4) -> np.ndarray:
+    """
+    Table de correspondance (2**bits)**3 -> indice de zone : pour chaque couleur RGB
+    quantifiée sur `bits` bits par canal, l'indice de la couleur de référence
+    (CENTRES_CARTE[:k]) la plus proche, comme à l'affectation de K-means.
+    Calculée une seule fois par (bits, k) ; avec bits=8 elle est exacte (16 Mo).
+    """
+    with _verrou_tables:  # plusieurs threads du pipeline peuvent la demander en même temps
+        if (bits, k) not in _tables_palette:
+            _tables_palette[(bits, k)] = _construire_table(bits, k)
+    return _tables_palette[(bits, k)]
+
+
+def _construire_table(bits, k):
+    """Calcule la table de table_palette."""
+    n = 2 ** bits
+    decalage = 8 - bits
+    # centre de chaque case de quantification
+    niveaux = (np.arange(n) << decalage) + ((1 << decalage) >> 1)
+    centres = CENTRES_CARTE[:k].astype(np.int32)
+    gb = np.stack(np.meshgrid(niveaux, niveaux, indexing="ij"), axis=-1).reshape(-1, 2)
+    d_gb = ((gb[:, None, :] - centres[None, :, 1:]) ** 2).sum(axis=2)
+    table = np.empty((n, n * n), dtype=np.uint8)
+    for i, r in enumerate(niveaux):  # une tranche de R à la fois pour borner la mémoire
+        table[i] = (d_gb + (r - centres[:, 0]) ** 2).argmin(axis=1)
+    return table.reshape(n, n, n)
+
+
+def classer_palette(img_array: np.ndarray, bits: int = 5, k: int = 4) -> np.ndarray:
+    """Indice de zone (hauteur, largeur) de chaque pixel, en une seule lecture de table."""
+    decalage = 8 - bits
+    table = table_palette(bits, k)
+    return table[img_array[..., 0] >> decalage, img_array[..., 1] >> decalage, img_array[..., 2] >> decalage]
+
+
+def kmeans_histogramme(pixels: np.ndarray, init: np.ndarray, k: int = 4):
+    """
+    K-means sur les couleurs distinctes de `pixels` (N, 3) pondérées par leur nombre
+    d'occurrences, puis labels ramenés à chaque pixel par l'index inverse. Donne les
+    mêmes labels que KMeans sur tous les pixels, pour une fraction du temps et de la mémoire,
+    tant qu'aucun cluster ne se vide en cours de route (sklearn déplace alors le centre sur
+    le point le plus éloigné, qui pèse ici toute une couleur au lieu d'un pixel).
+    Renvoie (labels des pixels, modèle KMeans ajusté).
+    """
+    codes = codes_rgb(pixels)
+    if len(codes) > 1 << 20:
+        # grande image : histogramme sur les 2**24 couleurs possibles, linéaire au lieu d'un tri
+        histogramme = np.bincount(codes, minlength=1 << 24)
+        uniques = np.flatnonzero(histogramme).astype(np.uint32)
+        nombres = histogramme[uniques]
+        indices = np.zeros(1 << 24, dtype=np.int32)
+        indices[uniques] = np.arange(len(uniques))
+        inverse = indices[codes]
+    else:
+        uniques, inverse, nombres = np.unique(codes, return_inverse=True, return_counts=True)
+    if len(uniques) < k:  # KMeans exige au moins k points : on garde le calcul direct
+        km = KMeans(n_clusters=k, init=init, n_init=1, random_state=0).fit(pixels)
+        return km.labels_, km
+    km = ajuster_histogramme(uniques, nombres, init, k)
+    return km.labels_[inverse.reshape(-1)], km
+
+
+def ajuster_histogramme(uniques: np.ndarray, nombres: np.ndarray, init: np.ndarray, k: int = 4) -> KMeans:
+    """
+    KMeans ajusté sur les couleurs distinctes (codes RGB, au moins k) pondérées par leur
+    nombre de pixels ; km.labels_[i] est le cluster de la couleur uniques[i].
+    """
+    couleurs = np.stack([uniques >> 16, (uniques >> 8) & 255, uniques & 255], axis=1).astype(float)
+    poids = nombres.astype(float)
+    # sklearn règle sa tolérance sur la variance (non pondérée) des données : on la ramène
+    # à celle des pixels pour que la convergence soit la même que sur l'image entière
+    moyenne = (couleurs * poids[:, None]).sum(axis=0) / poids.sum()
+    var_pixels = (((couleurs - moyenne) ** 2) * poids[:, None]).sum(axis=0) / poids.sum()
+    var_couleurs = couleurs.var(axis=0).mean()
+    tol = 1e-4 * var_pixels.mean() / var_couleurs if var_couleurs > 0 else 1e-4
+    return KMeans(n_clusters=k, init=init, n_init=1, random_state=0, tol=tol).fit(couleurs, sample_weight=poids)
+
+
+def enregistrer_image(img: Image.Image, chemin: str, asynchrone: bool = False):
+    """
+    Écrit l'image (PIL) sous `chemin`. Si asynchrone, l'encodage se fait dans un thread,
+    qui est renvoyé pour pouvoir l'attendre (join) ; l'image ne doit plus être modifiée.
+    """
+    if not asynchrone:
+        img.save(chemin)
+        return None
+    ecriture = threading.Thread(target=img.save, args=(chemin,), daemon=True)
+    ecriture.start()
+    return ecriture
+
+
+class Union_find:
+    """
+    Union-find sur les entiers 0..n-1, avec des opérations vectorisées sur des tableaux
+    d'éléments. Chaque racine est le plus petit élément de son ensemble.
+    """
+    def __init__(self, n: int):
+        self.parent = np.arange(n)
+
+    def agrandir(self, n: int):
+        """Ajoute des singletons pour atteindre n éléments."""
+        if n > len(self.parent):
+            self.parent = np.concatenate([self.parent, np.arange(len(self.parent), n)])
+
+    def compresser(self):
+        """Fait pointer chaque élément directement sur sa racine (sauts de pointeurs)."""
+        while True:
+            grands_parents = self.parent[self.parent]
+            if (grands_parents == self.parent).all():
+                return
+            self.parent = grands_parents
+
+    def racines(self, elements) -> np.ndarray:
+        self.compresser()
+        return self.parent[elements]
+
+    def unir(self, a, b):
+        """Réunit les ensembles de a[i] et b[i] pour tout i."""
+        a, b = np.asarray(a), np.asarray(b)
+        while len(a):
+            ra, rb = self.racines(a), self.racines(b)
+            differents = ra != rb
+            if not differents.any():
+                return
+            a, b, ra, rb = a[differents], b[differents], ra[differents], rb[differents]
+            # si une racine reçoit plusieurs parents, un seul est gardé : on recommence
+            self.parent[np.maximum(ra, rb)] = np.minimum(ra, rb)
+
+
+def _masque(nom, modifiable=False):
+    """Attribut masque booléen de Traitement_image, dérivé à la lecture du raster de classes."""
+    def lire(self):
+        return self.masque(nom)
+
+    def ecrire(self, valeur):
+        if valeur is None:
+            self._externes.pop(nom, None)
+        else:
+            self._externes[nom] = valeur
+    return property(lire, ecrire if modifiable else None,
+                    doc=f"Masque booléen « {nom} », calculé à la première lecture.")
+
+
 class Traitement_image:
     """
     Florian
     Classe mère du traitement
     Permet d'initialiser les différentes zones et d'avoir des méthodes communes aux
     traitements d'images K-means et Moyenne_couleur à écrire qu'une fois
+    Toutes les zones sont rangées dans un seul raster de classes uint8 (self.classes) ;
+    les masques (aquatique, rural, urbain, routes, mer, trait_de_cote, eaux_interieur)
+    en sont dérivés à leur première lecture, avec seulement les calculs dont ils
+    dépendent, puis gardés (compactés à 1 bit par pixel si masques_compacts).
     """
-    def __init__(self, file: str):
+    aquatique = _masque("aquatique")
+    rural = _masque("rural")
+    urbain = _masque("urbain")
+    routes = _masque("routes")
+    mer = _masque("mer", modifiable=True)
+    trait_de_cote = _masque("trait_de_cote", modifiable=True)
+    eaux_interieur = _masque("eaux_interieur")
+
+    def __init__(self, file, masques_compacts: bool = False, taille_bloc: int = None, fichier_classes: str = None,
+                 parallele=None):
         """
         Ouvre le fichier image et le convertit en un tableau numpy de taille hauteur*largeur*3.
         Ainsi, img_array[i,j] est le RGB du pixel à la position (i,j).
+        `file` peut aussi être directement un tableau numpy (hauteur, largeur, 3) en uint8,
+        par exemple un raster projeté en mémoire (np.memmap) : il est alors utilisé
+        tel quel, sans copie ni chargement complet en RAM. Une PIL.Image déjà en mémoire
+        (mosaïque du drone, ...) est lue sans passer par un fichier : une seule copie de
+        ses pixels, en lecture seule, et aucune si l'image est déjà en RGB pour self.img.
+        masques_compacts : garde les masques calculés avec np.packbits (8 fois plus petits),
+        décompactés à chaque lecture.
+        taille_bloc : si donné, les zones, la mer et le trait de côte sont calculés par blocs
+        carrés de ce côté (voir calculer), pour traiter des mosaïques plus grandes que la RAM.
+        fichier_classes : fichier .npy où projeter le raster de classes au lieu de la RAM.
+        parallele : Calcul_parallele (module Calcul_parallele) qui répartit les zones et le
+        trait de côte sur plusieurs processus ; ignoré si taille_bloc est donné.
         Initialise les zones masques des futurs zones.
         """
-        self.img = Image.open(file).convert("RGB")
-        self.img_array = np.array(self.img)
+        if isinstance(file, np.ndarray):
+            self.img_array = file
+            self._img = None  # PIL.Image créée seulement si on la demande
+        else:
+            img = file if isinstance(file, Image.Image) else Image.open(file)
+            self.img = img if img.mode == "RGB" else img.convert("RGB")
+            self.img_array = np.asarray(self.img)
         self.hauteur, self.largeur, _ = self.img_array.shape
-        self.rural = None
-        self.urbain = None
-        self.aquatique = None
-        self.routes = None
-        self.trait_de_cote = None
-        self.eaux_interieur=None
-        self.mer=None
+        self.classes = None #raster de classes (voir AUCUNE_ZONE, BIT_MER, BIT_TRAIT_DE_COTE)
+        self._couches = set() #calculs déjà faits sur le raster (voir COUCHES_MASQUES)
+        self._externes = {} #masques affectés de l'extérieur (mer, trait_de_cote), gardés tels quels
+        self._masques = {} #masques déjà dérivés du raster
+        self.masques_compacts = masques_compacts
+        self.taille_bloc = taille_bloc
+        self.fichier_classes = fichier_classes
+        self.parallele = parallele
         self.lacs=None
         self.rivieres=None
         self.sources=None
 
+    @property
+    def img(self):
+        """Image PIL correspondante, construite à la demande quand on part d'un tableau."""
+        if self._img is None:
+            self._img = Image.fromarray(np.asarray(self.img_array))
+        return self._img
+
+    @img.setter
+    def img(self, valeur):
+        self._img = valeur
+
     def tracer_trait_de_cote(self):
         """
         Calcule et stock le masque du trait de côte dans self.trait_de_cote.
         Suppose que la mer est liée à une extrémité de l'image .
         Stop la mer à l'embouchure des rivières
         """
-        if self.aquatique is None:
+        self._couches -= {"mer", "trait_de_cote"}
+        self.calculer("trait_de_cote")
+
+    def calculer(self, couche: str):
+        """Calcule la couche du raster (et celles dont elle dépend) si ce n'est pas déjà fait."""
+        if couche in self._couches:
+            return
+        for dependance in DEPENDANCES_COUCHES[couche]:
+            self.calculer(dependance)
+        if couche == "zones":
             self.creer_masques_couleurs()
+            return
+        if self.taille_bloc:
+            self._mer_par_blocs() if couche == "mer" else self._trait_de_cote_par_blocs()
+        elif couche == "mer":
+            self.classes &= ~np.uint8(BIT_MER)
+            self.classes[self.extraire_mer(TABLES_MASQUES["aquatique"][self.classes])] |= BIT_MER
+        elif self.parallele is not None:
+            self.parallele.contour_mer(self.classes)
+        else:
+            self.classes &= ~np.uint8(BIT_TRAIT_DE_COTE)
+            self.classes[self.contour(TABLES_MASQUES["mer"][self.classes])] |= BIT_TRAIT_DE_COTE
+        # la couche et celles qui en dépendent directement sont à refaire ou à relire
+        perimees = {couche} | {c for c, dependances in DEPENDANCES_COUCHES.items() if couche in dependances}
+        self._couches = (self._couches - perimees) | {couche}
+        self._externes.pop(couche, None)
+        for nom, couches in COUCHES_MASQUES.items():
+            if couches & perimees:
+                self._masques.pop(nom, None)
 
-        labels, nb = ndimage.label(self.aquatique)  #identifie toutes les zones connexes
-
-        #On garde que les zones qui touchent le bord
-        self.mer = np.zeros_like(self.aquatique)
-        for i in range(1, nb + 1):
-            comp_mask = (labels == i)
-            if (
-                comp_mask[0, :].any()
-                or comp_mask[-1, :].any()
-                or comp_mask[:, 0].any()
-                or comp_mask[:, -1].any()
-            ):
-                self.mer |= comp_mask
-
-        #Gradient de Sobel sur le masque pour trouver les pixels de changement entre terre et mer
-        grad_x = ndimage.sobel(self.mer.astype(float), axis=1)
-        grad_y = ndimage.sobel(self.mer.astype(float), axis=0)
-        grad   = np.hypot(grad_x, grad_y)
+    def masque(self, nom: str) -> np.ndarray:
+        """
+        Masque booléen `nom` (clé de TABLES_MASQUES). À la première lecture, les couches dont
+        il dépend sont calculées puis il est lu en une passe dans le raster de classes.
+        """
+        if nom in self._externes:
+            return self._externes[nom]
+        if nom == "eaux_interieur" and "mer" in self._externes:
+            return self.masque("aquatique") & ~self._externes["mer"]
+        if nom not in self._masques:
+            for couche in COUCHES_MASQUES[nom]:
+                self.calculer(couche)
+            masque = TABLES_MASQUES[nom][self.classes]
+            self._masques[nom] = np.packbits(masque) if self.masques_compacts else masque
+            return masque
+        masque = self._masques[nom]
+        if masque.dtype == bool:
+            return masque
+        return np.unpackbits(masque, count=self.classes.size).view(bool).reshape(self.classes.shape)
 
+    @staticmethod
+    def extraire_mer(aquatique: np.ndarray) -> np.ndarray:
+        """
+        Zones aquatiques connexes qui touchent un bord de l'image. Les numéros des zones
+        présentes sur les bords sont relevés en une passe, puis le masque est obtenu en
+        une seule lecture d'une table numéro -> booléen (linéaire en la taille de l'image).
+        """
+        labels, nb = ndimage.label(aquatique)  #identifie toutes les zones connexes
+        est_mer = np.zeros(nb + 1, dtype=bool)
+        est_mer[labels[0, :]] = est_mer[labels[-1, :]] = True
+        est_mer[labels[:, 0]] = est_mer[labels[:, -1]] = True
+        est_mer[0] = False  #le fond (terre) n'est pas une zone
+        return est_mer[labels]
+
+    @staticmethod
+    def contour(masque: np.ndarray) -> np.ndarray:
+        """
+        Pixels de changement entre terre et mer : même critère que le gradient de Sobel
+        (ndimage.sobel, bords en miroir) de norme > 1, mais calculé en petits entiers.
+        Sur un masque binaire les deux composantes du gradient sont des entiers de -4 à 4,
+        donc norme > 1 équivaut à gx² + gy² > 1. Un simple contour morphologique (érosion
+        ou dilatation) ne donnerait pas le même trait : un pixel isolé ou deux coins opposés
+        ont un gradient nul.
+        """
+        m = np.pad(masque.astype(np.int8), 1, mode="symmetric")  # = mode "reflect" de scipy
+        lisse_vertical = m[:-2] + 2 * m[1:-1] + m[2:]
+        grad_x = lisse_vertical[:, 2:] - lisse_vertical[:, :-2]
+        lisse_horizontal = m[:, :-2] + 2 * m[:, 1:-1] + m[:, 2:]
+        grad_y = lisse_horizontal[2:] - lisse_horizontal[:-2]
         #Permet de faire un trait fin
-        self.trait_de_cote = grad > 1
+        return grad_x * grad_x + grad_y * grad_y > 1
 
     def creer_masques_couleurs(self):
         """
-        Crée les 4 masques à partir deu filtre (K-means ou Moyenne_couleur)
+        Crée les 4 zones à partir deu filtre (K-means ou Moyenne_couleur) : chaque pixel reçoit
+        l'indice de sa couleur dans COULEURS_ZONES, lu dans une table indexée par le code RGB.
         """
-        arr = self.img_array
-        self.aquatique = (arr[:, :, 0] == 0)   & (arr[:, :, 1] == 0)   & (arr[:, :, 2] == 255)
-        self.rural  = (arr[:, :, 0] == 34)  & (arr[:, :, 1] == 139) & (arr[:, :, 2] == 34)
-        self.urbain = (arr[:, :, 0] == 105) & (arr[:, :, 1] == 105) & (arr[:, :, 2] == 105)
-        self.routes = (arr[:, :, 0] == 255) & (arr[:, :, 1] == 215) & (arr[:, :, 2] == 0)
+        if self.taille_bloc:
+            self._zones_par_blocs()
+        elif self.parallele is not None:
+            self.classes = self.parallele.classer(self.img_array, table_classes())
+        else:
+            self.classes = table_classes()[codes_rgb(self.img_array)]
+        self._couches = {"zones"}
+        self._externes.clear()
+        self._masques.clear()
 
-    def appliquer_masque(self, masque, couleur):
+    def blocs(self):
+        """Fenêtres (y0, y1, x0, x1) du découpage de l'image en blocs de taille_bloc de côté."""
+        hauteur, largeur = self.img_array.shape[:2]
+        t = self.taille_bloc
+        for y0 in range(0, hauteur, t):
+            for x0 in range(0, largeur, t):
+                yield y0, min(y0 + t, hauteur), x0, min(x0 + t, largeur)
+
+    def _zones_par_blocs(self):
+        """creer_masques_couleurs bloc par bloc, dans un raster en RAM ou projeté (fichier_classes)."""
+        forme = self.img_array.shape[:2]
+        if self.fichier_classes:
+            self.classes = np.lib.format.open_memmap(self.fichier_classes, mode="w+", dtype=np.uint8, shape=forme)
+        else:
+            self.classes = np.empty(forme, dtype=np.uint8)
+        table = table_classes()
+        for y0, y1, x0, x1 in self.blocs():
+            self.classes[y0:y1, x0:x1] = table[codes_rgb(self.img_array[y0:y1, x0:x1])]
+
+    def _mer_par_blocs(self):
+        """
+        extraire_mer par blocs, avec exactement le même résultat que sur l'image entière.
+        1re passe : les zones aquatiques de chaque bloc sont numérotées ; celles qui touchent
+        un bord du bloc reçoivent un numéro global et on garde les lignes et colonnes de bord. Les zones qui
+        se touchent d'un bloc à l'autre (4-connexité, comme ndimage.label) sont réunies par
+        un union-find ; une zone est de la mer si son ensemble touche le bord de l'image.
+        2e passe : chaque bloc est renuméroté à l'identique et ses pixels de mer marqués.
+        """
+        aquatique = TABLES_MASQUES["aquatique"]
+        hauteur, largeur = self.classes.shape
+        decalages, bords = {}, {}
+        nb_total = 0
+        sur_le_bord = []
+        for y0, y1, x0, x1 in self.blocs():
+            labels, _ = ndimage.label(aquatique[self.classes[y0:y1, x0:x1]])
+            faces = (labels[0], labels[-1], labels[:, 0], labels[:, -1])
+            # seules les zones présentes sur un bord du bloc peuvent en rejoindre d'autres :
+            # elles seules reçoivent un numéro global, la mémoire ne dépend pas du nombre de zones
+            locaux = np.unique(np.concatenate(faces))
+            locaux = locaux[locaux > 0]
+            decalages[(y0, x0)] = (nb_total, locaux)
+            faces = tuple(np.where(f > 0, np.searchsorted(locaux, f) + np.int64(nb_total + 1), 0) for f in faces)
+            nb_total += len(locaux)
+            bords[(y0, x0)] = faces
+            for bord, touche in zip(faces, (y0 == 0, y1 == hauteur, x0 == 0, x1 == largeur)):
+                if touche:
+                    sur_le_bord.append(bord)
+        ensembles = Union_find(nb_total + 1)
+        t = self.taille_bloc
+        for (y0, x0), (haut, bas, gauche, droite) in bords.items():
+            for voisin, face, face_voisin in (((y0, x0 + t), droite, 2), ((y0 + t, x0), bas, 0)):
+                if voisin in bords:
+                    autre = bords[voisin][face_voisin]
+                    contact = (face > 0) & (autre > 0)
+                    ensembles.unir(face[contact], autre[contact])
+        est_mer = np.zeros(nb_total + 1, dtype=bool)
+        est_mer[ensembles.racines(np.concatenate(sur_le_bord))] = True
+        est_mer = est_mer[ensembles.racines(np.arange(nb_total + 1))]
+        est_mer[0] = False
+        for y0, y1, x0, x1 in self.blocs():
+            bloc = self.classes[y0:y1, x0:x1]
+            labels, nb = ndimage.label(aquatique[bloc])
+            decalage, locaux = decalages[(y0, x0)]
+            table = np.zeros(nb + 1, dtype=bool)
+            table[locaux] = est_mer[decalage + 1:decalage + 1 + len(locaux)]
+            self.classes[y0:y1, x0:x1] = np.where(table[labels], bloc | BIT_MER, bloc & ~np.uint8(BIT_MER))
+
+    def _trait_de_cote_par_blocs(self):
+        """
+        contour par blocs : chaque bloc est lu avec une marge d'un pixel chez ses voisins,
+        ce qui suffit au gradient de Sobel (3×3) ; au bord de l'image, contour applique
+        le même miroir que sur l'image entière.
+        """
+        for fenetre in self.blocs():
+            self._retracer(*fenetre)
+
+    def _retracer(self, y0, y1, x0, x1):
+        """Bit du trait de côte de la fenêtre y0:y1, x0:x1 (bornée au raster), lue avec une marge d'un pixel."""
+        hauteur, largeur = self.classes.shape
+        y0, y1, x0, x1 = max(y0, 0), min(y1, hauteur), max(x0, 0), min(x1, largeur)
+        if y0 >= y1 or x0 >= x1:
+            return
+        ey0, ey1, ex0, ex1 = max(y0 - 1, 0), min(y1 + 1, hauteur), max(x0 - 1, 0), min(x1 + 1, largeur)
+        mer = TABLES_MASQUES["mer"][self.classes[ey0:ey1, ex0:ex1]]
+        trait = self.contour(mer)[y0 - ey0:y1 - ey0, x0 - ex0:x1 - ex0]
+        bloc = self.classes[y0:y1, x0:x1]
+        self.classes[y0:y1, x0:x1] = np.where(trait, bloc | BIT_TRAIT_DE_COTE, bloc & ~np.uint8(BIT_TRAIT_DE_COTE))
+
+    def appliquer_masque(self, masque, couleur, base=None):
         """
         Prend en paramètre un masque et une couleur RGB.
         Retourne un PIL.Image où les pixels du masque sont recoloriés.
+        `base` : image (PIL ou tableau) à recolorier à la place de self.img_array, pour
+        superposer plusieurs masques sans toucher à l'image traitée.
         """
-        img_mod = self.img_array.copy()
+        img_mod = np.array(base) if base is not None else self.img_array.copy()
         img_mod[masque] = couleur
         return Image.fromarray(img_mod)
 
@@ -84,50 +489,410 @@ class Traitement_image:
         """
         Les eaux intérieures sont les pixels qui ne sont pas la mer
         """
-        self.eaux_interieur = self.aquatique & (~self.mer)
         return self.eaux_interieur
 
+class Traitement_incremental(Traitement_image):
+    """
+    Traitement_image d'une mosaïque complétée tuile par tuile, au fil des déplacements du
+    drone. Chaque tuile ajoutée est seule classée et collée dans le raster de classes ; ses
+    zones aquatiques qui touchent un bord de la tuile reçoivent des numéros globaux, réunis
+    à ceux des tuiles voisines par un Union_find (comme dans _mer_par_blocs). Chaque ensemble
+    compte ses pixels sur le bord de la mosaïque (à sa racine) : il est de la mer si ce
+    compte est positif. Les bits de mer ne sont réécrits que dans les tuiles d'un ensemble
+    qui change de statut (fusion à travers la nouvelle tuile, bord de la mosaïque qui
+    s'éloigne), et le trait de côte n'est retracé qu'autour des pixels modifiés. Le raster
+    est le même que celui de Traitement_image sur toute la mosaïque (tuiles manquantes en
+    noir), pour un coût par tuile qui ne dépend presque pas de la taille de la mosaïque.
+    cache : Cache_segmentation ; les zones d'une tuile de même contenu qu'une tuile déjà
+    vue (la pleine mer, ...) et leurs composantes aquatiques sont reprises du cache.
+    """
+    def __init__(self, taille_tuile: int = 256, masques_compacts: bool = False, cache=None):
+        super().__init__(np.zeros((0, 0, 3), dtype=np.uint8), masques_compacts=masques_compacts)
+        self.taille_tuile = taille_tuile
+        self.cache = cache
+        self.classes = np.zeros((0, 0), dtype=np.uint8)
+        self._couches = {"zones", "mer", "trait_de_cote"}  # tenues à jour à chaque tuile
+        self.tuiles = {}          # (x, y) -> (premier numéro global, zones locales au bord, bords en numéros globaux)
+        self._ordre = []          # (x, y) des tuiles dans l'ordre d'ajout
+        self._rgb = None          # canevas RGB et raster de classes, agrandis comme Mosaique
+        self._canevas = None
+        self.origine = None       # indices (x, y) de la tuile en haut à gauche du canevas
+        self.capacite = (0, 0)    # taille du canevas en tuiles (largeur, hauteur)
+        self.min_x = self.max_x = self.min_y = self.max_y = None
+        self.ensembles = Union_find(1)                 # numéro 0 : pas d'eau
+        self.contacts = np.zeros(1, dtype=np.int64)    # pixels de l'ensemble au bord de la mosaïque
+        self.tuile_de = np.zeros(1, dtype=np.int64)    # indice dans _ordre de la tuile de chaque numéro
+
+    def _agrandir(self, x, y):
+        """Réalloue les canevas pour qu'ils contiennent la tuile (x, y) (taille doublée du côté qui déborde)."""
+        ox, oy = self.origine
+        cw, ch = self.capacite
+        nx0, ny0, nx1, ny1 = ox, oy, ox + cw, oy + ch
+        if x < nx0:
+            nx0 = min(x, ox - cw)
+        if x >= nx1:
+            nx1 = max(x + 1, ox + 2 * cw)
+        if y < ny0:
+            ny0 = min(y, oy - ch)
+        if y >= ny1:
+            ny1 = max(y + 1, oy + 2 * ch)
+        t = self.taille_tuile
+        rgb = np.zeros(((ny1 - ny0) * t, (nx1 - nx0) * t, 3), dtype=np.uint8)
+        canevas = np.full(rgb.shape[:2], table_classes()[0], dtype=np.uint8)  # noir, comme Mosaique
+        y0, x0 = (oy - ny0) * t, (ox - nx0) * t
+        rgb[y0:y0 + ch * t, x0:x0 + cw * t] = self._rgb
+        canevas[y0:y0 + ch * t, x0:x0 + cw * t] = self._canevas
+        self._rgb, self._canevas = rgb, canevas
+        self.origine = (nx0, ny0)
+        self.capacite = (nx1 - nx0, ny1 - ny0)
+
+    def _placer(self, x, y):
+        """Fait entrer la tuile (x, y) dans la mosaïque ; img_array et classes sont recadrés (vues)."""
+        t = self.taille_tuile
+        if self._rgb is None:
+            self._rgb = np.zeros((t, t, 3), dtype=np.uint8)
+            self._canevas = np.full((t, t), table_classes()[0], dtype=np.uint8)
+            self.origine, self.capacite = (x, y), (1, 1)
+            self.min_x = self.max_x = x
+            self.min_y = self.max_y = y
+        ox, oy = self.origine
+        if not (ox <= x < ox + self.capacite[0] and oy <= y < oy + self.capacite[1]):
+            self._agrandir(x, y)
+            ox, oy = self.origine
+        self.min_x, self.max_x = min(self.min_x, x), max(self.max_x, x)
+        self.min_y, self.max_y = min(self.min_y, y), max(self.max_y, y)
+        lignes = slice((self.min_y - oy) * t, (self.max_y - oy + 1) * t)
+        colonnes = slice((self.min_x - ox) * t, (self.max_x - ox + 1) * t)
+        self.img_array = self._rgb[lignes, colonnes]
+        self.classes = self._canevas[lignes, colonnes]
+        self.hauteur, self.largeur = self.classes.shape
+
+    @staticmethod
+    def zones_tuile(tuile: np.ndarray) -> np.ndarray:
+        """Zones (raster de classes sans mer ni trait de côte) d'une tuile RGB."""
+        return table_classes()[codes_rgb(tuile)]
+
+    @staticmethod
+    def composantes_aquatiques(zones: np.ndarray) -> np.ndarray:
+        """Numéros (int32, 0 hors de l'eau) des zones aquatiques connexes d'une tuile."""
+        return ndimage.label(TABLES_MASQUES["aquatique"][zones])[0]
+
+    def _segmenter_tuile(self, tuile):
+        """Zones de la tuile et leurs composantes aquatiques, reprises du cache s'il y en a un."""
+        if self.cache is None:
+            zones = self.zones_tuile(tuile)
+            return zones, self.composantes_aquatiques(zones)
+        zones = self.cache.segmenter(tuile, "Traitement_incremental.zones", self.zones_tuile)
+        return zones, self.cache.segmenter(zones, "Traitement_incremental.composantes", self.composantes_aquatiques)
+
+    def _est_mer(self, numeros):
+        return self.contacts[self.ensembles.racines(numeros)] > 0
+
+    def ajouter_tuiles(self, tuiles):
+        """tuiles : liste de (x, y, tuile RGB en np.ndarray ou PIL.Image), voir ajouter_tuile."""
+        for x, y, tuile in tuiles:
+            self.ajouter_tuile(x, y, tuile)
+
+    def ajouter_tuile(self, x: int, y: int, tuile):
+        """
+        Ajoute la tuile d'indices (x, y) et met à jour zones, mer et trait de côte. Une tuile
+        déjà présente est ignorée (une tuile ne change pas entre deux passages).
+        """
+        if (x, y) in self.tuiles:
+            return
+        ancien = None if self.min_x is None else (self.min_x, self.max_x, self.min_y, self.max_y)
+        self._placer(x, y)
+        t = self.taille_tuile
+        tuile = np.asarray(tuile)[..., :3]
+        zones, labels = self._segmenter_tuile(tuile)
+        y0, x0 = (y - self.min_y) * t, (x - self.min_x) * t
+        self.img_array[y0:y0 + t, x0:x0 + t] = tuile
+        self.classes[y0:y0 + t, x0:x0 + t] = zones
+
+        # numéros globaux des zones aquatiques au bord de la tuile (haut, bas, gauche, droite)
+        labels_tuile = (labels, int(labels.max(initial=0)))
+        faces = (labels[0], labels[-1], labels[:, 0], labels[:, -1])
+        locaux = np.unique(np.concatenate(faces))
+        locaux = locaux[locaux > 0]
+        premier = len(self.ensembles.parent)
+        faces = tuple(np.where(f > 0, np.searchsorted(locaux, f) + premier, 0) for f in faces)
+        self.ensembles.agrandir(premier + len(locaux))
+        self.contacts = np.concatenate([self.contacts, np.zeros(len(locaux), dtype=np.int64)])
+        self.tuile_de = np.concatenate([self.tuile_de, np.full(len(locaux), len(self._ordre))])
+
+        # zones qui se touchent d'une tuile à l'autre, et bords qui ne sont plus celui de la mosaïque
+        paires = []
+        for (dx, dy), face, face_voisin in (((0, -1), 0, 1), ((0, 1), 1, 0), ((-1, 0), 2, 3), ((1, 0), 3, 2)):
+            voisin = self.tuiles.get((x + dx, y + dy))
+            if voisin is not None:
+                a, b = faces[face], voisin[2][face_voisin]
+                contact = (a > 0) & (b > 0)
+                paires.append((a[contact], b[contact]))
+        interieurs, bandes = [], []
+        if ancien is not None:
+            ax0, ax1, ay0, ay1 = ancien
+            cotes = []
+            if self.min_y < ay0:
+                cotes += [((xx, ay0), 0) for xx in range(ax0, ax1 + 1)]
+                bandes.append(((ay0 - self.min_y) * t - 1, (ay0 - self.min_y) * t + 1, 0, self.largeur))
+            if self.max_y > ay1:
+                cotes += [((xx, ay1), 1) for xx in range(ax0, ax1 + 1)]
+                bandes.append(((ay1 - self.min_y + 1) * t - 1, (ay1 - self.min_y + 1) * t + 1, 0, self.largeur))
+            if self.min_x < ax0:
+                cotes += [((ax0, yy), 2) for yy in range(ay0, ay1 + 1)]
+                bandes.append((0, self.hauteur, (ax0 - self.min_x) * t - 1, (ax0 - self.min_x) * t + 1))
+            if self.max_x > ax1:
+                cotes += [((ax1, yy), 3) for yy in range(ay0, ay1 + 1)]
+                bandes.append((0, self.hauteur, (ax1 - self.min_x + 1) * t - 1, (ax1 - self.min_x + 1) * t + 1))
+            interieurs = [self.tuiles[c][2][face] for c, face in cotes if c in self.tuiles]
+            interieurs = [f[f > 0] for f in interieurs]
+        au_bord = [f[f > 0] for f, bord in zip(faces, (y == self.min_y, y == self.max_y, x == self.min_x, x == self.max_x))
+                   if bord]
+        self.tuiles[(x, y)] = (premier, locaux, faces)
+        self._ordre.append((x, y))
+
+        # seules les zones déjà numérotées concernées peuvent changer de statut
+        concernes = np.unique(np.concatenate([b for _, b in paires] + interieurs + [np.zeros(0, dtype=np.int64)]))
+        avant = self._est_mer(concernes)
+        if paires:
+            a = np.concatenate([a for a, _ in paires])
+            b = np.concatenate([b for _, b in paires])
+            racines = np.unique(self.ensembles.racines(np.concatenate([a, b])))
+            comptes = self.contacts[racines]
+            self.contacts[racines] = 0
+            self.ensembles.unir(a, b)
+            np.add.at(self.contacts, self.ensembles.racines(racines), comptes)
+        for f in interieurs:
+            np.subtract.at(self.contacts, self.ensembles.racines(f), 1)
+        for f in au_bord:
+            np.add.at(self.contacts, self.ensembles.racines(f), 1)
+
+        a_refaire = {len(self._ordre) - 1}
+        changes = concernes[self._est_mer(concernes) != avant]
+        if len(changes):
+            racines = np.unique(self.ensembles.racines(changes))
+            membres = np.isin(self.ensembles.racines(np.arange(len(self.ensembles.parent))), racines)
+            a_refaire |= set(self.tuile_de[membres].tolist())
+        for i in a_refaire:
+            tx, ty = self._ordre[i]
+            premier, locaux, _ = self.tuiles[(tx, ty)]
+            ry, rx = (ty - self.min_y) * t, (tx - self.min_x) * t
+            bloc = self.classes[ry:ry + t, rx:rx + t]
+            labels, nb = labels_tuile if (tx, ty) == (x, y) else ndimage.label(TABLES_MASQUES["aquatique"][bloc])
+            table = np.zeros(nb + 1, dtype=bool)
+            table[locaux] = self._est_mer(premier + np.arange(len(locaux)))
+            bloc[...] = np.where(table[labels], bloc | BIT_MER, bloc & ~np.uint8(BIT_MER))
+            bandes.append((ry - 1, ry + t + 1, rx - 1, rx + t + 1))
+        for bande in bandes:
+            self._retracer(*bande)
+        self._masques.clear()
+        self._externes.clear()
+        self._img = None
+
+    def creer_masques_couleurs(self):
+        """Le raster est tenu à jour à chaque tuile : on oublie seulement les masques dérivés."""
+        self._masques.clear()
+        self._externes.clear()
+
+    def tracer_trait_de_cote(self):
+        """Déjà tracé à chaque tuile (voir ajouter_tuile)."""
+        self.creer_masques_couleurs()
+
+
 class Kmean(Traitement_image):
     """Noam"""
-    def __init__(self, file: str, k: int = 4):
-        super().__init__(file)
-        self.segmented_img = self.k_means(k)
-        self.segmented_img.save("Kmean.png")
+    def __init__(self, file: str, k: int = 4, methode: str = "kmeans", parallele=None,
+                 sauvegarde: str = "Kmean.png", asynchrone: bool = False, cache=None):
+        """
+        methode : "kmeans" (K-means ajusté sur l'image), "histogramme" (même K-means ajusté
+        sur les couleurs distinctes pondérées, beaucoup plus rapide) ou "palette" (chaque
+        pixel prend la zone de la couleur de référence la plus proche, via une table précalculée).
+        parallele : Calcul_parallele ; avec "histogramme" et "palette", les pixels sont classés
+        par bandes sur ses processus ("kmeans" reste dans sklearn).
+        sauvegarde : fichier où écrire l'image segmentée (None : aucun fichier), dans un
+        thread si asynchrone (self.ecriture, à attendre avec join()).
+        cache : Cache_segmentation ; une image déjà segmentée avec les mêmes k et methode
+        n'est pas segmentée à nouveau.
+        """
+        super().__init__(file, parallele=parallele)
+        self.methode = methode
+        if cache is None:
+            self.segmented_img = self.segmenter(k)
+        else:
+            self.segmented_img = Image.fromarray(cache.segmenter(
+                self.img_array, "Kmean", lambda _: np.asarray(self.segmenter(k)), k=k, methode=methode))
+        self.ecriture = enregistrer_image(self.segmented_img, sauvegarde, asynchrone) if sauvegarde else None
         self.img = self.segmented_img
-        self.img_array = np.array(self.segmented_img)
-        self.creer_masques_couleurs()
+        self.img_array = np.asarray(self.segmented_img) #les masques seront dérivés de l'image segmentée à la demande
+
+    def segmenter(self, k: int = 4):
+        """Image segmentée (PIL.Image) par la méthode choisie."""
+        return self.palette(k) if self.methode == "palette" else self.k_means(k)
 
     def k_means(self, k: int = 4):
         pixels = self.img_array.reshape(-1, 3)
-        centers = np.array([
-            [195, 229, 235],
-            [218, 238, 199],
-            [255, 255, 249],
-            [255, 255, 150]
-        ], dtype=np.uint8)
-        km = KMeans(n_clusters=k, init=centers, n_init=1, random_state=0).fit(pixels)
-        cols = np.array([
-            [0,   0,   255],
-            [34, 139,  34],
-            [105,105, 105],
-            [255,215,   0]
-        ])
-        img = cols[km.labels_].reshape(self.hauteur, self.largeur, 3)
-        return Image.fromarray(img.astype(np.uint8))
+        if self.methode == "histogramme" and self.parallele is not None:
+            # l'ajustement se fait ici sur l'histogramme, les processus classent les pixels
+            # avec une table code RGB -> cluster
+            histogramme = np.bincount(codes_rgb(pixels), minlength=1 << 24)
+            uniques = np.flatnonzero(histogramme).astype(np.uint32)
+            if len(uniques) >= k:
+                table = np.zeros(1 << 24, dtype=np.uint8)
+                table[uniques] = ajuster_histogramme(uniques, histogramme[uniques], CENTRES_CARTE[:k], k).labels_
+                return Image.fromarray(self.parallele.classer(self.img_array, table, couleurs=COULEURS_ZONES))
+        if self.methode == "histogramme":
+            labels, _ = kmeans_histogramme(pixels, CENTRES_CARTE[:k], k)
+        else:
+            labels = KMeans(n_clusters=k, init=CENTRES_CARTE[:k], n_init=1, random_state=0).fit(pixels).labels_
+        img = COULEURS_ZONES[labels].reshape(self.hauteur, self.largeur, 3)
+        return Image.fromarray(img)
+
+    def palette(self, k: int = 4, bits: int = 5):
+        """Segmentation rapide par table de correspondance (voir table_palette)."""
+        if self.parallele is not None:
+            table = table_palette(bits, k).reshape(-1)
+            return Image.fromarray(self.parallele.classer(self.img_array, table, bits, couleurs=COULEURS_ZONES))
+        return Image.fromarray(COULEURS_ZONES[classer_palette(self.img_array, bits, k)])
+
+
+class Arbre_quadtree:
+    """
+    Arbre de Moyenne_couleur stocké niveau par niveau (parcours en largeur) dans des
+    tableaux numpy : pour chaque niveau, bornes des nœuds (y0, x0, h, l en int32), drapeau
+    de feuille et indice de couleur dans COULEURS_ZONES (int8, -1 pour un nœud interne).
+    Les quatre enfants d'un nœud interne sont consécutifs au niveau suivant, dans
+    l'ordre haut-gauche, haut-droite, bas-gauche, bas-droite, et les nœuds internes
+    d'un niveau y apparaissent dans le même ordre que leurs parents.
+    """
+    def __init__(self, hauteur, largeur):
+        self.hauteur = hauteur
+        self.largeur = largeur
+        self.niveaux = []  # dicts de tableaux : "y0", "x0", "h", "l", "feuille", "couleur"
+
+    @staticmethod
+    def enfants(y0, x0, h, l):
+        """Bornes des quatre enfants de chaque nœud (tableaux), dans l'ordre de l'arbre."""
+        h0, l0 = h // 2, l // 2
+        return (np.stack([y0, y0, y0 + h0, y0 + h0], axis=1).ravel(),
+                np.stack([x0, x0 + l0, x0, x0 + l0], axis=1).ravel(),
+                np.stack([h0, h0, h - h0, h - h0], axis=1).ravel(),
+                np.stack([l0, l - l0, l0, l - l0], axis=1).ravel())
+
+    def ajouter_niveau(self, y0, x0, h, l, feuille, couleur):
+        self.niveaux.append({"y0": y0, "x0": x0, "h": h, "l": l, "feuille": feuille, "couleur": couleur})
+
+    def nb_feuilles(self):
+        return sum(int(niveau["feuille"].sum()) for niveau in self.niveaux)
+
+    def peindre(self) -> np.ndarray:
+        """
+        Image (hauteur, largeur) des indices de couleur des feuilles. Chaque niveau est
+        peint en une passe : les feuilles sont découpées en segments de ligne, dont on
+        déroule les indices de pixels avec np.repeat.
+        """
+        indices = np.zeros(self.hauteur * self.largeur, dtype=np.uint8)
+        for niveau in self.niveaux:
+            f = niveau["feuille"]
+            if not f.any():
+                continue
+            y0, x0, h, l, couleur = (niveau[c][f] for c in ("y0", "x0", "h", "l", "couleur"))
+            # un segment par ligne de chaque feuille
+            feuille = np.repeat(np.arange(len(h)), h)
+            ligne = np.arange(len(feuille)) - np.repeat(np.cumsum(h) - h, h)
+            debut = (y0[feuille] + ligne) * self.largeur + x0[feuille]
+            longueur = l[feuille]
+            decalage = np.arange(longueur.sum()) - np.repeat(np.cumsum(longueur) - longueur, longueur)
+            indices[np.repeat(debut, longueur) + decalage] = np.repeat(couleur[feuille], longueur)
+        return indices.reshape(self.hauteur, self.largeur)
+
+    def vers_imbrique(self):
+        """
+        Format historique : une feuille est un tuple RGB, un nœud interne la liste de ses
+        quatre enfants. Construit du niveau le plus profond vers la racine, sans récursion.
+        """
+        couleurs = [tuple(c) for c in COULEURS_ZONES.tolist()]
+        suivant = []
+        for niveau in reversed(self.niveaux):
+            noeuds, j = [], 0
+            for feuille, couleur in zip(niveau["feuille"].tolist(), niveau["couleur"].tolist()):
+                if feuille:
+                    noeuds.append(couleurs[couleur])
+                else:
+                    noeuds.append(suivant[j:j + 4])
+                    j += 4
+            suivant = noeuds
+        return suivant[0]
+
+    @classmethod
+    def depuis_imbrique(cls, arbre, hauteur, largeur):
+        """Arbre_quadtree équivalent à un arbre au format historique (voir vers_imbrique)."""
+        indices = {tuple(c): i for i, c in enumerate(COULEURS_ZONES.tolist())}
+        resultat = cls(hauteur, largeur)
+        noeuds = [arbre]
+        y0, x0, h, l = (np.array([v], dtype=np.int32) for v in (0, 0, hauteur, largeur))
+        while noeuds:
+            feuille = np.array([isinstance(n, tuple) for n in noeuds])
+            couleur = np.array([indices[tuple(n)] if isinstance(n, tuple) else -1 for n in noeuds], dtype=np.int8)
+            resultat.ajouter_niveau(y0, x0, h, l, feuille, couleur)
+            noeuds = [enfant for n in noeuds if not isinstance(n, tuple) for enfant in n]
+            y0, x0, h, l = cls.enfants(y0[~feuille], x0[~feuille], h[~feuille], l[~feuille])
+        return resultat
 
 
 class Moyenne_couleur(Traitement_image):
     """Florian - Traitement d'une image par segmentation en tuiles à qui on applique une couleur uniforme"""
-    def __init__(self, file: str, seuil_variance: float = 50):
-        """Initialisation de la classe"""
-        super().__init__(file) #On récupère tous les attributs de la classe mère : Traitement_image et on charge l'image
+    def __init__(self, file: str, seuil_variance: float = 50, parallele=None,
+                 sauvegarde: str = "Moyenne_couleur.png", asynchrone: bool = False, cache=None):
+        """
+        Initialisation de la classe
+        parallele : Calcul_parallele qui construit et peint les sous-arbres sur plusieurs processus
+        sauvegarde, asynchrone : écriture de l'image reconstruite, comme pour Kmean
+        cache : Cache_segmentation ; pour une image déjà traitée avec le même seuil, l'image
+        reconstruite est reprise du cache et l'arbre n'est construit que si on le lit
+        """
+        super().__init__(file, parallele=parallele) #On récupère tous les attributs de la classe mère : Traitement_image et on charge l'image
         self.seuil_variance = seuil_variance #contrôle la précision de la segmentation
-        self.arbre = self.recurrence(self.img_array) #la méthode se fait par récurrence et on stock le résultat dans un arbre
-        reconstruite = self.reconstruction() #Une fois segmentée et traitée, on recolle l'image
-        Image.fromarray(reconstruite).save("Moyenne_couleur.png") #On enregistre l'image
-        self.img = Image.fromarray(reconstruite)
-        self.img_array = reconstruite
-        self.creer_masques_couleurs() #créé les masques
+        self._arbre = None #format historique, construit seulement si on le demande
+        self._quadtree = None
+        self._source = self.img_array #image d'origine, gardée tant que l'arbre n'est pas construit
+        if cache is None:
+            reconstruite = self.segmenter()
+        else:
+            reconstruite = cache.segmenter(self.img_array, "Moyenne_couleur", lambda _: self.segmenter(),
+                                           seuil_variance=seuil_variance)
+        if self._quadtree is not None:
+            self._source = None
+        self.img_array = reconstruite #les masques seront dérivés de l'image reconstruite à la demande
+        self.img = None #PIL.Image créée seulement si on la demande (ou pour l'enregistrer)
+        self.ecriture = enregistrer_image(self.img, sauvegarde, asynchrone) if sauvegarde else None #On enregistre l'image
+
+    @classmethod
+    def segmenter_tuile(cls, tuile, seuil_variance: float = 50, cache=None) -> np.ndarray:
+        """
+        Image reconstruite (hauteur, largeur, 3) d'une seule tuile, reprise du cache pour
+        un contenu déjà segmenté avec ce seuil (même clé que Moyenne_couleur(..., cache=)).
+        """
+        return cls(tuile, seuil_variance, sauvegarde=None, cache=cache).img_array
+
+    def segmenter(self) -> np.ndarray:
+        """Construit l'arbre de l'image d'origine et renvoie l'image reconstruite."""
+        if self.parallele is not None:
+            self.quadtree, reconstruite = self.parallele.construire_arbre(self._source, self.seuil_variance)
+            return reconstruite
+        self.quadtree = self.construire_arbre(self._source) #l'arbre est construit niveau par niveau
+        return self.reconstruction() #Une fois segmentée et traitée, on recolle l'image
+
+    @property
+    def quadtree(self) -> "Arbre_quadtree":
+        """Arbre_quadtree de l'image, construit à la première lecture si l'image venait du cache."""
+        if self._quadtree is None:
+            self._quadtree = self.construire_arbre(self._source)
+            self._source = None
+        return self._quadtree
+
+    @quadtree.setter
+    def quadtree(self, valeur):
+        self._quadtree = valeur
 
     def variance_tile(self, tile):
         """Calcul de la variance d'une tuile"""
@@ -142,65 +907,103 @@ class Moyenne_couleur(Traitement_image):
         À partir d'une moyenne [R,G,B], retourne la couleur la plus proche
         parmi les couleurs de la carte, ou gris si aucune n'est proche.
         """
-        r, g, b = map(int, moyenne)
-        dico={"bleu" : (195, 229, 235),  # eau
-        "vert" : (218, 238, 199),  # rural
-        "gris" : (255, 255, 249),  # urbain pâle
-        "jaune" : (255, 255, 150),  # routes
-              }
-        seuil = 60
-
-        def distance(r, g, b, couleur):
-            """Fonction interne calculant la distance des pixels aux couleurs qu'on souhaite"""
-            return abs(r - couleur[0]) + abs(g - couleur[1]) + abs(b - couleur[2])
-
-        [db, dv, dg, dj]=[distance(r,g,b,couleur) for couleur in dico.values()]
-
-        if db <= seuil and db < dv and db < dg and db < dj:
-            return (0, 0, 255)  # bleu pur pour eau
-        elif dv <= seuil and dv < db and dv < dg and dv < dj:
-            return (34, 139, 34)  # vert foncé pour rural
-        elif dg <= seuil and dg < db and dg < dv and dg < dj:
-            return (105, 105, 105)  # gris foncé pour urbain
-        elif dj <= seuil and dj < db and dj < dv and dj < dg:
-            return (255, 215, 0)  # jaune doré pour routes
-        else:
-            return (105, 105, 105)  # sinon gris foncé par défaut
+        indice = self.quelle_couleur_lot(np.asarray(moyenne, dtype=float).reshape(1, 3))[0]
+        return tuple(COULEURS_ZONES[indice].tolist())
+
+    @staticmethod
+    def quelle_couleur_lot(moyennes: np.ndarray, seuil: int = 60) -> np.ndarray:
+        """
+        Version par lot de quelle_couleur : moyennes (L, 3) -> indices (L,) dans COULEURS_ZONES.
+        Les moyennes sont tronquées en entiers, puis comparées en distance de Manhattan aux
+        couleurs de la carte (CENTRES_CARTE : eau, rural, urbain pâle, routes). Une couleur
+        n'est retenue que si elle est à moins de `seuil` et strictement plus proche que
+        toutes les autres ; sinon (trop loin ou ex aequo) c'est le gris urbain.
+        """
+        rgb = np.asarray(moyennes).astype(np.int64)
+        distances = np.abs(rgb[:, None, :] - CENTRES_CARTE.astype(np.int64)[None]).sum(axis=2)
+        plus_proche = distances.argmin(axis=1)
+        minimum = distances[np.arange(len(distances)), plus_proche]
+        unique = (distances == minimum[:, None]).sum(axis=1) == 1
+        return np.where(unique & (minimum <= seuil), plus_proche, 2).astype(np.int8)
+
+    @property
+    def arbre(self):
+        """Arbre au format historique (listes imbriquées de tuples), converti depuis self.quadtree."""
+        if self._arbre is None:
+            self._arbre = self.quadtree.vers_imbrique()
+        return self._arbre
+
+    @arbre.setter
+    def arbre(self, valeur):
+        self._arbre = valeur
+        self.quadtree = Arbre_quadtree.depuis_imbrique(valeur, self.hauteur, self.largeur)
 
     def recurrence(self, tile):
+        """Arbre de la tuile au format historique (voir construire_arbre)."""
+        return self.construire_arbre(tile).vers_imbrique()
+
+    @staticmethod
+    def tables_integrales(tile):
         """
-        Fonction récursive qui découpe la tuile en quatre si les couleurs varient trop.
-        On répète tant que la variance soit acceptable
+        Image intégrale (hauteur+1, largeur+1, 6) en int64 des valeurs (canaux 0 à 2) et de
+        leurs carrés (canaux 3 à 5) : S[i, j] est la somme sur les pixels tile[:i, :j].
         """
         h, l, _ = tile.shape
-        #Condition d'arrêt : variance faible ou tuile trop petite
-        if h * l == 0 or h <= 1 or l <= 1 or (self.variance_tile(tile) < self.seuil_variance).all():
-            moy = tile.reshape(-1, 3).mean(0)
-            return self.quelle_couleur(moy)
-        # sinon, on découpe en 4 et on continue la récurrence
-        h0, l0 = h // 2, l // 2
-        return [
-            self.recurrence(tile[0:h0,0:l0]),
-            self.recurrence(tile[0:h0,l0:l]),
-            self.recurrence(tile[h0:h,0:l0]),
-            self.recurrence(tile[h0:h,l0:l]),
-        ]
+        tables = np.zeros((h + 1, l + 1, 6), dtype=np.int64)
+        valeurs = np.empty((h, l, 6), dtype=np.int64)
+        valeurs[..., :3] = tile
+        np.multiply(valeurs[..., :3], valeurs[..., :3], out=valeurs[..., 3:])
+        np.cumsum(valeurs, axis=0, out=valeurs)
+        np.cumsum(valeurs, axis=1, out=tables[1:, 1:])
+        return tables
+
+    @staticmethod
+    def sommes_zones(tables, y0, x0, h, l):
+        """Sommes des valeurs puis des carrés (m, 6) des rectangles donnés, en 4 lectures de table chacun."""
+        return tables[y0 + h, x0 + l] - tables[y0, x0 + l] - tables[y0 + h, x0] + tables[y0, x0]
+
+    def variances_faibles(self, n, sommes):
+        """
+        Vrai pour les nœuds dont la variance de chaque canal est sous le seuil.
+        variance = (n*Σx² - (Σx)²) / n², calculée en entiers exacts puis arrondie une seule fois.
+        Jusqu'à 2**18 pixels, numérateur et dénominateur tiennent exactement dans un float64 ;
+        au-delà (quelques nœuds du haut de l'arbre), le calcul se fait en entiers Python.
+        """
+        s, q = sommes[:, :3], sommes[:, 3:]
+        resultat = np.empty(len(n), dtype=bool)
+        petits = n <= 1 << 18
+        np_ = n[petits, None]
+        resultat[petits] = ((np_ * q[petits] - s[petits] ** 2) / (np_ * np_) < self.seuil_variance).all(axis=1)
+        for i in np.flatnonzero(~petits).tolist():
+            ni = int(n[i])
+            resultat[i] = all((ni * qc - sc * sc) / (ni * ni) < self.seuil_variance
+                              for sc, qc in zip(s[i].tolist(), q[i].tolist()))
+        return resultat
+
+    def construire_arbre(self, tile) -> Arbre_quadtree:
+        """
+        Construit l'arbre de la tuile niveau par niveau, sans récursion : un nœud est une
+        feuille si ses couleurs varient peu ou s'il fait un pixel de haut ou de large, sinon
+        il est découpé en quatre au niveau suivant. Moyennes et variances de tous les nœuds
+        d'un niveau sont lues d'un coup dans l'image intégrale de la tuile.
+        """
+        tables = self.tables_integrales(tile)
+        h, l, _ = tile.shape
+        arbre = Arbre_quadtree(h, l)
+        y0, x0, h, l = (np.array([v], dtype=np.int32) for v in (0, 0, h, l))
+        while len(y0):
+            n = h.astype(np.int64) * l
+            sommes = self.sommes_zones(tables, y0, x0, h, l)
+            feuille = (h <= 1) | (l <= 1)
+            feuille[~feuille] = self.variances_faibles(n[~feuille], sommes[~feuille])
+            couleur = np.full(len(n), -1, dtype=np.int8)
+            couleur[feuille] = self.quelle_couleur_lot(sommes[feuille, :3] / n[feuille, None])
+            arbre.ajouter_niveau(y0, x0, h, l, feuille, couleur)
+            y0, x0, h, l = Arbre_quadtree.enfants(y0[~feuille], x0[~feuille], h[~feuille], l[~feuille])
+        return arbre
 
     def reconstruction(self):
         """
-        Fonction permettant la reconstruction de l'image
+        Fonction permettant la reconstruction de l'image : chaque feuille est peinte de sa couleur
         """
-        final = np.zeros((self.hauteur, self.largeur, 3), dtype=np.uint8) #initialisation du tableau de l'image finale
-        def _fill(arbre, y0, x0, h, l):
-            """Fonction récursive interne qui rempli final à partir de l'arbre"""
-            if isinstance(arbre, tuple): #si arbre est une couleur on peut remplir la zone
-                final[y0:y0+h, x0:x0+l] = arbre
-                return
-            h0, l0 = h // 2, l // 2
-            _fill(arbre[0], y0, x0, h0, l0)
-            _fill(arbre[1], y0, x0 + l0, h0, l - l0)
-            _fill(arbre[2], y0 + h0, x0, h - h0, l0)
-            _fill(arbre[3], y0 + h0, x0 + l0, h - h0, l - l0)
-
-        _fill(self.arbre, 0, 0, self.hauteur, self.largeur)
-        return final
\ No newline at end of file
+        return COULEURS_ZONES[self.quadtree.peindre()]
\ No newline at end of file
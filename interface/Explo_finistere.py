@@ -1,11 +1,15 @@
 import os
 import shutil
-import numpy as np
 from PyQt5 import QtCore, QtGui, QtWidgets
 from PyQt5.QtWidgets import QFileDialog, QMessageBox
 
 from Drone import Drone
-from Traitement_image import Kmean, Moyenne_couleur, Traitement_image
+from Cache_tuiles import Cache_tuiles
+from Cache_segmentation import Cache_segmentation
+from Stockage_tuiles import Stockage_mbtiles
+from Traitement_image import Moyenne_couleur, Traitement_incremental
+from Pipeline import Kmean_incremental
+from Calcul_parallele import Calcul_parallele
 
 class CheckableMenu(QtWidgets.QMenu):
     """Créé le menu contenant des cases à cocher"""
@@ -28,12 +32,25 @@ class CheckableMenu(QtWidgets.QMenu):
 
 class ExploWindow(object):
     """Fenêtre d'exploration"""
-    def __init__(self, mission_name, lat_ini, lon_ini, zoom):
-        """Initialisation de la classe"""
+    def __init__(self, mission_name, lat_ini, lon_ini, zoom, fichier_tuiles="tiles.mbtiles"):
+        """
+        Initialisation de la classe
+        fichier_tuiles : fichier MBTiles où sont stockées les tuiles capturées, conservé
+        d'une session à l'autre
+        """
         self.mission_name = mission_name
+        self.fichier_tuiles = fichier_tuiles
         self.lat = lat_ini
         self.lon = lon_ini
         self.zoom = zoom
+        self.kmean = None        # K-means incrémental, créé au premier filtrage
+        self.nb_segmentees = 0   # tuiles de drone.visited_tiles déjà données au K-means
+        self.incrementaux = {}   # méthode -> [Traitement_incremental, tuiles de drone.visited_tiles déjà ajoutées]
+        # quadtree de "Variance" réparti sur les cœurs de la machine (processus lancés au premier filtrage)
+        self.parallele = Calcul_parallele() if (os.cpu_count() or 1) > 1 else None
+        # zones d'une tuile de même contenu qu'une tuile déjà vue (la pleine mer, ...) et mosaïque
+        # déjà filtrée par "Variance" (filtrage sans nouvelle tuile) : reprises sans être recalculées
+        self.cache_segmentation = Cache_segmentation()
 
     def setupUi(self, MainWindow):
         """Configuration de la fenêtre"""
@@ -127,10 +144,12 @@ class ExploWindow(object):
         self.coord_label.setText(f"Lat: {self.lat:.4f} | Lon: {self.lon:.4f}")
 
         MainWindow.setCentralWidget(cw)
-        MainWindow.setStatusBar(QtWidgets.QStatusBar(MainWindow))
+        self.statusbar = QtWidgets.QStatusBar(MainWindow)
+        MainWindow.setStatusBar(self.statusbar)
 
         #Connexions
-        self.drone       = Drone()
+        self.drone       = Drone(cache=Cache_tuiles(), prechargement=True,
+                                 stockage=Stockage_mbtiles(self.fichier_tuiles))
         self.btnLaunch.clicked.connect(self.capture)
         self.btnLeft.clicked.connect(lambda: self.move("gauche"))
         self.btnUp.clicked.connect(lambda: self.move("haut"))
@@ -152,36 +171,31 @@ class ExploWindow(object):
 
     def base(self):
         """utilise la fonction recoller de Drone """
-        base = self.drone.recoller()
+        base = self.drone.recoller(output_file=None)
         if base is not None:
             self.affichage(base)
 
     def traitement_et_affichage(self):
         #Reconstruire l'image satellite
-        base = self.drone.recoller()
+        base = self.drone.recoller(output_file=None)
         if base is None:
             return
 
-        #Application de la méthode de traitement utilisée
-        tmp = "_tmp_mosaic.png"
-        base.save(tmp)
+        #Si aucune case n'est cochée, on affiche la base sans rien calculer
+        checks = [cb for cb in self.terrainMenu.checkboxes if cb.isChecked()]
+        if not checks:
+            return self.affichage(base)
+
+        #Application de la méthode de traitement utilisée, directement sur les images en mémoire
         method = self.comboMethod.currentText()
         if method == "Satellite":
-            seg_img, helper = base.copy(), Traitement_image(tmp)
+            helper = self.masques_incrementaux(method, self.drone.mosaique.tuile)
         elif method == "K-means":
-            seg_obj = Kmean(tmp)
-            seg_img, helper = seg_obj.segmented_img, seg_obj
-        else:  # "Variance"
-            seg_obj = Moyenne_couleur(tmp)
-            seg_img, helper = seg_obj.img, seg_obj
-
-        #Recharger les masques dans helper
-        helper.img       = seg_img
-        helper.img_array = np.array(seg_img)
-        helper.hauteur, helper.largeur = helper.img_array.shape[:2]
-        helper.creer_masques_couleurs()
-        helper.tracer_trait_de_cote()
-        helper.trouver_eaux_interieur()
+            self.segmenter_kmeans()
+            helper = self.masques_incrementaux(method, self.kmean.mosaique.tuile)
+        else:  # "Variance" : le quadtree dépend de toute la mosaïque
+            helper = Moyenne_couleur(base, parallele=self.parallele, sauvegarde=None,
+                                     cache=self.cache_segmentation)
 
     #Préparation du  mapping
         filter_map = {
@@ -194,26 +208,42 @@ class ExploWindow(object):
             "Mer":              ("mer",            (0, 0, 125)),
         }
 
-        #Si aucune case n'est cochée, on affiche la base
-        checks = self.terrainMenu.checkboxes
-        if not any(cb.isChecked() for cb in checks):
-            return self.affichage(base)
-
-        #On ajoute les masques coché dans l'ordre de superposition
+        #On ajoute les masques coché dans l'ordre de superposition ; seuls ces masques
+        #(et ce dont ils dépendent) sont calculés par helper
         img = base.copy()
         for cb in checks:
-            if not cb.isChecked():
-                continue
-            name = cb.text()
-            attr, color = filter_map[name]
-            mask = getattr(helper, attr)
-            helper.img_array = np.array(img)
-            helper.hauteur, helper.largeur = helper.img_array.shape[:2]
-            img = helper.appliquer_masque(mask, color)
+            attr, color = filter_map[cb.text()]
+            img = helper.appliquer_masque(getattr(helper, attr), color, base=img)
 
         #Affichage final
         self.affichage(img)
 
+    def segmenter_kmeans(self):
+        """
+        Segmentation K-means incrémentale : seules les tuiles capturées depuis le dernier
+        filtrage sont traitées, les centres étant repris du filtrage précédent.
+        """
+        if self.kmean is None:
+            self.kmean = Kmean_incremental()
+        nouvelles = self.drone.visited_tiles[self.nb_segmentees:]
+        self.nb_segmentees = len(self.drone.visited_tiles)
+        mosaique = self.drone.mosaique
+        self.kmean.ajouter_tuiles([(x, y, mosaique.tuile(x, y)) for x, y, _ in nouvelles])
+        return self.kmean.image()
+
+    def masques_incrementaux(self, method, tuile):
+        """
+        Masques de la méthode tenus à jour tuile par tuile : seules les tuiles capturées
+        depuis le dernier filtrage (images données par tuile(x, y)) sont traitées.
+        """
+        if method not in self.incrementaux:
+            self.incrementaux[method] = [Traitement_incremental(cache=self.cache_segmentation), 0]
+        helper, deja_vues = self.incrementaux[method]
+        nouvelles = self.drone.visited_tiles[deja_vues:]
+        self.incrementaux[method][1] = len(self.drone.visited_tiles)
+        helper.ajouter_tuiles([(x, y, tuile(x, y)) for x, y, _ in nouvelles])
+        return helper
+
     def capture(self):
         """Utilise la méthode de capture d'image de Drone"""
         self.drone.capture_image(self.lat, self.lon, self.zoom)
@@ -227,6 +257,7 @@ class ExploWindow(object):
         self.base()
         self.lat, self.lon = self.drone.get_coordinates()
         self.coord_label.setText(f"Lat: {self.lat:.4f} | Lon: {self.lon:.4f}")
+        self.statusbar.showMessage(f"Tuiles préchargées : {self.drone.taux_prechargement():.0%}")
 
     def save(self):
         """Enregistrement de l'image dans le fichier"""
@@ -243,7 +274,13 @@ class ExploWindow(object):
             QMessageBox.information(None, "Enregistré", f"Image sauvegardée dans :\n{path}")
 
     def finish(self):
-        """Supprime les fichiers provisoires et ferme proprement la fenêtre"""
+        """Supprime les fichiers provisoires et ferme proprement la fenêtre (le cache et le stockage des tuiles sont conservés)"""
+        print(f"Taux de préchargement : {self.drone.taux_prechargement():.0%}")
+        print(f"Segmentations reprises du cache : {self.cache_segmentation.statistiques()['taux_hits']:.0%}")
+        self.drone.arreter_prechargement()
+        self.drone.stockage.fermer()
+        if self.parallele is not None:
+            self.parallele.fermer()
         if os.path.isdir("tiles"):
             shutil.rmtree("tiles")
         for f in ("mosaic.png","_tmp_mosaic.png","Kmean.png","Moyenne_couleur.png"):
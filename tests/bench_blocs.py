@@ -0,0 +1,68 @@
+"""
+Benchmark du traitement par blocs de Traitement_image (taille_bloc) : zones, mer et
+trait de côte d'une mosaïque segmentée projetée en mémoire (.npy), calculés sur
+l'image entière ou par blocs de 1024 pixels avec le raster de classes lui aussi
+projeté. Mesure la durée et le pic de mémoire alloué (tracemalloc, qui suit les
+tableaux NumPy), et vérifie que le raster de classes est identique.
+Lancer depuis la racine : python tests/bench_blocs.py
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Kmean, Traitement_image
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+TAILLE_BLOC = 1024
+
+
+def mesurer(f):
+    tracemalloc.start()
+    debut = time.perf_counter()
+    resultat = f()
+    duree = time.perf_counter() - debut
+    pic = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return resultat, duree, pic
+
+
+def traiter(fichier, **options):
+    helper = Traitement_image(np.load(fichier, mmap_mode="r"), **options)
+    helper.tracer_trait_de_cote()
+    return helper.classes
+
+
+if __name__ == "__main__":
+    with contextlib.redirect_stdout(io.StringIO()):
+        carte = Kmean(FICHIER, methode="palette").img_array
+    os.remove("Kmean.png")
+    dossier = tempfile.mkdtemp()
+    try:
+        print(f"{'taille':>12} {'entière (s)':>12} {'pic (Mo)':>9} {'blocs (s)':>10} {'pic (Mo)':>9} {'identique':>10}")
+        for cote in (2048, 4096, 8192):
+            fichier = os.path.join(dossier, "mosaique.npy")
+            mosaique = np.lib.format.open_memmap(fichier, mode="w+", dtype=np.uint8, shape=(cote, cote, 3))
+            for y in range(0, cote, carte.shape[0]):
+                for x in range(0, cote, carte.shape[1]):
+                    morceau = carte[:cote - y, :cote - x]
+                    mosaique[y:y + morceau.shape[0], x:x + morceau.shape[1]] = morceau
+            mosaique.flush()
+            del mosaique
+
+            entiere, duree_entiere, pic_entiere = mesurer(lambda: traiter(fichier))
+            par_blocs, duree, pic = mesurer(lambda: traiter(
+                fichier, taille_bloc=TAILLE_BLOC, fichier_classes=os.path.join(dossier, "classes.npy")))
+            identique = bool((entiere == par_blocs).all())
+            print(f"{f'{cote}x{cote}':>12} {duree_entiere:>12.2f} {pic_entiere / 1e6:>9.0f}"
+                  f" {duree:>10.2f} {pic / 1e6:>9.0f} {str(identique):>10}")
+            del entiere, par_blocs
+    finally:
+        shutil.rmtree(dossier)
@@ -0,0 +1,64 @@
+"""
+Benchmark de Cache_segmentation : segmentation tuile par tuile d'une zone de 16x16 tuiles
+dont les trois quarts sont de la pleine mer (tuiles identiques, de la couleur de l'eau
+sur la carte) et le reste découpé dans tests/finistere.PNG, vue deux fois comme quand
+on revient sur ses pas. Méthodes Kmean "palette" et "histogramme" et Moyenne_couleur,
+sans puis avec le cache ; le taux de hits et la concordance des résultats sont affichés.
+Lancer depuis la racine : python tests/bench_cache_segmentation.py
+"""
+import os
+import sys
+import time
+import warnings
+
+import numpy as np
+from PIL import Image
+from sklearn.exceptions import ConvergenceWarning
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Cache_segmentation import Cache_segmentation
+from Traitement_image import Kmean, Moyenne_couleur, table_palette
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+COTE = 16
+PASSAGES = 2
+METHODES = {
+    "Kmean palette": lambda tuile, cache: Kmean(tuile, methode="palette", sauvegarde=None, cache=cache).img_array,
+    "Kmean histogramme": lambda tuile, cache: Kmean(tuile, methode="histogramme", sauvegarde=None,
+                                                    cache=cache).img_array,
+    "Moyenne_couleur": lambda tuile, cache: Moyenne_couleur(tuile, sauvegarde=None, cache=cache).img_array,
+}
+
+
+def tuiles():
+    """Tuiles de la zone, ligne par ligne : mer sauf sur la bande de gauche."""
+    carte = np.array(Image.open(FICHIER).convert("RGB"))
+    mer = np.full((256, 256, 3), (170, 211, 223), dtype=np.uint8)
+    nx, ny = carte.shape[1] // 256, carte.shape[0] // 256
+    zone = []
+    for y in range(COTE):
+        for x in range(COTE):
+            if x < COTE // 4:
+                zone.append(carte[(y % ny) * 256:(y % ny + 1) * 256, (x % nx) * 256:(x % nx + 1) * 256])
+            else:
+                zone.append(mer)
+    return zone
+
+
+if __name__ == "__main__":
+    warnings.simplefilter("ignore", ConvergenceWarning)  # tuiles de mer : une seule couleur
+    zone = tuiles()
+    table_palette(5, 4)
+    print(f"{COTE * COTE} tuiles, {PASSAGES} passages")
+    print(f"{'méthode':<18} {'sans cache (s)':>15} {'avec cache (s)':>15} {'taux de hits':>13} {'identique':>10}")
+    for nom, segmenter in METHODES.items():
+        debut = time.perf_counter()
+        attendu = [segmenter(tuile, None) for _ in range(PASSAGES) for tuile in zone]
+        duree_sans = time.perf_counter() - debut
+        cache = Cache_segmentation()
+        debut = time.perf_counter()
+        resultats = [segmenter(tuile, cache) for _ in range(PASSAGES) for tuile in zone]
+        duree = time.perf_counter() - debut
+        identique = all((r == a).all() for r, a in zip(resultats, attendu))
+        taux = cache.statistiques()["taux_hits"]
+        print(f"{nom:<18} {duree_sans:>15.2f} {duree:>15.2f} {taux:>13.1%} {str(identique):>10}")
@@ -0,0 +1,60 @@
+"""
+Benchmark du filtrage de l'explorateur sur une mosaïque répétée à partir de
+tests/finistere.PNG : ancien chemin (mosaïque écrite dans _tmp_mosaic.png puis relue,
+Moyenne_couleur.png écrit à chaque filtrage) contre images passées directement en
+mémoire, sans fichier. Méthodes "Satellite" (masque des routes) et "Variance"
+(Moyenne_couleur puis masque aquatique).
+Lancer depuis la racine : python tests/bench_en_memoire.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Moyenne_couleur, Traitement_image
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+
+
+def ancien(base, methode, dossier):
+    tmp = os.path.join(dossier, "_tmp_mosaic.png")
+    base.save(tmp)
+    if methode == "Satellite":
+        helper = Traitement_image(tmp)
+        return helper.appliquer_masque(helper.routes, (255, 215, 0), base=base)
+    helper = Moyenne_couleur(tmp, sauvegarde=os.path.join(dossier, "Moyenne_couleur.png"))
+    return helper.appliquer_masque(helper.aquatique, (0, 0, 255), base=base)
+
+
+def en_memoire(base, methode, dossier):
+    if methode == "Satellite":
+        helper = Traitement_image(base)
+        return helper.appliquer_masque(helper.routes, (255, 215, 0), base=base)
+    helper = Moyenne_couleur(base, sauvegarde=None)
+    return helper.appliquer_masque(helper.aquatique, (0, 0, 255), base=base)
+
+
+if __name__ == "__main__":
+    carte = np.array(Image.open(FICHIER).convert("RGB"))
+    dossier = tempfile.mkdtemp()
+    try:
+        print(f"{'mosaïque':>10} {'méthode':>10} {'fichiers (s)':>13} {'mémoire (s)':>12} {'identique':>10}")
+        for cote in (1024, 2048, 4096):
+            reps = (-(-cote // carte.shape[0]), -(-cote // carte.shape[1]), 1)
+            base = Image.fromarray(np.ascontiguousarray(np.tile(carte, reps)[:cote, :cote]))
+            for methode in ("Satellite", "Variance"):
+                debut = time.perf_counter()
+                attendu = ancien(base, methode, dossier)
+                duree_ancienne = time.perf_counter() - debut
+                debut = time.perf_counter()
+                resultat = en_memoire(base, methode, dossier)
+                duree = time.perf_counter() - debut
+                identique = (np.asarray(resultat) == np.asarray(attendu)).all()
+                print(f"{f'{cote}x{cote}':>10} {methode:>10} {duree_ancienne:>13.2f} {duree:>12.2f} {str(identique):>10}")
+    finally:
+        shutil.rmtree(dossier)
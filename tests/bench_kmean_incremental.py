@@ -0,0 +1,55 @@
+"""
+Benchmark du filtre K-means de l'explorateur après n déplacements : K-means complet
+sur toute la mosaïque (Kmean, méthode "histogramme") contre K-means incrémental
+(Kmean_incremental, seule la nouvelle tuile est traitée). Les tuiles sont découpées
+dans tests/finistere.PNG, parcourues en spirale comme dans bench_mosaique.py.
+Lancer depuis la racine : python tests/bench_kmean_incremental.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Drone import Mosaique
+from Pipeline import Kmean_incremental
+from Traitement_image import Kmean
+from bench_mosaique import trajet
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+DEPLACEMENTS = {"droite": (1, 0), "gauche": (-1, 0), "haut": (0, -1), "bas": (0, 1)}
+
+
+if __name__ == "__main__":
+    carte = np.array(Image.open(FICHIER).convert("RGB"))
+    nx, ny = carte.shape[1] // 256, carte.shape[0] // 256
+
+    def tuile(x, y):
+        x, y = x % nx, y % ny
+        return carte[y * 256:(y + 1) * 256, x * 256:(x + 1) * 256]
+
+    positions = [(0, 0)]
+    for direction in trajet(120):
+        dx, dy = DEPLACEMENTS[direction]
+        positions.append((positions[-1][0] + dx, positions[-1][1] + dy))
+
+    mosaique = Mosaique()
+    incremental = Kmean_incremental()
+    print(f"{'déplacements':>12} {'complet (ms)':>13} {'incrémental (ms)':>17}")
+    for n, (x, y) in enumerate(positions):
+        mosaique.ajouter(x, y, Image.fromarray(tuile(x, y)))
+        debut = time.perf_counter()
+        incremental.ajouter_tuiles([(x, y, tuile(x, y))])
+        duree_inc = time.perf_counter() - debut
+        if n in (1, 10, 30, 60, 120):
+            debut = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                Kmean(np.array(mosaique.image()), methode="histogramme")
+            duree_complet = time.perf_counter() - debut
+            print(f"{n:>12} {duree_complet * 1000:>13.1f} {duree_inc * 1000:>17.1f}")
+    if os.path.exists("Kmean.png"):
+        os.remove("Kmean.png")
@@ -0,0 +1,77 @@
+"""
+Benchmark des masques de Traitement_image sur la segmentation de tests/finistere.PNG :
+anciens masques booléens pleine taille (12 comparaisons, Sobel en float64) contre
+raster de classes uint8 et masques dérivés. Mesure le temps de calcul (zones, mer
+et trait de côte, eaux intérieures), la mémoire gardée par l'objet, le temps de
+lecture de tous les masques, et le coût d'une seule couche cochée (calcul paresseux)
+avec les masques gardés tels quels ou compactés par np.packbits.
+Lancer depuis la racine : python tests/bench_masques.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import ndimage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Kmean, Traitement_image
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+NOMS = ("aquatique", "rural", "urbain", "routes", "mer", "trait_de_cote", "eaux_interieur")
+
+
+def anciens_masques(arr):
+    """Méthode d'origine : un tableau booléen pleine taille par masque."""
+    m = {}
+    m["aquatique"] = (arr[:, :, 0] == 0) & (arr[:, :, 1] == 0) & (arr[:, :, 2] == 255)
+    m["rural"] = (arr[:, :, 0] == 34) & (arr[:, :, 1] == 139) & (arr[:, :, 2] == 34)
+    m["urbain"] = (arr[:, :, 0] == 105) & (arr[:, :, 1] == 105) & (arr[:, :, 2] == 105)
+    m["routes"] = (arr[:, :, 0] == 255) & (arr[:, :, 1] == 215) & (arr[:, :, 2] == 0)
+    m["mer"] = Traitement_image.extraire_mer(m["aquatique"])
+    grad = np.hypot(ndimage.sobel(m["mer"].astype(float), axis=1), ndimage.sobel(m["mer"].astype(float), axis=0))
+    m["trait_de_cote"] = grad > 1
+    m["eaux_interieur"] = m["aquatique"] & ~m["mer"]
+    return m
+
+
+if __name__ == "__main__":
+    with contextlib.redirect_stdout(io.StringIO()):
+        arr = Kmean(FICHIER, methode="palette").img_array
+    os.remove("Kmean.png")
+
+    debut = time.perf_counter()
+    anciens = anciens_masques(arr)
+    duree_ancienne = time.perf_counter() - debut
+    memoire_ancienne = sum(m.nbytes for m in anciens.values())
+
+    helper = Traitement_image(arr, masques_compacts=True)
+    debut = time.perf_counter()
+    helper.creer_masques_couleurs()
+    helper.tracer_trait_de_cote()
+    helper.trouver_eaux_interieur()
+    duree = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    identiques = all((getattr(helper, nom) == anciens[nom]).all() for nom in NOMS)
+    lecture = time.perf_counter() - debut
+
+    print(f"{arr.shape[1]}x{arr.shape[0]} pixels, masques identiques : {identiques}")
+    memoire = helper.classes.nbytes + sum(m.nbytes for m in helper._masques.values())
+    print(f"{'tous les masques':<24} {'calcul (s)':>11} {'mémoire (Mo)':>13}")
+    print(f"{'masques booléens':<24} {duree_ancienne:>11.3f} {memoire_ancienne / 1e6:>13.1f}")
+    print(f"{'raster + compacts':<24} {duree:>11.3f} {memoire / 1e6:>13.1f}")
+    print(f"lecture des {len(NOMS)} masques dérivés (avec comparaison) : {lecture:.3f} s")
+
+    print(f"{'une couche cochée':<24} {'calcul (s)':>11} {'mémoire (Mo)':>13}")
+    for nom in ("routes", "mer", "trait_de_cote"):
+        for compacts in (False, True):
+            helper = Traitement_image(arr, masques_compacts=compacts)
+            debut = time.perf_counter()
+            getattr(helper, nom)
+            duree = time.perf_counter() - debut
+            memoire = helper.classes.nbytes + sum(m.nbytes for m in helper._masques.values())
+            libelle = nom + (" (compact)" if compacts else "")
+            print(f"{libelle:<24} {duree:>11.3f} {memoire / 1e6:>13.1f}")
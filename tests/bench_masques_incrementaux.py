@@ -0,0 +1,65 @@
+"""
+Benchmark des masques de l'explorateur après n déplacements : zones, mer et trait de
+côte recalculés sur toute la mosaïque segmentée (Traitement_image) contre mise à jour
+par la seule nouvelle tuile (Traitement_incremental). Les tuiles sont découpées dans la
+segmentation "palette" de tests/finistere.PNG et parcourues en spirale comme dans
+bench_mosaique.py. La mise à jour est donnée en moyenne et maximum sur les
+déplacements depuis la mesure précédente : elle coûte plus cher quand une étendue
+d'eau change de statut (le bord de la mosaïque s'en éloigne ou une tuile la relie à
+la mer), car toutes ses tuiles sont alors réécrites. La lecture des deux masques (mer,
+trait de côte) sur toute la mosaïque, faite à chaque affichage, est mesurée à part ;
+le raster de classes est comparé à la fin du vol.
+Lancer depuis la racine : python tests/bench_masques_incrementaux.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Kmean, Traitement_image, Traitement_incremental, table_classes
+from bench_mosaique import trajet
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+DEPLACEMENTS = {"droite": (1, 0), "gauche": (-1, 0), "haut": (0, -1), "bas": (0, 1)}
+MESURES = (1, 10, 30, 60, 120, 240)
+
+
+if __name__ == "__main__":
+    carte = Kmean(FICHIER, methode="palette", sauvegarde=None).img_array
+    nx, ny = carte.shape[1] // 256, carte.shape[0] // 256
+
+    def tuile(x, y):
+        x, y = x % nx, y % ny
+        return carte[y * 256:(y + 1) * 256, x * 256:(x + 1) * 256]
+
+    positions = [(0, 0)]
+    for direction in trajet(MESURES[-1]):
+        dx, dy = DEPLACEMENTS[direction]
+        positions.append((positions[-1][0] + dx, positions[-1][1] + dy))
+
+    table_classes()
+    incremental = Traitement_incremental()
+    print(f"{'déplacements':>12} {'mosaïque':>10} {'complet (ms)':>13} {'mise à jour moy./max (ms)':>26}"
+          f" {'lecture masques (ms)':>21}")
+    durees = []
+    for n, (x, y) in enumerate(positions):
+        debut = time.perf_counter()
+        incremental.ajouter_tuile(x, y, tuile(x, y))
+        durees.append(time.perf_counter() - debut)
+        if n in MESURES:
+            debut = time.perf_counter()
+            incremental.mer, incremental.trait_de_cote  # noqa: B018 (masques lus comme dans l'explorateur)
+            duree_lecture = time.perf_counter() - debut
+            mosaique = np.array(incremental.img_array)
+            debut = time.perf_counter()
+            complet = Traitement_image(mosaique)
+            complet.mer, complet.trait_de_cote  # noqa: B018
+            duree_complet = time.perf_counter() - debut
+            taille = f"{mosaique.shape[1]}x{mosaique.shape[0]}"
+            mise_a_jour = f"{np.mean(durees) * 1000:.1f} / {max(durees) * 1000:.1f}"
+            print(f"{n:>12} {taille:>10} {duree_complet * 1000:>13.1f} {mise_a_jour:>26}"
+                  f" {duree_lecture * 1000:>21.1f}")
+            durees = []
+    print("raster identique :", bool((complet.classes == incremental.classes).all()))
@@ -0,0 +1,40 @@
+"""
+Durée d'une mission multi-zoom (Programme_final_20_mai) selon le nombre de drones
+traités en parallèle : capture (threads) puis segmentation K-means (processus).
+Lancer depuis la racine : python tests/bench_mission.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Programme_final_20_mai"))
+from Main import Mission
+from serveur_tuiles import ServeurTuiles
+
+ZONE = (48.2, 48.6, -4.8, -4.0)  # lat_min, lat_max, lon_min, lon_max
+ZOOMS = [10, 11, 12]
+
+
+def mission(serveur, max_paralleles):
+    m = Mission("bench", len(ZOOMS), *ZONE, ZOOMS, dossier_pyramide=None, max_paralleles=max_paralleles)
+    for drone in m.liste_drones:
+        drone.url_tuiles = serveur.url_tuiles
+    debut = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        m.lancer_reconnaissance()
+        capture = time.perf_counter() - debut
+        m.segmenter_images()
+    total = time.perf_counter() - debut
+    return m, capture, total
+
+
+if __name__ == "__main__":
+    with ServeurTuiles(latence=0.05) as serveur:
+        for max_paralleles in (1, None):
+            m, capture, total = mission(serveur, max_paralleles)
+            plus_lent = max(r["duree_capture"] + r.get("duree_segmentation", 0) for r in m.rapport.values())
+            print(f"max_paralleles={max_paralleles}: capture {capture:.2f} s, total {total:.2f} s "
+                  f"(drone le plus lent : {plus_lent:.2f} s)")
+            m.afficher_rapport()
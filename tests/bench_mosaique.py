@@ -0,0 +1,64 @@
+"""
+Benchmark de la latence d'un déplacement (deplacement + recoller) après 10, 100
+et 1000 déplacements, comparée au recollage complet depuis les fichiers de tiles/.
+Lancer depuis la racine : python tests/bench_mosaique.py
+"""
+import os
+import shutil
+import sys
+import time
+import contextlib
+import io
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Drone import Drone
+
+
+def recoller_depuis_fichiers(visited_tiles):
+    """Ancienne méthode : relit chaque tuile visitée et recolle tout."""
+    xs = [t[0] for t in visited_tiles]
+    ys = [t[1] for t in visited_tiles]
+    mosaic = Image.new("RGB", ((max(xs) - min(xs) + 1) * 256, (max(ys) - min(ys) + 1) * 256))
+    for x, y, zoom in visited_tiles:
+        mosaic.paste(Image.open(f"tiles/tuile_{zoom}_{x}_{y}.png"), ((x - min(xs)) * 256, (y - min(ys)) * 256))
+    return mosaic
+
+
+def trajet(n):
+    """Spirale carrée : la zone survolée reste compacte, comme dans l'explorateur."""
+    directions, pas, i = ["droite", "bas", "gauche", "haut"], 1, 0
+    while True:
+        for _ in range(2):
+            for _ in range(pas):
+                if i == n:
+                    return
+                yield directions[0]
+                i += 1
+            directions = directions[1:] + directions[:1]
+        pas += 1
+
+
+if __name__ == "__main__":
+    drone = Drone()
+    drone.download_tile = lambda x, y, z: Image.new("RGB", (256, 256), (x % 256, y % 256, 0))
+    with contextlib.redirect_stdout(io.StringIO()):
+        drone.capture_image(48.0, -4.0, 11)
+    print(f"{'déplacements':>12} {'incrémental (ms)':>17} {'depuis fichiers (ms)':>21}")
+    fait = 0
+    for n in (10, 100, 1000):
+        with contextlib.redirect_stdout(io.StringIO()):
+            for direction in list(trajet(n))[fait:n - 1]:
+                drone.deplacement(direction)
+            direction = list(trajet(n))[n - 1]
+            debut = time.perf_counter()
+            drone.deplacement(direction)
+            drone.recoller(output_file=None)
+            incremental = time.perf_counter() - debut
+        fait = n
+        debut = time.perf_counter()
+        recoller_depuis_fichiers(drone.visited_tiles)
+        complet = time.perf_counter() - debut
+        print(f"{n:>12} {incremental * 1000:>17.1f} {complet * 1000:>21.1f}")
+    shutil.rmtree("tiles")
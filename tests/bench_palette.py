@@ -0,0 +1,38 @@
+"""
+Segmentations "histogramme" et "palette" (table de correspondance) comparées au K-means de Kmean :
+durée et taux d'accord des zones sur une vraie carte du Finistère.
+Lancer depuis la racine : python tests/bench_palette.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Kmean, Traitement_image, table_palette
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+
+
+def chronometrer(fonction):
+    debut = time.perf_counter()
+    resultat = fonction()
+    return resultat, time.perf_counter() - debut
+
+
+if __name__ == "__main__":
+    helper = Traitement_image(FICHIER)
+    print(f"{FICHIER} : {helper.largeur}x{helper.hauteur} pixels")
+    helper.methode = "kmeans"
+    reference, duree_km = chronometrer(lambda: np.array(Kmean.k_means(helper, 4)))
+    print(f"{'méthode':<16} {'durée (s)':>10} {'accord':>8}")
+    print(f"{'kmeans':<16} {duree_km:>10.3f} {1:>8.2%}")
+    helper.methode = "histogramme"
+    img, duree = chronometrer(lambda: np.array(Kmean.k_means(helper, 4)))
+    print(f"{'histogramme':<16} {duree:>10.3f} {(img == reference).all(axis=2).mean():>8.2%}")
+    for bits in (5, 6, 8):
+        _, duree_table = chronometrer(lambda: table_palette(bits))
+        img, duree = chronometrer(lambda: np.array(Kmean.palette(helper, 4, bits)))
+        accord = (img == reference).all(axis=2).mean()
+        print(f"{f'palette {bits} bits':<16} {duree:>10.3f} {accord:>8.2%}   (table : {duree_table:.3f} s, une fois)")
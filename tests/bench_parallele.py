@@ -0,0 +1,73 @@
+"""
+Benchmark de Calcul_parallele : segmentation d'une mosaïque de 4096x4096 pixels répétée
+à partir de tests/finistere.PNG, en séquentiel puis avec 1, 2, 4, ... processus jusqu'au
+nombre de cœurs de la machine. Étapes mesurées : Kmean "palette" et "histogramme",
+zones et trait de côte (Traitement_image sur la segmentation) et Moyenne_couleur.
+Chaque résultat est comparé au calcul séquentiel. Le pool est lancé (et ses processus
+créés) avant les mesures, comme dans l'explorateur après le premier filtrage.
+Lancer depuis la racine : python tests/bench_parallele.py
+"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Calcul_parallele import Calcul_parallele
+from Traitement_image import Kmean, Moyenne_couleur, Traitement_image, table_classes, table_palette
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+COTE = 4096
+
+
+def etapes(img, segmentee):
+    """Chaque étape renvoie une fonction parallele -> résultat à comparer."""
+    def masques(parallele):
+        helper = Traitement_image(segmentee, parallele=parallele)
+        helper.tracer_trait_de_cote()
+        return helper.classes
+    return {
+        "Kmean palette": lambda parallele: Kmean(img, methode="palette", parallele=parallele).img_array,
+        "Kmean histogramme": lambda parallele: Kmean(img, methode="histogramme", parallele=parallele).img_array,
+        "zones + trait de côte": masques,
+        "Moyenne_couleur": lambda parallele: Moyenne_couleur(img, parallele=parallele).img_array,
+    }
+
+
+def chronometrer(f, *args):
+    debut = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        resultat = f(*args)
+    return resultat, time.perf_counter() - debut
+
+
+if __name__ == "__main__":
+    carte = np.array(Image.open(FICHIER).convert("RGB"))
+    img = np.ascontiguousarray(np.tile(carte, (-(-COTE // carte.shape[0]), -(-COTE // carte.shape[1]), 1))[:COTE, :COTE])
+    table_classes()
+    table_palette(5, 4)
+    segmentee, _ = chronometrer(lambda: Kmean(img, methode="palette").img_array)
+    nombres = [1]
+    while nombres[-1] * 2 <= (os.cpu_count() or 1):
+        nombres.append(nombres[-1] * 2)
+    print(f"{COTE}x{COTE} pixels, {os.cpu_count()} cœur(s)")
+    print(f"{'étape':<22} {'séquentiel (s)':>15}" + "".join(f" {f'{n} proc. (s)':>13}" for n in nombres))
+    pools = {n: Calcul_parallele(processus=n) for n in nombres}
+    for pool in pools.values():
+        pool.executeur().submit(int).result()  # processus créés hors mesure
+    for nom, etape in etapes(img, segmentee).items():
+        reference, duree = chronometrer(etape, None)
+        ligne = f"{nom:<22} {duree:>15.2f}"
+        for n, pool in pools.items():
+            resultat, duree = chronometrer(etape, pool)
+            ligne += f" {duree:>13.2f}" + ("" if (resultat == reference).all() else " (différent !)")
+        print(ligne)
+    for pool in pools.values():
+        pool.fermer()
+    for fichier in ("Kmean.png", "Moyenne_couleur.png"):
+        if os.path.exists(fichier):
+            os.remove(fichier)
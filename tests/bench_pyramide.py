@@ -0,0 +1,43 @@
+"""
+Volume téléchargé par une mission multi-zoom (Programme_final_20_mai) avec et sans
+la pyramide de tuiles locale, contre le serveur de tuiles local.
+Lancer depuis la racine : python tests/bench_pyramide.py
+"""
+import contextlib
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Programme_final_20_mai"))
+from Main import Mission
+from serveur_tuiles import ServeurTuiles
+
+ZONE = (47.7, 48.8, -5.1, -3.2)  # Finistère : lat_min, lat_max, lon_min, lon_max
+ZOOMS = [10, 11, 12]
+
+
+def mission(serveur, dossier_pyramide):
+    m = Mission("bench", len(ZOOMS), *ZONE, ZOOMS, dossier_pyramide=dossier_pyramide)
+    for drone in m.liste_drones:
+        drone.url_tuiles = serveur.url_tuiles
+    avant = serveur.nb_requetes
+    debut = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        m.lancer_reconnaissance()
+    return serveur.nb_requetes - avant, time.perf_counter() - debut
+
+
+if __name__ == "__main__":
+    dossier = tempfile.mkdtemp()
+    with ServeurTuiles(latence=0.01) as serveur:
+        sans, duree_sans = mission(serveur, None)
+        avec, duree_avec = mission(serveur, os.path.join(dossier, "pyramide"))
+        relance, duree_relance = mission(serveur, os.path.join(dossier, "pyramide"))
+    shutil.rmtree(dossier)
+    print(f"zooms {ZOOMS}")
+    print(f"sans pyramide        : {sans:5d} tuiles téléchargées ({duree_sans:.2f} s)")
+    print(f"avec pyramide        : {avec:5d} tuiles téléchargées ({duree_avec:.2f} s)")
+    print(f"pyramide déjà remplie: {relance:5d} tuiles téléchargées ({duree_relance:.2f} s)")
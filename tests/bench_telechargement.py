@@ -0,0 +1,36 @@
+"""
+Benchmark du téléchargement concurrent de Drone.create_image_from_tiles
+(Programme_final_20_mai) contre un serveur de tuiles local avec latence.
+Lancer depuis la racine : python tests/bench_telechargement.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "Programme_final_20_mai"))
+from Drone import Drone
+from serveur_tuiles import ServeurTuiles
+
+LATENCE = 0.02                                               # 20 ms par tuile
+TUILES = [(x, y, 12) for x in range(1990, 2002) for y in range(1400, 1410)]  # 120 tuiles
+
+
+def mesurer(serveur, nb_workers):
+    drone = Drone(nb_workers=nb_workers)
+    drone.url_tuiles = serveur.url_tuiles
+    debut = time.perf_counter()
+    image = drone.create_image_from_tiles(TUILES)
+    return time.perf_counter() - debut, np.array(image)
+
+
+if __name__ == "__main__":
+    with ServeurTuiles(latence=LATENCE) as serveur:
+        _, reference = mesurer(serveur, 1)
+        print(f"{len(TUILES)} tuiles, latence {LATENCE * 1000:.0f} ms")
+        print(f"{'workers':>8} {'durée (s)':>10} {'tuiles/s':>10}  identique")
+        for nb_workers in (1, 2, 4, 8, 16, 32):
+            duree, image = mesurer(serveur, nb_workers)
+            identique = np.array_equal(image, reference)
+            print(f"{nb_workers:>8} {duree:>10.3f} {len(TUILES) / duree:>10.1f}  {identique}")
@@ -0,0 +1,55 @@
+"""
+Benchmark de tracer_trait_de_cote sur des masques côtiers parsemés de petites zones
+d'eau (étangs, morceaux de rivière) : une zone de mer reliée au bord gauche plus
+du bruit aquatique. Ancienne méthode (un masque labels == i par zone, Sobel en
+float64) contre extraire_mer + contour. L'ancienne méthode n'est mesurée que sur
+les petites tailles, elle prend plusieurs minutes au-delà.
+Lancer depuis la racine : python tests/bench_trait_de_cote.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from scipy import ndimage
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Traitement_image
+
+
+def ancienne_methode(aquatique):
+    labels, nb = ndimage.label(aquatique)
+    mer = np.zeros_like(aquatique)
+    for i in range(1, nb + 1):
+        comp_mask = (labels == i)
+        if comp_mask[0, :].any() or comp_mask[-1, :].any() or comp_mask[:, 0].any() or comp_mask[:, -1].any():
+            mer |= comp_mask
+    grad = np.hypot(ndimage.sobel(mer.astype(float), axis=1), ndimage.sobel(mer.astype(float), axis=0))
+    return mer, grad > 1
+
+
+def masque_cotier(cote, rng):
+    """Mer sur le tiers gauche et étangs aléatoires sur la terre."""
+    aquatique = ndimage.binary_opening(rng.random((cote, cote)) < 0.45)
+    aquatique[:, : cote // 3] = True
+    return aquatique
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    print(f"{'côté':>6} {'zones':>8} {'ancienne (s)':>13} {'nouvelle (s)':>13} {'identique':>10}")
+    for cote in (256, 512, 1024, 2048, 4096, 8192):
+        aquatique = masque_cotier(cote, rng)
+        nb = ndimage.label(aquatique)[1]
+        debut = time.perf_counter()
+        mer = Traitement_image.extraire_mer(aquatique)
+        trait = Traitement_image.contour(mer)
+        duree = time.perf_counter() - debut
+        if cote <= 1024:
+            debut = time.perf_counter()
+            mer_ref, trait_ref = ancienne_methode(aquatique)
+            duree_ref = f"{time.perf_counter() - debut:.3f}"
+            identique = str(bool((mer == mer_ref).all() and (trait == trait_ref).all()))
+        else:
+            duree_ref, identique = "-", "-"
+        print(f"{cote:>6} {nb:>8} {duree_ref:>13} {duree:>13.3f} {identique:>10}")
@@ -0,0 +1,80 @@
+"""
+Benchmark de Moyenne_couleur. Construction de l'arbre : variance relue sur les pixels
+de chaque nœud (variance_tile, méthode d'origine, arbre imbriqué récursif) contre
+images intégrales et arbre en tableaux par niveaux (construire_arbre). Reconstruction :
+remplissage récursif de l'arbre imbriqué contre peinture vectorisée (reconstruction).
+Images de 1024, 4096 et 16384 pixels de large découpées/répétées dans tests/finistere.PNG,
+sur 1024 lignes : l'ancienne méthode et la table intégrale (48 octets par pixel)
+deviennent trop lourdes au-delà pour la machine de test.
+Lancer depuis la racine : python tests/bench_variance.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+from Traitement_image import Moyenne_couleur
+
+FICHIER = os.path.join(os.path.dirname(__file__), "finistere.PNG")
+HAUTEUR = 1024
+
+
+class Arbre(Moyenne_couleur):
+    """Moyenne_couleur sans chargement d'image : arbre et reconstruction appelés à la main."""
+    def __init__(self, seuil_variance=50):
+        self.seuil_variance = seuil_variance
+        self._arbre = None
+
+    def recurrence_directe(self, tile):
+        """Méthode d'origine : variance recalculée sur tous les pixels de chaque nœud."""
+        h, l, _ = tile.shape
+        if h <= 1 or l <= 1 or (self.variance_tile(tile) < self.seuil_variance).all():
+            return self.quelle_couleur(tile.reshape(-1, 3).mean(0))
+        h0, l0 = h // 2, l // 2
+        return [
+            self.recurrence_directe(tile[0:h0, 0:l0]),
+            self.recurrence_directe(tile[0:h0, l0:l]),
+            self.recurrence_directe(tile[h0:h, 0:l0]),
+            self.recurrence_directe(tile[h0:h, l0:l]),
+        ]
+
+    def reconstruction_recursive(self, arbre, hauteur, largeur):
+        """Méthode d'origine : remplissage récursif à partir de l'arbre imbriqué."""
+        final = np.zeros((hauteur, largeur, 3), dtype=np.uint8)
+        def _fill(arbre, y0, x0, h, l):
+            if isinstance(arbre, tuple):
+                final[y0:y0+h, x0:x0+l] = arbre
+                return
+            h0, l0 = h // 2, l // 2
+            _fill(arbre[0], y0, x0, h0, l0)
+            _fill(arbre[1], y0, x0 + l0, h0, l - l0)
+            _fill(arbre[2], y0 + h0, x0, h - h0, l0)
+            _fill(arbre[3], y0 + h0, x0 + l0, h - h0, l - l0)
+        _fill(arbre, 0, 0, hauteur, largeur)
+        return final
+
+
+def chronometrer(f, *args):
+    debut = time.perf_counter()
+    resultat = f(*args)
+    return resultat, time.perf_counter() - debut
+
+
+if __name__ == "__main__":
+    carte = np.array(Image.open(FICHIER).convert("RGB"))[:HAUTEUR]
+    arbre = Arbre()
+    print(f"{'largeur':>8} {'direct (s)':>11} {'tableaux (s)':>13} {'identique':>10}"
+          f" {'remplissage (s)':>16} {'peinture (s)':>13}")
+    for largeur in (1024, 4096, 16384):
+        img = np.ascontiguousarray(np.tile(carte, (1, -(-largeur // carte.shape[1]), 1))[:, :largeur])
+        reference, duree_directe = chronometrer(arbre.recurrence_directe, img)
+        arbre.quadtree, duree = chronometrer(arbre.construire_arbre, img)
+        identique = arbre.quadtree.vers_imbrique() == reference
+        ancienne, duree_remplissage = chronometrer(arbre.reconstruction_recursive, reference, HAUTEUR, largeur)
+        nouvelle, duree_peinture = chronometrer(arbre.reconstruction)
+        identique = identique and (ancienne == nouvelle).all()
+        print(f"{largeur:>8} {duree_directe:>11.2f} {duree:>13.2f} {str(identique):>10}"
+              f" {duree_remplissage:>16.2f} {duree_peinture:>13.2f}")
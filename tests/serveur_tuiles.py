@@ -0,0 +1,116 @@
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+from PIL import Image
+
+
+class ServeurTuiles:
+    """
+    Faux serveur de tuiles local utilisé par les tests et les benchmarks.
+    Sert des PNG 256×256 déterministes sur /{zoom}/{x}/{y}.png, avec une latence
+    artificielle et des erreurs 5xx injectables.
+    """
+    def __init__(self, latence: float = 0.0, nb_erreurs: int = 0, taux_erreur: float = 0.0, graine: int = 0):
+        """
+        - latence : attente (s) avant chaque réponse
+        - nb_erreurs : nombre de réponses 503 renvoyées en premier pour chaque tuile
+        - taux_erreur : probabilité d'une réponse 503 pour les requêtes suivantes
+        """
+        self.latence = latence
+        self.nb_erreurs = nb_erreurs
+        self.taux_erreur = taux_erreur
+        self.nb_requetes = 0
+        self.nb_reponses_erreur = 0
+        self._essais = {}
+        self._png = {}
+        self._hasard = random.Random(graine)
+        self._verrou = threading.Lock()
+        self._serveur = None
+        self._thread = None
+
+    @staticmethod
+    def couleur(zoom, x, y):
+        """Couleur unie (déterministe) de la tuile (zoom, x, y)."""
+        return ((x * 37 + zoom) % 256, (y * 53 + zoom) % 256, (x * y + 101) % 256)
+
+    def png(self, zoom, x, y):
+        """Contenu PNG de la tuile, mis en mémoire après la première génération."""
+        cle = (zoom, x, y)
+        if cle not in self._png:
+            img = Image.new("RGB", (256, 256), self.couleur(zoom, x, y))
+            # Un carré plus clair pour que la tuile ne soit pas uniforme
+            img.paste((255, 255, 255), (x % 200, y % 200, x % 200 + 40, y % 200 + 40))
+            buf = BytesIO()
+            img.save(buf, format="PNG")
+            self._png[cle] = buf.getvalue()
+        return self._png[cle]
+
+    def _repondre(self, chemin):
+        """Renvoie (code HTTP, corps) pour le chemin demandé."""
+        try:
+            zoom, x, y = chemin.strip("/").removesuffix(".png").split("/")[-3:]
+            zoom, x, y = int(zoom), int(x), int(y)
+        except ValueError:
+            return 404, b""
+        with self._verrou:
+            self.nb_requetes += 1
+            essai = self._essais.get((zoom, x, y), 0)
+            self._essais[(zoom, x, y)] = essai + 1
+            erreur = essai < self.nb_erreurs or self._hasard.random() < self.taux_erreur
+            if erreur:
+                self.nb_reponses_erreur += 1
+            else:
+                corps = self.png(zoom, x, y)
+        if erreur:
+            return 503, b""
+        return 200, corps
+
+    @property
+    def url_tuiles(self):
+        """Gabarit d'URL à donner à Drone.url_tuiles."""
+        hote, port = self._serveur.server_address[:2]
+        return f"http://{hote}:{port}/{{zoom}}/{{x}}/{{y}}.png"
+
+    def demarrer(self):
+        serveur_tuiles = self
+
+        class Gestionnaire(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # sinon l'ACK retardé coûte 40 ms par réponse en keep-alive
+
+            def do_GET(self):
+                if serveur_tuiles.latence:
+                    time.sleep(serveur_tuiles.latence)
+                code, corps = serveur_tuiles._repondre(self.path)
+                self.send_response(code)
+                self.send_header("Content-Type", "image/png")
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        class Serveur(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 256  # évite les SYN perdus quand beaucoup de clients se connectent
+
+        self._serveur = Serveur(("127.0.0.1", 0), Gestionnaire)
+        self._thread = threading.Thread(target=self._serveur.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def arreter(self):
+        if self._serveur is not None:
+            self._serveur.shutdown()
+            self._serveur.server_close()
+            self._serveur = None
+
+    def __enter__(self):
+        return self.demarrer()
+
+    def __exit__(self, *exc):
+        self.arreter()